@@ -1,26 +1,274 @@
-import numpy as np
 from typing import Dict, List, Optional
 import asyncio
 from datetime import datetime, timedelta
 import logging
+import os
+from scheduler import DeviceScheduler, DeviceState
+from pattern_engine import PatternEngine
+from optimizer import SetpointOptimizer
+from rul_model import RULModel, RUL_WINDOW
+from analysis_graph import AnalysisGraph
 
 logger = logging.getLogger(__name__)
 
+# Análises encaminhadas ao worker dono podem levar mais que uma requisição comum
+ANALYSIS_TIMEOUT = float(os.getenv("NEXUS_ANALYSIS_TIMEOUT", "30"))
+
 class AIEngine:
     def __init__(self):
-        self.prediction_models = {}
-        self.pattern_database = {}
-        self.optimization_rules = {}
+        self.rul_model = RULModel()
+        self.prediction_models = {"rul": self.rul_model}
+        self.pattern_engine = PatternEngine()
+        self.pattern_database = self.pattern_engine.library
+        self.optimizer = SetpointOptimizer()
+        self.optimization_rules = self.optimizer.rules
         self.health_scores = {}
+        # Handler síncrono: cada shard roda na sua thread
+        self.scheduler = DeviceScheduler(self._process_device_reading, use_threads=True)
+        self.analysis_graph = self._build_analysis_graph()
+        self.cluster = None
         
     async def initialize(self):
         """Inicializar modelos de IA"""
         # Carregar modelos pré-treinados
         await self.load_predictive_models()
+        await self.scheduler.start()
         logger.info("✅ Motor de IA inicializado")
     
+    def attach_cluster(self, cluster):
+        """Encaminhar análises ao worker dono do dispositivo (só ele tem o histórico no scheduler)"""
+        self.cluster = cluster
+        cluster.serve("ai.analyze", self._serve_analysis)
+    
+    async def _serve_analysis(self, message: Dict) -> Dict:
+        """Executar aqui uma análise encaminhada; _routed impede novo encaminhamento"""
+        data = {**message["data"], "_routed": True}
+        kind = message["kind"]
+        if kind == "comprehensive":
+            result = await self.comprehensive_analysis(data, degraded=message.get("degraded", False))
+        else:
+            analyses = {"patterns": self.detect_patterns, "failure": self.predict_failure,
+                        "optimization": self.optimize_parameters}
+            result = await analyses[kind](data)
+        return {"result": result}
+    
+    async def _route(self, kind: str, data: Dict, degraded: bool = False) -> Optional[Dict]:
+        """Resultado calculado pelo dono do dispositivo, ou None se a análise é local"""
+        device_id = data.get("device_id")
+        if self.cluster is None or data.get("_routed") or device_id is None or self.cluster.owns(device_id):
+            return None
+        reply = await self.cluster.request(self.cluster.owner(device_id), "ai.analyze",
+                                           {"kind": kind, "data": data, "degraded": degraded},
+                                           timeout=ANALYSIS_TIMEOUT)
+        return reply["result"]
+    
+    async def _route_fleet(self, kind: str, data: Dict) -> Optional[Dict[str, Dict]]:
+        """Análise em lote no cluster: cada worker analisa os seus dispositivos
+
+        Com device_ids, cada dono recebe só os seus; sem (modo frota), todos os
+        membros analisam todos os dispositivos que possuem. None se a análise é local.
+        """
+        if self.cluster is None or data.get("_routed"):
+            return None
+        if data.get("device_ids"):
+            groups: Dict[str, List[str]] = {}
+            for device_id in data["device_ids"]:
+                groups.setdefault(self.cluster.owner(device_id), []).append(device_id)
+            requests = {worker: {**data, "device_ids": ids} for worker, ids in groups.items()}
+        else:
+            requests = {worker: data for worker in self.cluster.members}
+        
+        async def run(worker: str, payload: Dict) -> Dict:
+            message = {"kind": kind, "data": payload}
+            if worker == self.cluster.worker_id:
+                return (await self._serve_analysis(message))["result"]
+            return (await self.cluster.request(worker, "ai.analyze", message, timeout=ANALYSIS_TIMEOUT))["result"]
+        
+        merged: Dict[str, Dict] = {}
+        for result in await asyncio.gather(*(run(w, p) for w, p in requests.items())):
+            merged.update(result["devices"])
+        return merged
+    
+    def close(self):
+        """Encerrar os pools de processos (chamado no shutdown da aplicação)"""
+        self.pattern_engine.close()
+        self.optimizer.close()
+    
+    async def load_predictive_models(self):
+        """Carregar o modelo RUL salvo ou treinar com o histórico do banco"""
+        if self.rul_model.load():
+            logger.info("✅ Modelo RUL carregado")
+            return
+        try:
+            await self.rul_model.train_from_db()
+            self.rul_model.save()
+        except Exception as e:
+            logger.warning(f"Modelo RUL não treinado, usando regra a priori: {e}")
+    
+    async def process_reading(self, telemetry: Dict) -> Dict:
+        """Processar leitura em ordem no shard dono do dispositivo"""
+        return await self.scheduler.submit(telemetry["device_id"], telemetry)
+    
+    def _process_device_reading(self, state: DeviceState, telemetry: Dict) -> Dict:
+        """Análises com estado por dispositivo (executado apenas pelo shard dono, na thread do shard)"""
+        state.history.append(telemetry)
+        self.rul_model.invalidate(state.device_id)
+        state.health_score = self._health_score(telemetry)
+        self.health_scores[state.device_id] = state.health_score
+        return {
+            "device_id": state.device_id,
+            "health_score": state.health_score,
+            "readings": state.readings + 1
+        }
+    
+    def get_device_history(self, device_id: str) -> List[Dict]:
+        """Histórico recente de leituras do dispositivo (vazio sem device_id)
+
+        Só o scheduler do worker dono tem o histórico: as análises públicas
+        são encaminhadas ao dono antes de chegar aqui.
+        """
+        if device_id is None:
+            return []
+        state = self.scheduler.get_state(device_id)
+        return list(state.history) if state else []
+    
+    async def detect_patterns(self, data: Dict) -> Dict:
+        """Motifs, discords, periodicidade e assinaturas de falha no histórico do dispositivo
+
+        Com "device_ids" (ou "fleet": true) analisa vários dispositivos em lote.
+        """
+        if data.get("fleet") or data.get("device_ids"):
+            results = await self._route_fleet("patterns", data)
+            if results is None:
+                device_ids = data.get("device_ids") or [state.device_id for state in self.scheduler.iter_states()]
+                histories = {d: self.get_device_history(d) for d in device_ids}
+                results = await self.pattern_engine.analyze_fleet(histories)
+            return {"devices": results, "analyzed": len(results)}
+        
+        routed = await self._route("patterns", data)
+        if routed is not None:
+            return routed
+        device_id = data.get("device_id")
+        history = self.get_device_history(device_id) or [data]
+        result = await asyncio.to_thread(self.pattern_engine.analyze, history)
+        result["device_id"] = device_id
+        return result
+    
+    async def optimize_parameters(self, data: Dict) -> Dict:
+        """Sugerir setpoints (rpm, pressão, temperatura) para um dispositivo ou linha
+
+        Com "device_ids" otimiza a linha inteira; "device_types" opcional
+        mapeia cada dispositivo ao seu tipo (warm start compartilhado por tipo).
+        """
+        device_types = data.get("device_types") or {}
+        default_type = data.get("device_type", "default")
+        if data.get("device_ids"):
+            results = await self._route_fleet("optimization", data)
+            if results is not None:
+                return {"devices": results, "optimized": len(results)}
+            devices = {
+                d: (device_types.get(d, default_type), self.get_device_history(d))
+                for d in data["device_ids"]
+            }
+            for device_type in set(t for t, _ in devices.values()):
+                if device_type not in self.optimizer.type_models:
+                    self.optimizer.fit_type(device_type, [h for t, h in devices.values() if t == device_type])
+            results = await self.optimizer.optimize_line(devices)
+            self.optimization_rules = self.optimizer.rules
+            return {"devices": results, "optimized": len(results)}
+        
+        routed = await self._route("optimization", data)
+        if routed is not None:
+            return routed
+        device_id = data.get("device_id")
+        history = self.get_device_history(device_id) or [data]
+        result = await self.optimizer.optimize(device_id, default_type, history)
+        self.optimization_rules = self.optimizer.rules
+        return result
+    
+    def _build_analysis_graph(self) -> AnalysisGraph:
+        """Sub-análises da análise completa, com janelas de entrada e dependências"""
+        graph = AnalysisGraph()
+        
+        async def health(device_id, rows, deps):
+            return {"health_score": await self.calculate_health_score(rows[-1])}
+        
+        async def failure(device_id, rows, deps):
+            return self._failure_report(self.rul_model.predict(device_id, rows))
+        
+        async def patterns(device_id, rows, deps):
+            return await asyncio.to_thread(self.pattern_engine.analyze, rows)
+        
+        async def optimization(device_id, rows, deps):
+            return await self.optimizer.optimize(device_id, "default", rows)
+        
+        async def summary(device_id, rows, deps):
+            return self._summarize(deps)
+        
+        # A versão do modelo entra na chave: retreinar invalida os resultados memoizados
+        graph.add("health", health, window=1)
+        graph.add("failure", failure, window=RUL_WINDOW, version=lambda: self.rul_model.version)
+        graph.add("patterns", patterns, version=lambda: self.pattern_engine.library.version)
+        graph.add("optimization", optimization, version=lambda: self.optimizer.version)
+        graph.add("summary", summary, depends=["health", "failure", "patterns", "optimization"])
+        return graph
+    
+    def _summarize(self, results: Dict) -> Dict:
+        health_score = results["health"].get("health_score", 0)
+        failure = results["failure"]
+        matches = results["patterns"].get("signature_matches", [])
+        if failure.get("prediction") == "failure" or health_score < 40:
+            status = "critical"
+        elif failure.get("prediction") == "warning" or health_score < 70 or matches:
+            status = "warning"
+        else:
+            status = "normal"
+        recommendations = [failure["recommended_action"]] if "recommended_action" in failure else []
+        recommendations += [f"Padrão de falha detectado: {m['description']}" for m in matches[:3]]
+        if results["optimization"].get("recommended"):
+            recommendations.append(f"Ajustar setpoints para {results['optimization']['recommended']}")
+        return {"status": status, "recommendations": recommendations}
+    
+    async def comprehensive_analysis(self, data: Dict, degraded: bool = False) -> Dict:
+        """Análise completa (saúde, falha, padrões e otimização) com recomputação incremental
+        
+        Cada sub-análise é memoizada pelo hash da sua janela de entrada: sem
+        telemetria nova, chamadas repetidas reutilizam os resultados. Com
+        degraded (sobrecarga), só saúde e previsão de falha são calculadas.
+        Dispositivos de outro worker são analisados pelo dono.
+        """
+        routed = await self._route("comprehensive", data, degraded)
+        if routed is not None:
+            return routed
+        device_id = data.get("device_id")
+        history = self.get_device_history(device_id) or [data]
+        if degraded:
+            health = {"health_score": self._health_score(history[-1])}
+            failure = self._failure_report(self.rul_model.predict(device_id, history))
+            return {
+                "device_id": device_id,
+                "timestamp": datetime.utcnow().isoformat(),
+                **self._summarize({"health": health, "failure": failure, "patterns": {}, "optimization": {}}),
+                "health": health,
+                "failure_prediction": failure,
+                "degraded": True
+            }
+        results = await self.analysis_graph.run(device_id, history)
+        return {
+            "device_id": device_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            **results["summary"],
+            "health": results["health"],
+            "failure_prediction": results["failure"],
+            "patterns": results["patterns"],
+            "optimization": results["optimization"]
+        }
+    
     async def calculate_health_score(self, telemetry: Dict) -> float:
         """Calcular score de saúde do equipamento (0-100)"""
+        return self._health_score(telemetry)
+    
+    def _health_score(self, telemetry: Dict) -> float:
         score = 100.0
         
         # Fatores de penalização
@@ -40,33 +288,34 @@ class AIEngine:
         return max(0, min(100, round(score, 1)))
     
     async def predict_failure(self, telemetry: Dict) -> Dict:
-        """Prever falha do equipamento"""
-        # Simulação de análise preditiva
-        hours_to_failure = self.simulate_remaining_life(telemetry)
+        """Prever falha do equipamento (vida útil restante); "device_ids" prevê em lote"""
+        if telemetry.get("device_ids"):
+            results = await self._route_fleet("failure", telemetry)
+            if results is not None:
+                return {"devices": results}
+            histories = {d: self.get_device_history(d) for d in telemetry["device_ids"]}
+            predictions = self.rul_model.predict_fleet(histories)
+            return {"devices": {d: self._failure_report(p) for d, p in predictions.items()}}
         
+        routed = await self._route("failure", telemetry)
+        if routed is not None:
+            return routed
+        device_id = telemetry.get("device_id")
+        history = self.get_device_history(device_id) or [telemetry]
+        return self._failure_report(self.rul_model.predict(device_id, history))
+    
+    def _failure_report(self, prediction: Dict) -> Dict:
+        hours_to_failure = prediction["hours_to_failure"]
         return {
             "prediction": "failure" if hours_to_failure < 24 else "warning" if hours_to_failure < 72 else "normal",
             "hours_to_failure": hours_to_failure,
-            "confidence": 0.89,
+            "interval_hours": prediction["interval_hours"],
+            "confidence": prediction["confidence"],
+            "model": prediction["model"],
             "recommended_action": self.get_recommendation(hours_to_failure),
             "maintenance_window": self.calculate_maintenance_window(hours_to_failure)
         }
     
-    def simulate_remaining_life(self, telemetry: Dict) -> float:
-        """Simular tempo restante até falha"""
-        base_life = 720  # 30 dias em horas
-        
-        # Reduzir vida baseado nas condições
-        temp_factor = max(1, telemetry.get('temperature', 70) / 70)
-        vib_factor = max(1, telemetry.get('vibration', 0.02) / 0.02)
-        
-        remaining = base_life / (temp_factor * vib_factor)
-        
-        # Adicionar aleatoriedade
-        remaining *= np.random.uniform(0.8, 1.2)
-        
-        return round(remaining, 1)
-    
     def get_recommendation(self, hours_to_failure: float) -> str:
         if hours_to_failure < 24:
             return "IMMEDIATE SHUTDOWN - Schedule emergency maintenance"
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ALERT_LOG_PATH = os.getenv("NEXUS_ALERT_LOG", "logs/alerts.jsonl")
+ALERT_BUFFER_SIZE = int(os.getenv("NEXUS_ALERT_BUFFER", "10000"))
+
+
+class Subscription:
+    """Fila de entrega de um cliente; clientes lentos perdem os alertas mais antigos"""
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, alert: Dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(alert)
+
+    async def get(self) -> Dict:
+        return await self.queue.get()
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+
+class AlertBus:
+    """Barramento de alertas push-based
+
+    Cada alerta é publicado uma vez, deduplicado e limitado por origem, e
+    entregue imediatamente às filas dos assinantes. O histórico fica em um
+    ring buffer limitado e é persistido em JSONL em lotes.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = ALERT_BUFFER_SIZE,
+        persist_path: Optional[str] = ALERT_LOG_PATH,
+        dedup_window: float = 60.0,
+        rate_per_minute: float = 30.0,
+        burst: float = 10.0,
+        queue_size: int = 256,
+        max_log_bytes: int = 50 * 1024 * 1024,
+    ):
+        self.buffer = deque(maxlen=buffer_size)
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.dedup_window = dedup_window
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.queue_size = queue_size
+        self.max_log_bytes = max_log_bytes
+        self.subscribers: List[Subscription] = []
+        self._recent: Dict[str, tuple] = {}       # chave de dedup -> (alerta, instante)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._pending: List[Dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"published": 0, "delivered": 0, "deduplicated": 0, "rate_limited": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+
+    async def start(self, flush_interval: float = 1.0):
+        if self.running:
+            return
+        if self.persist_path:
+            self.buffer.extend(await asyncio.to_thread(self._read_tail))
+        self._flush_task = asyncio.create_task(self._flush_loop(flush_interval))
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self.subscribers:
+            self.subscribers.remove(subscription)
+
+    @staticmethod
+    def source_of(event: Dict) -> str:
+        details = event.get("details") or {}
+        return str(details.get("source_ip") or details.get("device_id") or details.get("username") or "system")
+
+    def _allow(self, source: str, now: float) -> bool:
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            bucket = self._buckets[source] = TokenBucket(self.burst)
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def _evict_expired(self, now: float):
+        if len(self._recent) < 4096:
+            return
+        cutoff = now - self.dedup_window
+        self._recent = {k: v for k, v in self._recent.items() if v[1] >= cutoff}
+        self._buckets = {
+            k: b for k, b in self._buckets.items()
+            if now - b.updated < self.burst / max(self.rate, 1e-9)
+        }
+
+    def publish(self, event: Dict) -> Optional[Dict]:
+        """Publicar evento; retorna o alerta entregue ou None se suprimido"""
+        now = time.monotonic()
+        self._evict_expired(now)
+        source = self.source_of(event)
+        key = f"{source}|{event.get('event_type')}|{event.get('severity')}"
+
+        recent = self._recent.get(key)
+        if recent is not None and now - recent[1] < self.dedup_window:
+            recent[0]["duplicates"] += 1
+            self.stats["deduplicated"] += 1
+            return None
+        if not self._allow(source, now):
+            self.stats["rate_limited"] += 1
+            return None
+
+        alert = {
+            "id": event.get("id"),
+            "type": "security",
+            "event_type": event.get("event_type"),
+            "severity": event.get("severity"),
+            "source": source,
+            "timestamp": _isoformat(event.get("timestamp")),
+            "details": event.get("details"),
+            "duplicates": 0,
+        }
+        self._recent[key] = (alert, now)
+        self.stats["published"] += 1
+        self.deliver(alert)
+        return alert
+
+    def deliver(self, alert: Dict, persist: bool = True):
+        """Armazenar e entregar alerta já aprovado
+
+        Alertas de outros workers chegam com persist=False: só o worker de
+        origem grava no JSONL, senão cada alerta apareceria uma vez por worker.
+        """
+        self.buffer.append(alert)
+        if persist and self.persist_path:
+            self._pending.append(alert)
+        for subscription in self.subscribers:
+            subscription.offer(alert)
+        self.stats["delivered"] += len(self.subscribers)
+
+    def recent(self, limit: int = 100) -> List[Dict]:
+        return list(self.buffer)[-limit:]
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Erro ao persistir alertas: {e}")
+
+    async def flush(self):
+        if not self._pending or not self.persist_path:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.to_thread(self._write_batch, batch)
+
+    def _write_batch(self, batch: List[Dict]):
+        self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.persist_path.exists() and self.persist_path.stat().st_size > self.max_log_bytes:
+            self.persist_path.replace(self.persist_path.with_suffix(self.persist_path.suffix + ".1"))
+        with open(self.persist_path, "a") as f:
+            f.write("".join(json.dumps(alert, default=str) + "\n" for alert in batch))
+
+    def _read_tail(self) -> List[Dict]:
+        if not self.persist_path.exists():
+            return []
+        alerts = deque(maxlen=self.buffer.maxlen)
+        with open(self.persist_path) as f:
+            for line in f:
+                try:
+                    alerts.append(json.loads(line))
+                except ValueError:
+                    continue
+        return list(alerts)
+
+
+def _isoformat(value) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
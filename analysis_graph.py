@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASH_FIELDS = ["temperature", "vibration", "rpm", "pressure", "power_consumption"]
+
+
+def window_digest(rows: List[Dict], fields: List[str] = HASH_FIELDS) -> bytes:
+    """Hash do conteúdo de uma janela de leituras (valores numéricos + limites de tempo)"""
+    h = hashlib.blake2b(digest_size=16)
+    if rows:
+        values = np.array([[r.get(f) if isinstance(r.get(f), (int, float)) else np.nan for f in fields]
+                           for r in rows], dtype=np.float64)
+        h.update(values.tobytes())
+        h.update(f"{rows[0].get('timestamp')}|{rows[-1].get('timestamp')}|{len(rows)}".encode())
+    return h.digest()
+
+
+class AnalysisNode:
+    """Sub-análise do grafo: declara a janela de entrada e as dependências
+
+    window é o número de leituras mais recentes usadas (None = histórico
+    inteiro). func(device_id, rows, deps) recebe os resultados das
+    dependências já calculados. version (opcional) retorna a versão atual
+    do modelo usado pelo nó: retreinar o modelo muda a chave e invalida
+    os resultados memoizados.
+    """
+    __slots__ = ("name", "func", "window", "depends", "version")
+
+    def __init__(self, name: str, func: Callable[[str, List[Dict], Dict], Awaitable[Dict]],
+                 window: Optional[int] = None, depends: Optional[List[str]] = None,
+                 version: Optional[Callable[[], object]] = None):
+        self.name = name
+        self.func = func
+        self.window = window
+        self.depends = depends or []
+        self.version = version
+
+
+class AnalysisGraph:
+    """Grafo de análises memoizadas por hash do conteúdo das entradas
+
+    A chave de cada nó combina o hash da sua janela, a versão do modelo e as
+    chaves das dependências; nós com chave inalterada retornam o resultado
+    memoizado.
+    Nós do mesmo nível topológico executam concorrentemente.
+    """
+
+    def __init__(self, max_devices: int = 10000):
+        self.nodes: Dict[str, AnalysisNode] = {}
+        self.max_devices = max_devices
+        self._memo: "OrderedDict[str, Dict[str, tuple]]" = OrderedDict()
+        self._levels: Optional[List[List[AnalysisNode]]] = None
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+
+    def add(self, name: str, func, window: Optional[int] = None, depends: Optional[List[str]] = None,
+            version: Optional[Callable[[], object]] = None):
+        for dep in depends or []:
+            if dep not in self.nodes:
+                raise ValueError(f"Dependência desconhecida: {dep}")
+        self.nodes[name] = AnalysisNode(name, func, window, depends, version)
+        self._levels = None
+
+    def levels(self) -> List[List[AnalysisNode]]:
+        """Agrupar nós por nível topológico (dependências sempre em níveis anteriores)"""
+        if self._levels is None:
+            depth: Dict[str, int] = {}
+            for node in self.nodes.values():  # Ordem de inserção já é topológica
+                depth[node.name] = 1 + max((depth[d] for d in node.depends), default=-1)
+            levels: List[List[AnalysisNode]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+            for node in self.nodes.values():
+                levels[depth[node.name]].append(node)
+            self._levels = levels
+        return self._levels
+
+    def invalidate(self, device_id: str):
+        self._memo.pop(device_id, None)
+
+    async def run(self, device_id: str, history: List[Dict]) -> Dict[str, Dict]:
+        """Executar o grafo para um dispositivo, recalculando apenas nós desatualizados"""
+        memo = self._memo.pop(device_id, None) or {}
+        self._memo[device_id] = memo
+        if len(self._memo) > self.max_devices:
+            self._memo.popitem(last=False)
+
+        digests: Dict[Optional[int], bytes] = {}
+        keys: Dict[str, bytes] = {}
+        results: Dict[str, Dict] = {}
+
+        async def evaluate(node: AnalysisNode, key: bytes, rows: List[Dict]):
+            try:
+                result = await node.func(device_id, rows, {d: results[d] for d in node.depends})
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Erro na análise {node.name} de {device_id}: {e}")
+                result = {"error": str(e)}
+            else:
+                memo[node.name] = (key, result)
+            results[node.name] = result
+
+        for level in self.levels():
+            pending = []
+            for node in level:
+                rows = history if node.window is None else history[-node.window:]
+                if node.window not in digests:
+                    digests[node.window] = window_digest(rows)
+                h = hashlib.blake2b(node.name.encode(), digest_size=16)
+                h.update(digests[node.window])
+                if node.version is not None:
+                    h.update(repr(node.version()).encode())
+                for dep in node.depends:
+                    h.update(keys.get(dep, b""))
+                key = keys[node.name] = h.digest()
+                cached = memo.get(node.name)
+                if cached is not None and cached[0] == key:
+                    self.stats["hits"] += 1
+                    results[node.name] = cached[1]
+                else:
+                    self.stats["misses"] += 1
+                    pending.append(evaluate(node, key, rows))
+            if pending:
+                await asyncio.gather(*pending)
+        return results
@@ -6,10 +6,19 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 from typing import Dict, List, Tuple
 import joblib
+import json
 import logging
+import os
+from datetime import datetime
+from shared_model import SharedModel, QuantizedAutoencoder, export_shared_model, has_shared_model, shared_model_mtime
+from flat_forest import FlatIsolationForest, isolation_scores
+from cascade import AnomalyCascade, CASCADE_STAGES, CASCADE_Z_MAX, ISOLATION_THRESHOLD, STAGES
 
 logger = logging.getLogger(__name__)
 
+# Inferência quantizada do autoencoder: "", "float16" ou "int8" (requer modelo compartilhado)
+QUANTIZED_INFERENCE = os.getenv("NEXUS_QUANTIZED_INFERENCE", "")
+
 class AnomalyDetector:
     def __init__(self):
         self.model = None
@@ -19,17 +28,143 @@ class AnomalyDetector:
         self.threshold = 0.02
         self.model_path = "models/anomaly_detector.h5"
         self.scaler_path = "models/scaler.pkl"
+        self.cascade_path = "models/cascade.json"
+        self.calibration_path = "models/calibration.npy"  # Recorte de validação do treino (dados brutos)
         self.features = ['temperature', 'vibration', 'rpm', 'pressure', 'power_consumption']
+        self.shared_model_dir = os.getenv("NEXUS_SHARED_MODEL_DIR")
+        self.shared_model = None
+        self.flat_forest = None
+        self.quantized = None
+        self.cascade = AnomalyCascade(self) if CASCADE_STAGES.strip() else None
+        # z_max calibrado no treino (persistido em cascade.json e no manifesto compartilhado)
+        self.cascade_z_max = CASCADE_Z_MAX
+        # Métricas de /api/ai/performance (preenchidas por treino e backtest)
+        self.precision = None
+        self.recall = None
+        self.f1_score = None
+        self.last_trained = None
+        self.training_samples = 0
+        self.last_backtest = None
         
     async def load_model(self):
         """Carregar modelo treinado"""
+        if self.shared_model_dir and self._shared_model_current():
+            self.load_shared_model()
+            await self.load_quantized_model()
+            return
         try:
             self.model = load_model(self.model_path)
             self.scaler = joblib.load(self.scaler_path)
+            if os.path.exists(self.cascade_path):
+                with open(self.cascade_path) as f:
+                    self._set_cascade_z_max(json.load(f)["z_max"])
             logger.info("✅ Modelo de IA carregado com sucesso")
         except Exception as e:
             logger.warning(f"Modelo não encontrado, treinando novo: {e}")
             await self.train_model()
+        
+        if self.shared_model_dir:
+            export_shared_model(self, self.shared_model_dir)
+            self.load_shared_model()
+            await self.load_quantized_model()
+    
+    def _shared_model_current(self) -> bool:
+        """Exportação compartilhada existe e não é mais antiga que o modelo .h5 (retreinado)"""
+        if not has_shared_model(self.shared_model_dir):
+            return False
+        return not os.path.exists(self.model_path) or \
+            os.path.getmtime(self.model_path) <= shared_model_mtime(self.shared_model_dir)
+    
+    def _set_cascade_z_max(self, z_max: float):
+        self.cascade_z_max = z_max
+        if self.cascade is not None:
+            self.cascade.z_max = z_max
+    
+    def load_shared_model(self):
+        """Carregar pesos compartilhados entre workers (mmap, sem cópia por processo)"""
+        self.shared_model = SharedModel.load(self.shared_model_dir)
+        self.threshold = self.shared_model.threshold
+        if self.shared_model.cascade_z_max is not None:
+            self._set_cascade_z_max(self.shared_model.cascade_z_max)
+        isolation_forest = SharedModel.load_isolation_forest(self.shared_model_dir)
+        if isolation_forest is not None:
+            self.isolation_forest = isolation_forest
+        self.flat_forest = SharedModel.load_flat_forest(self.shared_model_dir)
+        logger.info(f"✅ Modelo compartilhado carregado de {self.shared_model_dir}")
+    
+    async def load_quantized_model(self, calibration_samples: int = 5000):
+        """Carregar (ou calibrar e salvar) o autoencoder quantizado configurado"""
+        if not QUANTIZED_INFERENCE or self.shared_model is None:
+            return
+        # O artefato fica na versão exportada do modelo e só vale para ela
+        directory, version = self.shared_model.directory, self.shared_model.version
+        self.quantized = QuantizedAutoencoder.load(directory, QUANTIZED_INFERENCE, version)
+        if self.quantized is None:
+            X_scaled = self._transform(await self._calibration_telemetry(2 * calibration_samples))
+            order = np.random.default_rng(42).permutation(len(X_scaled))
+            calibration, held_out = X_scaled[order[::2]], X_scaled[order[1::2]]
+            self.quantized = self.shared_model.quantize(QUANTIZED_INFERENCE, calibration)
+            report = self.quantized.agreement_rate(self.shared_model, held_out)
+            self.quantized.agreement = report["agreement"]
+            self.quantized.positive_agreement = report["positive_agreement"]
+            logger.info(f"Autoencoder quantizado: {report}")
+            self.quantized.save(directory)
+        self.threshold = self.quantized.threshold
+        logger.info(f"✅ Inferência {QUANTIZED_INFERENCE} ativa (concordância {self.quantized.agreement}, "
+                    f"nas anomalias {self.quantized.positive_agreement})")
+    
+    async def _calibration_telemetry(self, samples: int) -> np.ndarray:
+        """Telemetria real (com leituras anômalas) para calibrar a quantização
+
+        Preferência: histórico recente do banco, com até 1/4 de leituras
+        marcadas como anomalia; senão o recorte de validação do último
+        treino; só em último caso dados simulados.
+        """
+        try:
+            X = await self._telemetry_from_db(samples)
+            if len(X) >= 100:
+                return X
+        except Exception as e:
+            logger.warning(f"Histórico indisponível para calibrar a quantização: {e}")
+        if os.path.exists(self.calibration_path):
+            return np.load(self.calibration_path)
+        logger.warning("Sem telemetria real para calibrar a quantização; usando dados simulados")
+        records = await self.generate_training_data(samples)
+        return np.array([[r[f] for f in self.features] for r in records], dtype=np.float64)
+    
+    async def _telemetry_from_db(self, samples: int) -> np.ndarray:
+        from sqlalchemy import select
+        from database import AsyncSessionLocal, TelemetryDB
+        
+        columns = [getattr(TelemetryDB, f) for f in self.features]
+        recent = select(*columns).order_by(TelemetryDB.timestamp.desc())
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(recent.where(TelemetryDB.anomaly.is_(True)).limit(samples // 4))).all()
+            normal = recent.where(TelemetryDB.anomaly.isnot(True)).limit(samples - len(rows))
+            rows += (await session.execute(normal)).all()
+        # Campos nulos viram 0, como em analyze_batch
+        return np.array([[v or 0 for v in row] for row in rows], dtype=np.float64)
+    
+    def _transform(self, X: np.ndarray) -> np.ndarray:
+        if self.shared_model is not None:
+            return self.shared_model.transform(X)
+        return self.scaler.transform(X)
+    
+    def _reconstruct(self, X_scaled: np.ndarray) -> np.ndarray:
+        if self.quantized is not None:
+            return self.quantized.reconstruct(X_scaled)
+        if self.shared_model is not None:
+            return self.shared_model.reconstruct(X_scaled)
+        X_reshaped = X_scaled.reshape(-1, 1, len(self.features))
+        return self.model.predict(X_reshaped, verbose=0)
+    
+    def _isolation_scores(self, X_scaled: np.ndarray) -> np.ndarray:
+        return isolation_scores(X_scaled, self.flat_forest, self.isolation_forest)
+    
+    def _full_decisions(self, X_scaled: np.ndarray) -> np.ndarray:
+        """Decisão dos modelos completos (autoencoder OU Isolation Forest) para cada linha"""
+        mse = np.mean((X_scaled - self._reconstruct(X_scaled)) ** 2, axis=1)
+        return (mse > self.threshold) | (self._isolation_scores(X_scaled) < ISOLATION_THRESHOLD)
     
     async def train_model(self, training_data: List[Dict] = None):
         """Treinar modelo com dados históricos"""
@@ -43,8 +178,13 @@ class AnomalyDetector:
         # Normalizar
         X_scaled = self.scaler.fit_transform(X)
         
+        # Recorte de validação (últimos 20%, como validation_split) para calibrar a quantização
+        os.makedirs(os.path.dirname(self.calibration_path) or ".", exist_ok=True)
+        np.save(self.calibration_path, np.asarray(X[-max(1, len(X) // 5):][-10000:], dtype=np.float64))
+        
         # Treinar Isolation Forest
         self.isolation_forest.fit(X_scaled)
+        self.flat_forest = FlatIsolationForest.from_sklearn(self.isolation_forest)
         
         # Treinar Autoencoder LSTM
         self.model = Sequential([
@@ -71,40 +211,79 @@ class AnomalyDetector:
             verbose=0
         )
         
+        # Calibrar o estágio barato da cascata contra os modelos completos (mesmo
+        # com a cascata desligada, para que ativá-la depois use o valor calibrado)
+        self._set_cascade_z_max(AnomalyCascade(self, STAGES).calibrate(X_scaled))
+        
         # Salvar modelo
         self.model.save(self.model_path)
         joblib.dump(self.scaler, self.scaler_path)
+        with open(self.cascade_path, "w") as f:
+            json.dump({"z_max": self.cascade_z_max}, f)
+        self.last_trained = datetime.utcnow()
+        self.training_samples = len(training_data)
         
         logger.info("✅ Modelo treinado e salvo")
     
-    async def analyze(self, telemetry: Dict) -> Dict:
-        """Analisar dados para detectar anomalias"""
+    def backtest_config(self) -> Dict:
+        """Configuração de score em uso, no formato de backtest.run_backtest"""
+        return {
+            "threshold": self.threshold,
+            "stages": ",".join(self.cascade.stages) if self.cascade is not None else "",
+            "z_max": self.cascade_z_max,
+            "quantized": QUANTIZED_INFERENCE if self.quantized is not None else "",
+        }
+    
+    def apply_backtest(self, report: Dict):
+        """Atualizar precisão/recall/F1 com um backtest rotulado da configuração em uso"""
+        self.last_backtest = report
+        if report.get("precision") is None:
+            return
+        self.precision = report["precision"]
+        self.recall = report["recall"]
+        self.f1_score = report["f1_score"]
+        self.model_accuracy = report["accuracy"]
+    
+    async def analyze(self, telemetry: Dict, use_isolation_forest: bool = True) -> Dict:
+        """Analisar dados para detectar anomalias
+
+        Com use_isolation_forest=False (modo degradado sob sobrecarga) apenas
+        o autoencoder é avaliado.
+        """
+        if self.cascade is not None:
+            try:
+                return (await self.analyze_batch([telemetry], use_isolation_forest))[0]
+            except Exception as e:
+                logger.error(f"Erro na análise: {e}")
+                return {"is_anomaly": False, "score": 0.0, "error": str(e)}
         try:
             # Extrair features
             X = np.array([[telemetry.get(f, 0) for f in self.features]])
             
             # Normalizar
-            X_scaled = self.scaler.transform(X)
+            X_scaled = self._transform(X)
             
             # Predição do autoencoder
-            X_reshaped = X_scaled.reshape(-1, 1, len(self.features))
-            reconstructed = self.model.predict(X_reshaped, verbose=0)
+            reconstructed = self._reconstruct(X_scaled)
             
             # Calcular erro de reconstrução
             mse = np.mean((X_scaled - reconstructed) ** 2)
             
             # Detecção com Isolation Forest
-            isolation_score = self.isolation_forest.score_samples(X_scaled)
+            isolation_score = None
+            if use_isolation_forest:
+                isolation_score = float(self._isolation_scores(X_scaled)[0])
             
             # Combinar resultados
-            is_anomaly = mse > self.threshold or isolation_score < -0.5
+            is_anomaly = mse > self.threshold or (isolation_score is not None and isolation_score < ISOLATION_THRESHOLD)
             
             return {
                 "is_anomaly": bool(is_anomaly),
                 "score": float(mse),
-                "isolation_score": float(isolation_score[0]),
+                "isolation_score": isolation_score,
                 "confidence": self.model_accuracy,
-                "reconstruction_error": float(mse)
+                "reconstruction_error": float(mse),
+                "degraded": not use_isolation_forest
             }
             
         except Exception as e:
@@ -115,6 +294,60 @@ class AnomalyDetector:
                 "error": str(e)
             }
     
+    async def analyze_batch(self, records: List[Dict], use_isolation_forest: bool = True) -> List[Dict]:
+        """Analisar um lote de leituras com uma única passada de cada modelo"""
+        if not records:
+            return []
+        X = np.array([[r.get(f, 0) or 0 for f in self.features] for r in records], dtype=np.float64)
+        X_scaled = self._transform(X)
+        if self.cascade is not None:
+            return self._cascade_results(X_scaled, use_isolation_forest)
+        reconstructed = self._reconstruct(X_scaled)
+        mse = np.mean((X_scaled - reconstructed) ** 2, axis=1)
+        
+        isolation_scores = None
+        is_anomaly = mse > self.threshold
+        if use_isolation_forest:
+            isolation_scores = self._isolation_scores(X_scaled)
+            is_anomaly |= isolation_scores < ISOLATION_THRESHOLD
+        
+        return [
+            {
+                "is_anomaly": bool(is_anomaly[i]),
+                "score": float(mse[i]),
+                "isolation_score": float(isolation_scores[i]) if isolation_scores is not None else None,
+                "confidence": self.model_accuracy,
+                "reconstruction_error": float(mse[i]),
+                "degraded": not use_isolation_forest
+            }
+            for i in range(len(records))
+        ]
+    
+    def _cascade_results(self, X_scaled: np.ndarray, use_isolation_forest: bool) -> List[Dict]:
+        """Resultados no formato de analyze; modelos que não rodaram ficam como None
+
+        Leituras liberadas pelo estágio zscore não têm erro de reconstrução:
+        score fica None (não 0.0, que pareceria uma reconstrução perfeita) e
+        z_score traz o maior desvio padronizado da leitura.
+        """
+        scored = self.cascade.score(X_scaled, use_isolation_forest)
+        z_scores = np.abs(X_scaled).max(axis=1)
+        results = []
+        for i in range(len(X_scaled)):
+            mse = scored["mse"][i]
+            isolation = scored["isolation"][i]
+            results.append({
+                "is_anomaly": bool(scored["is_anomaly"][i]),
+                "score": None if np.isnan(mse) else float(mse),
+                "z_score": float(z_scores[i]),
+                "isolation_score": None if np.isnan(isolation) else float(isolation),
+                "confidence": self.model_accuracy,
+                "reconstruction_error": None if np.isnan(mse) else float(mse),
+                "degraded": not use_isolation_forest,
+                "stage": STAGES[scored["decided_by"][i]] if scored["decided_by"][i] >= 0 else None
+            })
+        return results
+    
     async def generate_training_data(self, n_samples: int = 10000) -> List[Dict]:
         """Gerar dados de treinamento simulados"""
         data = []
@@ -6,6 +6,7 @@ from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
+from rate_limiter import LoginRateLimiter
 
 # Configuração
 SECRET_KEY = "your-super-secret-key-digital-factory-2025"
@@ -16,6 +17,9 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Limite de tentativas de login (compartilhado com /api/auth/token em main.py)
+login_limiter = LoginRateLimiter()
+
 # Models
 class User(BaseModel):
     username: str
@@ -152,13 +156,15 @@ async def login_for_access_token(
     username: str = Form(...),
     password: str = Form(...)
 ):
-    # Verificar se IP está bloqueado (simplificado)
+    # Verificar bloqueio e limite de tentativas antes do bcrypt
     client_ip = request.client.host
+    await enforce_login_rate_limit(client_ip, username)
     
     user = authenticate_user(fake_users_db, username, password)
     if not user:
         # Log de tentativa falha
         await log_access_attempt(username, client_ip, False)
+        await login_limiter.record_failure(client_ip, username)
         
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -168,6 +174,7 @@ async def login_for_access_token(
     
     # Log de acesso bem-sucedido
     await log_access_attempt(username, client_ip, True)
+    await login_limiter.record_success(client_ip, username)
     
     # Criar token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -225,6 +232,16 @@ async def validate_token(token: str = Depends(oauth2_scheme)):
     except jwt.JWTError:
         return {"valid": False, "error": "Invalid token"}
 
+async def enforce_login_rate_limit(client_ip: str, username: str):
+    """Rejeitar com 429 IPs/usuários bloqueados ou acima do limite"""
+    retry_after = await login_limiter.check(client_ip, username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
+
 async def log_access_attempt(username: str, ip: str, success: bool):
     """Log de tentativas de acesso"""
     log_entry = {
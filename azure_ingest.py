@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+AZURE_QUEUE_SIZE = int(os.getenv("NEXUS_AZURE_QUEUE_SIZE", "50000"))
+AZURE_BATCH_SIZE = int(os.getenv("NEXUS_AZURE_BATCH_SIZE", "1000"))
+AZURE_DEDUP_SIZE = int(os.getenv("NEXUS_AZURE_DEDUP_SIZE", "200000"))
+
+# Limites de validação (mesmos de models.TelemetryData)
+REQUIRED_FIELDS = ["temperature", "vibration", "rpm"]
+OPTIONAL_FIELDS = ["pressure", "power_consumption"]
+FIELD_BOUNDS = {
+    "temperature": (-50, 150),
+    "vibration": (0, 1),
+    "rpm": (0, 10000),
+}
+
+
+class LRUSet:
+    """Conjunto limitado: ao atingir a capacidade, descarta o item mais antigo"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: OrderedDict = OrderedDict()
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        """Do mais antigo para o mais recente"""
+        return iter(list(self._items))
+
+    def add(self, item):
+        self._items[item] = None
+        self._items.move_to_end(item)
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def discard(self, item):
+        self._items.pop(item, None)
+
+
+def message_id(message: Dict) -> str:
+    """ID da mensagem do IoT Hub; sem ID, hash estável do conteúdo (retries têm o mesmo hash)"""
+    system = message.get("systemProperties") or {}
+    explicit = message.get("messageId") or message.get("id") or system.get("message-id")
+    if explicit:
+        return str(explicit)
+    return hashlib.sha1(json.dumps(message, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def unwrap_message(message: Dict) -> Dict:
+    """Extrair a leitura do envelope do IoT Hub / Event Grid"""
+    body = message.get("body") or message.get("data") or message
+    if isinstance(body, (str, bytes)):
+        body = json.loads(body)
+    reading = dict(body)
+    system = message.get("systemProperties") or {}
+    reading.setdefault("device_id", system.get("iothub-connection-device-id") or message.get("deviceId"))
+    return reading
+
+
+def validate_batch(readings: List[Dict]) -> np.ndarray:
+    """Máscara de leituras válidas, calculada de forma vetorizada"""
+    n = len(readings)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    values = np.empty((n, len(REQUIRED_FIELDS)), dtype=np.float64)
+    for j, field in enumerate(REQUIRED_FIELDS):
+        column = [r.get(field) for r in readings]
+        values[:, j] = [np.nan if not isinstance(v, (int, float)) or isinstance(v, bool) else v for v in column]
+    valid = np.isfinite(values).all(axis=1)
+    for j, field in enumerate(REQUIRED_FIELDS):
+        low, high = FIELD_BOUNDS[field]
+        with np.errstate(invalid="ignore"):
+            valid &= (values[:, j] >= low) & (values[:, j] <= high)
+    valid &= np.array([bool(r.get("device_id")) for r in readings])
+    return valid
+
+
+def _to_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+class AzureIngestConsumer:
+    """Consumidor em lote das mensagens do webhook do Azure IoT Hub
+
+    O webhook apenas verifica, deduplica e enfileira; o consumidor agrupa
+    as mensagens e faz validação vetorizada, score de anomalia em lote e
+    persistência em uma única inserção. IDs já vistos ficam em um LRU
+    limitado, então retries do IoT Hub viram no-ops baratos.
+
+    route (opcional) recebe as leituras válidas e retorna as que este
+    worker processa; as de dispositivos de outro worker são entregues ao
+    dono por ele, antes do score, da compressão e do estado por dispositivo.
+
+    on_batch (que completa as leituras, ex.: health_score) roda antes da
+    gravação, e a gravação é o último passo do lote: se algo falha, nada
+    foi gravado e os IDs são liberados para o retry; depois de gravado, o
+    lote não é liberado e um reenvio continua sendo no-op.
+    """
+
+    def __init__(
+        self,
+        anomaly_detector,
+        persist: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+        on_batch: Optional[Callable[[List[Dict], List[Dict]], Awaitable[None]]] = None,
+        compressor=None,
+        route: Optional[Callable[[List[Dict]], Awaitable[List[Dict]]]] = None,
+        queue_size: int = AZURE_QUEUE_SIZE,
+        batch_size: int = AZURE_BATCH_SIZE,
+        linger: float = 0.05,
+        dedup_size: int = AZURE_DEDUP_SIZE,
+    ):
+        self.anomaly_detector = anomaly_detector
+        self.persist = persist
+        self.on_batch = on_batch
+        self.compressor = compressor
+        self.route = route
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.seen = LRUSet(dedup_size)
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"accepted": 0, "duplicates": 0, "rejected_full": 0, "invalid": 0, "forwarded": 0,
+                      "processed": 0, "anomalies": 0, "batches": 0, "failed_batches": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def enqueue(self, messages) -> Dict:
+        """Enfileirar mensagens sem bloquear; mensagens repetidas são ignoradas"""
+        if isinstance(messages, dict):
+            messages = [messages]
+        result = {"accepted": 0, "duplicates": 0, "rejected": 0}
+        for message in messages:
+            msg_id = message_id(message)
+            if msg_id in self.seen:
+                result["duplicates"] += 1
+                continue
+            try:
+                self.queue.put_nowait((msg_id, message))
+            except asyncio.QueueFull:
+                result["rejected"] += 1
+                continue
+            self.seen.add(msg_id)
+            result["accepted"] += 1
+        self.stats["accepted"] += result["accepted"]
+        self.stats["duplicates"] += result["duplicates"]
+        self.stats["rejected_full"] += result["rejected"]
+        return result
+
+    async def _next_batch(self) -> List[tuple]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        return batch
+
+    async def _consume(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.process_batch(batch)
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                logger.error(f"Erro ao processar lote do Azure: {e}")
+                # Permitir que o retry do IoT Hub reprocesse estas mensagens
+                for msg_id, _ in batch:
+                    self.seen.discard(msg_id)
+
+    async def process_batch(self, batch: List[tuple]) -> List[Dict]:
+        readings = []
+        for msg_id, message in batch:
+            try:
+                reading = unwrap_message(message)
+            except (ValueError, TypeError):
+                self.stats["invalid"] += 1
+                continue
+            reading["message_id"] = msg_id
+            readings.append(reading)
+
+        valid = validate_batch(readings)
+        self.stats["invalid"] += int((~valid).sum())
+        readings = [r for r, ok in zip(readings, valid) if ok]
+        if readings and self.route is not None:
+            owned = await self.route(readings)
+            self.stats["forwarded"] += len(readings) - len(owned)
+            readings = owned
+        if not readings:
+            return []
+
+        results = await self.anomaly_detector.analyze_batch(readings)
+        for reading, result in zip(readings, results):
+            reading["rpm"] = int(reading["rpm"])
+            reading["timestamp"] = _to_datetime(reading.get("timestamp"))
+            reading["anomaly"] = result["is_anomaly"]
+            reading["anomaly_score"] = result["score"]
+
+        # Compressão decide o que é gravado e transmitido; anomalias sempre passam
+        kept = self.compressor.process_batch(readings) if self.compressor is not None else readings
+        if self.on_batch is not None:
+            await self.on_batch(readings, kept)
+        if self.persist is not None:
+            await self.persist(kept)
+
+        self.stats["batches"] += 1
+        self.stats["processed"] += len(readings)
+        self.stats["anomalies"] += sum(1 for r in readings if r["anomaly"])
+        return readings
+
+
+class LocalAzureProducer:
+    """Produtor local que imita o IoT Hub (inclusive retries duplicados) para testes"""
+
+    def __init__(self, devices: int = 12, duplicate_rate: float = 0.1, invalid_rate: float = 0.01, seed: int = 42):
+        self.devices = devices
+        self.duplicate_rate = duplicate_rate
+        self.invalid_rate = invalid_rate
+        self.rng = random.Random(seed)
+        self._sent: List[Dict] = []
+
+    def message(self) -> Dict:
+        device = f"device_{self.rng.randrange(self.devices)}"
+        body = {
+            "temperature": self.rng.gauss(70, 5),
+            "vibration": abs(self.rng.gauss(0.02, 0.005)),
+            "rpm": self.rng.gauss(1500, 50),
+            "pressure": self.rng.gauss(100, 10),
+            "power_consumption": self.rng.gauss(2.4, 0.3),
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        if self.rng.random() < self.invalid_rate:
+            body["temperature"] = None
+        return {
+            "messageId": uuid.uuid4().hex,
+            "systemProperties": {"iothub-connection-device-id": device},
+            "body": body,
+        }
+
+    def payload(self, size: int = 100) -> Dict:
+        """Payload no formato do webhook; parte das mensagens repete envios anteriores"""
+        messages = []
+        for _ in range(size):
+            if self._sent and self.rng.random() < self.duplicate_rate:
+                messages.append(self.rng.choice(self._sent))
+            else:
+                message = self.message()
+                self._sent.append(message)
+                messages.append(message)
+        self._sent = self._sent[-10000:]
+        return {"data": messages}
+
+    async def run(self, consumer: AzureIngestConsumer, payloads: int = 10, size: int = 100) -> Dict:
+        """Enviar payloads diretamente ao consumidor e retornar os totais do enqueue"""
+        totals = {"accepted": 0, "duplicates": 0, "rejected": 0}
+        for _ in range(payloads):
+            result = consumer.enqueue(self.payload(size)["data"])
+            for key in totals:
+                totals[key] += result[key]
+            await asyncio.sleep(0)
+        return totals
@@ -0,0 +1,424 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from cascade import AnomalyCascade, CASCADE_STAGES, CASCADE_Z_MAX, ISOLATION_THRESHOLD, STAGES
+from flat_forest import isolation_scores
+from shared_model import QuantizedAutoencoder, SharedModel
+
+logger = logging.getLogger(__name__)
+
+BACKTEST_WORKERS = int(os.getenv("NEXUS_BACKTEST_WORKERS", str(os.cpu_count() or 2)))
+BACKTEST_CHUNK = int(os.getenv("NEXUS_BACKTEST_CHUNK", "65536"))
+INCIDENTS_PATH = os.getenv("NEXUS_INCIDENTS_PATH", "data/incidents.json")
+BACKTEST_EXPORT_DIR = os.getenv("NEXUS_BACKTEST_EXPORT_DIR", "data/exports")
+EXPORT_SUFFIXES = (".npz", ".parquet", ".csv")
+ALERT_DEDUP_WINDOW = 60.0  # Mesma janela padrão do AlertBus, em tempo de evento
+FEATURES = ["temperature", "vibration", "rpm", "pressure", "power_consumption"]
+
+
+# ===== Fontes de dados (colunas NumPy ordenadas por tempo de evento) =====
+def to_epoch(values) -> np.ndarray:
+    """Timestamps (datetime, ISO ou datetime64) em segundos desde a época"""
+    values = np.asarray(values)
+    if values.dtype.kind in "fiu":
+        return values.astype(np.float64)
+    return values.astype("datetime64[us]").astype(np.int64) / 1e6
+
+
+def sort_by_event_time(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    order = np.argsort(columns["timestamp"], kind="stable")
+    if np.all(order[:-1] < order[1:]):
+        return columns
+    return {name: values[order] for name, values in columns.items()}
+
+
+def records_to_columns(records: List[Dict]) -> Dict[str, np.ndarray]:
+    columns = {
+        "device_id": np.array([r.get("device_id") for r in records], dtype=str),
+        "timestamp": to_epoch([r.get("timestamp") for r in records]),
+    }
+    for f in FEATURES:
+        columns[f] = np.array([r.get(f) if r.get(f) is not None else np.nan for r in records], dtype=np.float64)
+    if records and "label" in records[0]:
+        columns["label"] = np.array([bool(r.get("label")) for r in records])
+    return sort_by_event_time(columns)
+
+
+def save_export(columns: Dict[str, np.ndarray], path: str):
+    """Exportação colunar (.npz, sem pickle)"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    arrays = {name: np.asarray(values) for name, values in columns.items()}
+    arrays["device_id"] = arrays["device_id"].astype(str)
+    np.savez(path, **arrays)
+
+
+def load_export(path: str) -> Dict[str, np.ndarray]:
+    """Ler exportação colunar: .npz, .parquet ou .csv"""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+    else:
+        import pandas as pd
+        df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        columns = {name: df[name].to_numpy() for name in df.columns
+                   if name in FEATURES or name in ("device_id", "timestamp", "label")}
+    columns["device_id"] = columns["device_id"].astype(str)
+    columns["timestamp"] = to_epoch(columns["timestamp"])
+    for f in FEATURES:
+        columns[f] = columns[f].astype(np.float64) if f in columns else np.full(len(columns["timestamp"]), np.nan)
+    return sort_by_event_time(columns)
+
+
+def resolve_export_path(name: str, export_dir: str = BACKTEST_EXPORT_DIR) -> str:
+    """Caminho de uma exportação pedida pela API, restrito ao diretório de exportações"""
+    root = Path(export_dir).resolve()
+    path = (root / name).resolve()
+    if root not in path.parents:
+        raise ValueError(f"Exportação fora de {export_dir}")
+    if path.suffix not in EXPORT_SUFFIXES:
+        raise ValueError(f"Formato de exportação não suportado: {path.suffix or name}")
+    if not path.is_file():
+        raise ValueError(f"Exportação não encontrada: {name}")
+    return str(path)
+
+
+async def load_from_db(start: datetime, end: Optional[datetime] = None, device_ids: Optional[List[str]] = None,
+                       batch_size: int = 100000) -> Dict[str, np.ndarray]:
+    """Ler a telemetria arquivada do TelemetryDB em lotes, já em ordem de tempo de evento
+
+    O banco só tem as leituras que a compressão manteve (anomalias sempre,
+    o resto quando muda além da tolerância): as métricas por leitura de um
+    backtest sobre ele ficam enviesadas. Ver compression_bias().
+    """
+    from sqlalchemy import select
+    from database import AsyncSessionLocal, TelemetryDB
+
+    fields = [TelemetryDB.device_id, TelemetryDB.timestamp] + [getattr(TelemetryDB, f) for f in FEATURES]
+    stmt = select(*fields).where(TelemetryDB.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(TelemetryDB.timestamp < end)
+    if device_ids:
+        stmt = stmt.where(TelemetryDB.device_id.in_(device_ids))
+    stmt = stmt.order_by(TelemetryDB.timestamp)
+
+    parts: Dict[str, list] = {name: [] for name in ["device_id", "timestamp"] + FEATURES}
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt)
+        async for rows in result.partitions(batch_size):
+            for name, values in zip(parts, zip(*rows)):
+                parts[name].append(np.array(values, dtype=str if name == "device_id" else
+                                            "datetime64[us]" if name == "timestamp" else np.float64))
+    columns = {name: np.concatenate(chunks) if chunks else np.array([]) for name, chunks in parts.items()}
+    columns["device_id"] = columns["device_id"].astype(str)
+    columns["timestamp"] = to_epoch(columns["timestamp"])
+    return columns
+
+
+def compression_bias(algorithm: str) -> Optional[Dict]:
+    """Aviso para relatórios sobre o banco, se a compressão descartou leituras"""
+    if algorithm == "off":
+        return None
+    return {
+        "compression": algorithm,
+        "note": "O banco guarda só as leituras mantidas pela compressão, com todas as anomalias: "
+                "precisão, recall e alertas por dispositivo-dia ficam enviesados. "
+                "Use uma exportação completa para atualizar /api/ai/performance.",
+    }
+
+
+# ===== Incidentes rotulados =====
+def load_incidents(path: str = INCIDENTS_PATH) -> List[Dict]:
+    """Incidentes no formato [{"device_id", "start", "end"}] (timestamps ISO ou epoch)"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        incidents = json.load(f)
+    return [{"device_id": str(i["device_id"]), "start": float(to_epoch([i["start"]])[0]),
+             "end": float(to_epoch([i["end"]])[0])} for i in incidents]
+
+
+def _device_groups(device_ids: np.ndarray) -> Dict[str, np.ndarray]:
+    """Índices das linhas de cada dispositivo (em ordem de tempo de evento)"""
+    names, inverse = np.unique(device_ids, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+    return {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(names)}
+
+
+def label_rows(columns: Dict[str, np.ndarray], incidents: List[Dict],
+               groups: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """Marcar as linhas dentro de algum incidente do próprio dispositivo"""
+    groups = groups if groups is not None else _device_groups(columns["device_id"])
+    labels = np.zeros(len(columns["timestamp"]), dtype=bool)
+    for incident in incidents:
+        rows = groups.get(incident["device_id"])
+        if rows is None:
+            continue
+        t = columns["timestamp"][rows]
+        labels[rows[np.searchsorted(t, incident["start"]):np.searchsorted(t, incident["end"], side="right")]] = True
+    return labels
+
+
+def incidents_from_labels(columns: Dict[str, np.ndarray], labels: np.ndarray,
+                          groups: Optional[Dict[str, np.ndarray]] = None) -> List[Dict]:
+    """Incidentes = sequências contíguas de linhas rotuladas de um dispositivo"""
+    groups = groups if groups is not None else _device_groups(columns["device_id"])
+    incidents = []
+    for device_id, rows in groups.items():
+        flags = np.concatenate([[False], labels[rows], [False]]).astype(np.int8)
+        starts = np.flatnonzero(np.diff(flags) == 1)
+        ends = np.flatnonzero(np.diff(flags) == -1) - 1
+        t = columns["timestamp"][rows]
+        incidents.extend({"device_id": device_id, "start": float(t[s]), "end": float(t[e])}
+                         for s, e in zip(starts, ends))
+    return incidents
+
+
+# ===== Score (processos workers) =====
+class ReplayScorer:
+    """Mesmo pipeline de score do AnomalyDetector, montado do modelo compartilhado
+
+    Não depende do TensorFlow: usa os pesos mapeados em memória, o
+    Isolation Forest achatado e, se configurado, o autoencoder quantizado.
+    threshold, stages e z_max permitem avaliar configurações candidatas.
+    """
+
+    def __init__(self, model_dir: str, threshold: Optional[float] = None, stages: Optional[str] = None,
+                 z_max: Optional[float] = None, quantized: str = ""):
+        self.model = SharedModel.load(model_dir)
+        self.features = self.model.features
+        self.flat_forest = SharedModel.load_flat_forest(model_dir)
+        self.isolation_forest = SharedModel.load_isolation_forest(model_dir)  # Usado nos blocos grandes
+        self.quantized = QuantizedAutoencoder.load(model_dir, quantized, self.model.version) if quantized else None
+        if quantized and self.quantized is None:
+            logger.warning(f"Autoencoder {quantized} não encontrado em {model_dir}; usando float32")
+        self.threshold = threshold if threshold is not None else (self.quantized or self.model).threshold
+        stages = CASCADE_STAGES if stages is None else stages
+        if z_max is None:
+            z_max = self.model.cascade_z_max if self.model.cascade_z_max is not None else CASCADE_Z_MAX
+        self.cascade = AnomalyCascade(self, stages.split(","), z_max) if stages.strip() else None
+        self.use_isolation_forest = self.flat_forest is not None or self.isolation_forest is not None
+
+    def _transform(self, X: np.ndarray) -> np.ndarray:
+        return self.model.transform(X)
+
+    def _reconstruct(self, X_scaled: np.ndarray) -> np.ndarray:
+        return (self.quantized or self.model).reconstruct(X_scaled)
+
+    def _isolation_scores(self, X_scaled: np.ndarray) -> np.ndarray:
+        return isolation_scores(X_scaled, self.flat_forest, self.isolation_forest)
+
+    def _full_decisions(self, X_scaled: np.ndarray) -> np.ndarray:
+        mse = np.mean((X_scaled - self._reconstruct(X_scaled)) ** 2, axis=1)
+        if not self.use_isolation_forest:
+            return mse > self.threshold
+        return (mse > self.threshold) | (self._isolation_scores(X_scaled) < ISOLATION_THRESHOLD)
+
+    def score(self, X: np.ndarray) -> np.ndarray:
+        X_scaled = self._transform(X)
+        if self.cascade is not None:
+            return self.cascade.score(X_scaled, self.use_isolation_forest)["is_anomaly"]
+        return self._full_decisions(X_scaled)
+
+
+_scorer: Optional[ReplayScorer] = None
+_matrix: Optional[np.ndarray] = None
+
+
+def _init_worker(model_dir: str, matrix_path: str, config: Dict):
+    global _scorer, _matrix
+    _scorer = ReplayScorer(model_dir, **config)
+    _matrix = np.load(matrix_path, mmap_mode="r")
+
+
+def _score_chunk(bounds: tuple) -> tuple:
+    """Score de um intervalo de linhas da matriz compartilhada (mmap)"""
+    start, stop = bounds
+    begin = time.perf_counter()
+    if _scorer.cascade is not None:
+        for stats in _scorer.cascade.stats.values():
+            stats.update(evaluated=0, cleared=0, flagged=0)
+    flags = _scorer.score(np.asarray(_matrix[start:stop]))
+    stages = _scorer.cascade.stats if _scorer.cascade is not None else {}
+    return start, flags, time.perf_counter() - begin, {s: dict(v) for s, v in stages.items()}
+
+
+# ===== Avaliação em tempo de evento =====
+def count_alerts(times: np.ndarray, window: float) -> np.ndarray:
+    """Instantes dos alertas entregues: o primeiro de cada janela de deduplicação"""
+    alerts = []
+    i = 0
+    while i < len(times):
+        alerts.append(times[i])
+        i = int(np.searchsorted(times, times[i] + window, side="left"))
+    return np.array(alerts)
+
+
+def evaluate(columns: Dict[str, np.ndarray], predicted: np.ndarray, labels: Optional[np.ndarray],
+             incidents: List[Dict], dedup_window: float = ALERT_DEDUP_WINDOW,
+             groups: Optional[Dict[str, np.ndarray]] = None) -> Dict:
+    """Precisão/recall por leitura e por incidente, alertas e latência de detecção"""
+    groups = groups if groups is not None else _device_groups(columns["device_id"])
+    t = columns["timestamp"]
+    span = float(t[-1] - t[0]) if len(t) else 0.0
+    report: Dict = {"rows": int(len(predicted)), "flagged": int(predicted.sum()),
+                    "event_span_hours": round(span / 3600, 2)}
+
+    if labels is not None:
+        tp = int((predicted & labels).sum())
+        fp = int((predicted & ~labels).sum())
+        fn = int((~predicted & labels).sum())
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        report.update(
+            labeled=int(labels.sum()),
+            precision=round(precision, 4),
+            recall=round(recall, 4),
+            f1_score=round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+            accuracy=round(float((predicted == labels).mean()), 4) if len(labels) else None,
+        )
+
+    # Alertas deduplicados por dispositivo, como no AlertBus
+    alert_times: Dict[str, np.ndarray] = {}
+    for device_id, rows in groups.items():
+        flagged = rows[predicted[rows]]
+        alert_times[device_id] = count_alerts(t[flagged], dedup_window)
+    total_alerts = sum(len(a) for a in alert_times.values())
+    device_days = max(span / 86400, 1 / 24) * max(len(groups), 1)
+    report["alerts"] = {"total": total_alerts, "per_device_day": round(total_alerts / device_days, 3)}
+
+    if incidents:
+        detected, latencies, in_incident = 0, [], 0
+        for incident in incidents:
+            rows = groups.get(incident["device_id"])
+            if rows is None:
+                continue
+            ts = t[rows]
+            window = rows[np.searchsorted(ts, incident["start"]):np.searchsorted(ts, incident["end"], side="right")]
+            hits = window[predicted[window]]
+            if len(hits):
+                detected += 1
+                latencies.append(t[hits[0]] - incident["start"])
+            device_alerts = alert_times.get(incident["device_id"], np.array([]))
+            in_incident += int(((device_alerts >= incident["start"]) & (device_alerts <= incident["end"])).sum())
+        latencies = np.array(latencies)
+        report["incidents"] = {
+            "total": len(incidents),
+            "detected": detected,
+            "recall": round(detected / len(incidents), 4),
+            "alert_precision": round(in_incident / total_alerts, 4) if total_alerts else None,
+            "false_alerts": total_alerts - in_incident,
+            "detection_latency_s": {
+                "mean": round(float(latencies.mean()), 2) if len(latencies) else None,
+                "p50": round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+                "p95": round(float(np.percentile(latencies, 95)), 2) if len(latencies) else None,
+            },
+        }
+    return report
+
+
+def run_backtest(columns: Dict[str, np.ndarray], model_dir: str, incidents: Optional[List[Dict]] = None,
+                 threshold: Optional[float] = None, stages: Optional[str] = None, z_max: Optional[float] = None,
+                 quantized: str = "", workers: int = BACKTEST_WORKERS, chunk: int = BACKTEST_CHUNK,
+                 dedup_window: float = ALERT_DEDUP_WINDOW) -> Dict:
+    """Reproduzir a telemetria arquivada pelo pipeline de score em todos os núcleos
+
+    A matriz de features vai para um arquivo temporário mapeado pelos
+    workers (sem cópia por tarefa); cada worker pontua intervalos de
+    linhas. A avaliação usa apenas o tempo de evento das leituras, então o
+    resultado não depende da velocidade da reprodução. Sem incidentes, o
+    rótulo por linha da exportação (coluna label) define os incidentes.
+    """
+    columns = sort_by_event_time(columns)
+    n = len(columns["timestamp"])
+    if n == 0:
+        raise ValueError("Nenhuma leitura para reproduzir")
+    config = {"threshold": threshold, "stages": stages, "z_max": z_max, "quantized": quantized}
+    X = np.column_stack([np.nan_to_num(columns[f]) for f in FEATURES])
+    groups = _device_groups(columns["device_id"])
+    if incidents:
+        labels = label_rows(columns, incidents, groups)
+    elif "label" in columns:
+        labels = columns["label"].astype(bool)
+        incidents = incidents_from_labels(columns, labels, groups)
+    else:
+        labels = None
+
+    predicted = np.zeros(n, dtype=bool)
+    chunk_seconds: List[float] = []
+    stage_stats: Dict[str, Dict] = {}
+    tasks = [(start, min(start + chunk, n)) for start in range(0, n, chunk)]
+    begin = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="nexus-backtest-") as tmp:
+        matrix_path = os.path.join(tmp, "features.npy")
+        np.save(matrix_path, X)
+        if workers <= 1:
+            _init_worker(model_dir, matrix_path, config)
+            results = map(_score_chunk, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(model_dir, matrix_path, config))
+            results = pool.map(_score_chunk, tasks)
+        try:
+            for start, flags, seconds, stages_done in results:
+                predicted[start:start + len(flags)] = flags
+                chunk_seconds.append(seconds)
+                for stage, s in stages_done.items():
+                    totals = stage_stats.setdefault(stage, {"evaluated": 0, "cleared": 0, "flagged": 0})
+                    for key in totals:
+                        totals[key] += s[key]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    wall = time.perf_counter() - begin
+
+    report = evaluate(columns, predicted, labels, incidents or [], dedup_window, groups)
+    span = float(columns["timestamp"][-1] - columns["timestamp"][0])
+    per_row_us = np.array(chunk_seconds) / np.array([b - a for a, b in tasks]) * 1e6
+    report.update({
+        "config": {**config, "model_dir": model_dir},
+        "evaluated_at": datetime.utcnow().isoformat(),
+        "throughput": {
+            "workers": max(workers, 1),
+            "wall_seconds": round(wall, 3),
+            "rows_per_second": round(n / wall, 1),
+            "speedup_vs_real_time": round(span / wall, 1) if wall > 0 else None,
+        },
+        "scoring_latency_us_per_row": {
+            "p50": round(float(np.percentile(per_row_us, 50)), 3),
+            "p99": round(float(np.percentile(per_row_us, 99)), 3),
+        },
+        "stages": {stage: {**s, "pass_rate": round((s["evaluated"] - s["cleared"] - s["flagged"]) / s["evaluated"], 4)
+                           if s["evaluated"] else None}
+                   for stage, s in sorted(stage_stats.items(), key=lambda item: STAGES.index(item[0]))},
+    })
+    logger.info(f"Backtest: {n} leituras em {wall:.1f}s ({report['throughput']['rows_per_second']:.0f}/s), "
+                f"precisão={report.get('precision')} recall={report.get('recall')}")
+    return report
+
+
+def simulate_export(devices: int = 100, hours: float = 24.0, interval: float = 1.0, seed: int = 7,
+                    **simulator) -> Dict[str, np.ndarray]:
+    """Exportação colunar rotulada gerada pelo FleetSimulator (para validar o harness)"""
+    from load_generator import FleetSimulator
+    sim = FleetSimulator(devices=devices, seed=seed, **simulator)
+    idx = np.arange(devices)
+    steps = int(hours * 3600 / interval)
+    parts: Dict[str, list] = {name: [] for name in ["device_id", "timestamp", "label"] + FEATURES}
+    start = time.time() - hours * 3600
+    for k in range(steps):
+        sample = sim.step(idx, interval)
+        parts["timestamp"].append(np.full(devices, start + k * interval))
+        for name in ["device_id", "label"] + FEATURES:
+            parts[name].append(sample[name])
+    return {name: np.concatenate(chunks) for name, chunks in parts.items()}
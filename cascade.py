@@ -0,0 +1,146 @@
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Ordem dos estágios, ex. "zscore,autoencoder,isolation"; "" (padrão) desativa a
+# cascata e os modelos completos avaliam toda leitura
+CASCADE_STAGES = os.getenv("NEXUS_ANOMALY_CASCADE", "")
+# z_max usado enquanto não há valor calibrado no treino (manifesto do modelo)
+CASCADE_Z_MAX = float(os.getenv("NEXUS_ANOMALY_CASCADE_Z", "2.5"))
+ISOLATION_THRESHOLD = -0.5
+STAGES = ("zscore", "autoencoder", "isolation")
+
+
+class AnomalyCascade:
+    """Score de anomalia em cascata: estágio barato antes dos modelos caros
+
+    zscore libera leituras claramente normais (todas as features dentro de
+    z_max desvios do scaler ajustado). Os modelos são combinados por OU,
+    então uma anomalia do autoencoder encerra a leitura sem o Isolation
+    Forest (e vice-versa, conforme a ordem). Somente leituras ambíguas
+    chegam ao último estágio.
+    """
+
+    def __init__(self, detector, stages: Sequence[str] = None, z_max: float = CASCADE_Z_MAX):
+        if stages is None:
+            stages = (CASCADE_STAGES or ",".join(STAGES)).split(",")
+        stages = [s.strip() for s in stages if s.strip()]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Estágios desconhecidos na cascata: {sorted(unknown)}")
+        if not set(stages) & {"autoencoder", "isolation"}:
+            raise ValueError("A cascata precisa de ao menos um modelo (autoencoder ou isolation)")
+        self.detector = detector
+        self.stages = stages
+        self.z_max = z_max
+        self.stats = {s: {"evaluated": 0, "cleared": 0, "flagged": 0} for s in self.stages}
+
+    def score(self, X_scaled: np.ndarray, use_isolation_forest: bool = True) -> Dict[str, np.ndarray]:
+        """Decidir cada linha pelo primeiro estágio conclusivo
+
+        Retorna is_anomaly, mse e isolation (NaN onde o modelo não rodou) e
+        o índice do estágio que decidiu cada linha.
+        """
+        n = len(X_scaled)
+        is_anomaly = np.zeros(n, dtype=bool)
+        mse = np.full(n, np.nan)
+        isolation = np.full(n, np.nan)
+        decided_by = np.full(n, -1, dtype=np.int8)
+        pending = np.arange(n)
+        stages = [s for s in self.stages if use_isolation_forest or s != "isolation"]
+        if "autoencoder" not in stages and "isolation" not in stages:
+            stages.append("autoencoder")  # Modo degradado sem o Isolation Forest
+
+        for position, stage in enumerate(stages):
+            if len(pending) == 0:
+                break
+            last = position == len(stages) - 1
+            X = X_scaled[pending]
+            stats = self.stats.setdefault(stage, {"evaluated": 0, "cleared": 0, "flagged": 0})
+            stats["evaluated"] += len(pending)
+            if stage == "zscore":
+                flagged = np.zeros(len(pending), dtype=bool)
+                cleared = (np.abs(X) <= self.z_max).all(axis=1)
+            elif stage == "autoencoder":
+                mse[pending] = np.mean((X - self.detector._reconstruct(X)) ** 2, axis=1)
+                flagged = mse[pending] > self.detector.threshold
+                cleared = ~flagged if last else np.zeros(len(pending), dtype=bool)
+            else:
+                isolation[pending] = self.detector._isolation_scores(X)
+                flagged = isolation[pending] < ISOLATION_THRESHOLD
+                cleared = ~flagged if last else np.zeros(len(pending), dtype=bool)
+            stats["cleared"] += int(cleared.sum())
+            stats["flagged"] += int(flagged.sum())
+            decided = cleared | flagged
+            is_anomaly[pending[flagged]] = True
+            decided_by[pending[decided]] = STAGES.index(stage)
+            pending = pending[~decided]
+
+        # Leituras que passaram por todos os estágios sem decisão são normais
+        return {"is_anomaly": is_anomaly, "mse": mse, "isolation": isolation, "decided_by": decided_by}
+
+    def pass_rates(self) -> Dict[str, Dict]:
+        """Fração das leituras que cada estágio repassa ao próximo"""
+        rates = {}
+        for stage, s in self.stats.items():
+            evaluated = s["evaluated"]
+            passed = evaluated - s["cleared"] - s["flagged"]
+            rates[stage] = {**s, "pass_rate": round(passed / evaluated, 4) if evaluated else None}
+        return rates
+
+    def calibrate(self, X_scaled: np.ndarray, max_missed: float = 0.001,
+                  candidates: Optional[Sequence[float]] = None) -> float:
+        """Escolher o maior z_max que libera no máximo max_missed das anomalias do modelo completo"""
+        full = self.detector._full_decisions(X_scaled)
+        z = np.abs(X_scaled).max(axis=1)
+        anomalies = max(int(full.sum()), 1)
+        best = None
+        for z_max in sorted(candidates if candidates is not None else np.arange(1.0, 4.01, 0.1)):
+            missed = int((full & (z <= z_max)).sum()) / anomalies
+            if missed <= max_missed:
+                best = float(z_max)
+        self.z_max = best if best is not None else 0.0
+        logger.info(f"Cascata calibrada: z_max={self.z_max:.2f}")
+        return self.z_max
+
+
+def evaluate_cascade(detector, records: List[Dict], labels: Optional[Sequence[bool]] = None,
+                     stages: Sequence[str] = None, z_max: Optional[float] = None) -> Dict:
+    """Avaliação offline: cascata vs modelos completos em todas as leituras
+
+    Reporta concordância, anomalias perdidas, taxas de passagem por estágio
+    e o custo médio por leitura; com labels, também precisão e recall.
+    """
+    X = np.array([[r.get(f, 0) or 0 for f in detector.features] for r in records], dtype=np.float64)
+    X_scaled = detector._transform(X)
+    cascade = AnomalyCascade(detector, stages, z_max if z_max is not None else CASCADE_Z_MAX)
+
+    start = time.perf_counter()
+    full = detector._full_decisions(X_scaled)
+    full_cost = time.perf_counter() - start
+    start = time.perf_counter()
+    cascaded = cascade.score(X_scaled)["is_anomaly"]
+    cascade_cost = time.perf_counter() - start
+
+    report = {
+        "samples": len(records),
+        "agreement": round(float((full == cascaded).mean()), 5),
+        "missed_anomalies": int((full & ~cascaded).sum()),
+        "full_anomalies": int(full.sum()),
+        "stages": cascade.pass_rates(),
+        "full_cost_us": round(1e6 * full_cost / max(len(records), 1), 3),
+        "cascade_cost_us": round(1e6 * cascade_cost / max(len(records), 1), 3),
+        "speedup": round(full_cost / cascade_cost, 2) if cascade_cost > 0 else None,
+    }
+    if labels is not None:
+        labels = np.asarray(labels, dtype=bool)
+        for name, predicted in (("full", full), ("cascade", cascaded)):
+            tp = int((predicted & labels).sum())
+            report[f"{name}_precision"] = round(tp / max(int(predicted.sum()), 1), 4)
+            report[f"{name}_recall"] = round(tp / max(int(labels.sum()), 1), 4)
+    return report
@@ -0,0 +1,331 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None  # Redis é opcional - usa o broker em memória
+
+logger = logging.getLogger(__name__)
+
+# Configuração do modo scale-out
+REDIS_URL = os.getenv("REDIS_URL")
+KEY_PREFIX = os.getenv("NEXUS_CLUSTER_PREFIX", "nexus")
+HEARTBEAT_INTERVAL = float(os.getenv("NEXUS_HEARTBEAT_INTERVAL", "3"))
+MEMBER_TTL = int(os.getenv("NEXUS_MEMBER_TTL", "10"))
+REQUEST_TIMEOUT = float(os.getenv("NEXUS_CLUSTER_REQUEST_TIMEOUT", "5"))
+RING_REPLICAS = 64
+
+Handler = Callable[[Dict], Awaitable[None]]
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_message(message: Dict) -> str:
+    return json.dumps(message, default=_json_default)
+
+
+def stable_hash(key: str) -> int:
+    """Hash estável entre processos (hash() do Python é randomizado por processo)"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing:
+    """Anel de hash consistente para particionar dispositivos entre workers"""
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = RING_REPLICAS):
+        self.replicas = replicas
+        self._hashes: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            h = stable_hash(f"{node}#{i}")
+            self._owners[h] = node
+            bisect.insort(self._hashes, h)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.replicas):
+            h = stable_hash(f"{node}#{i}")
+            if self._owners.get(h) == node:
+                del self._owners[h]
+                idx = bisect.bisect_left(self._hashes, h)
+                if idx < len(self._hashes) and self._hashes[idx] == h:
+                    self._hashes.pop(idx)
+
+    def get_node(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        idx = bisect.bisect(self._hashes, stable_hash(key)) % len(self._hashes)
+        return self._owners[self._hashes[idx]]
+
+
+class InMemoryBroker:
+    """Broker pub/sub e estado compartilhado em memória (substituto local do Redis)"""
+
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, List[asyncio.Queue]] = defaultdict(list)
+        self._hashes: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self._values: Dict[str, tuple] = {}
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def publish(self, channel: str, message: Dict):
+        data = encode_message(message)
+        for queue in self._subscribers.get(channel, ()):
+            if queue.full():
+                # Assinante lento: descartar a mensagem mais antiga
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+    async def listen(self, channel: str):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[channel].append(queue)
+        try:
+            while True:
+                yield json.loads(await queue.get())
+        finally:
+            self._subscribers[channel].remove(queue)
+
+    async def hset(self, key: str, field: str, value: Dict):
+        self._hashes[key][field] = encode_message(value)
+
+    async def hset_many(self, key: str, values: Dict[str, Dict]):
+        self._hashes[key].update({f: encode_message(v) for f, v in values.items()})
+
+    async def hget(self, key: str, field: str) -> Optional[Dict]:
+        raw = self._hashes.get(key, {}).get(field)
+        return json.loads(raw) if raw is not None else None
+
+    async def hgetall(self, key: str) -> Dict[str, Dict]:
+        return {f: json.loads(v) for f, v in self._hashes.get(key, {}).items()}
+
+    async def hdel(self, key: str, field: str):
+        self._hashes.get(key, {}).pop(field, None)
+
+    async def set(self, key: str, value: str, expire: Optional[int] = None):
+        deadline = time.monotonic() + expire if expire else None
+        self._values[key] = (value, deadline)
+
+    async def keys(self, prefix: str) -> List[str]:
+        now = time.monotonic()
+        alive = []
+        for key, (_, deadline) in list(self._values.items()):
+            if deadline is not None and deadline < now:
+                del self._values[key]
+            elif key.startswith(prefix):
+                alive.append(key)
+        return alive
+
+
+class RedisBroker:
+    """Broker pub/sub e estado compartilhado sobre Redis"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.client = None
+
+    async def connect(self):
+        self.client = aioredis.from_url(self.url, decode_responses=True)
+        await self.client.ping()
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
+
+    async def publish(self, channel: str, message: Dict):
+        await self.client.publish(f"{KEY_PREFIX}:{channel}", encode_message(message))
+
+    async def listen(self, channel: str):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(f"{KEY_PREFIX}:{channel}")
+        try:
+            async for item in pubsub.listen():
+                if item.get("type") == "message":
+                    yield json.loads(item["data"])
+        finally:
+            await pubsub.close()
+
+    async def hset(self, key: str, field: str, value: Dict):
+        await self.client.hset(f"{KEY_PREFIX}:{key}", field, encode_message(value))
+
+    async def hset_many(self, key: str, values: Dict[str, Dict]):
+        if values:
+            await self.client.hset(f"{KEY_PREFIX}:{key}", mapping={f: encode_message(v) for f, v in values.items()})
+
+    async def hget(self, key: str, field: str) -> Optional[Dict]:
+        raw = await self.client.hget(f"{KEY_PREFIX}:{key}", field)
+        return json.loads(raw) if raw is not None else None
+
+    async def hgetall(self, key: str) -> Dict[str, Dict]:
+        raw = await self.client.hgetall(f"{KEY_PREFIX}:{key}")
+        return {f: json.loads(v) for f, v in raw.items()}
+
+    async def hdel(self, key: str, field: str):
+        await self.client.hdel(f"{KEY_PREFIX}:{key}", field)
+
+    async def set(self, key: str, value: str, expire: Optional[int] = None):
+        await self.client.set(f"{KEY_PREFIX}:{key}", value, ex=expire)
+
+    async def keys(self, prefix: str) -> List[str]:
+        full_prefix = f"{KEY_PREFIX}:{prefix}"
+        found = []
+        async for key in self.client.scan_iter(match=f"{full_prefix}*"):
+            found.append(key[len(KEY_PREFIX) + 1:])
+        return found
+
+
+def create_broker():
+    """Redis se REDIS_URL estiver configurado, senão o broker em memória"""
+    if REDIS_URL and aioredis is not None:
+        return RedisBroker(REDIS_URL)
+    if REDIS_URL:
+        logger.warning("REDIS_URL definido mas pacote redis não instalado - usando broker em memória")
+    return InMemoryBroker()
+
+
+class ClusterNode:
+    """Coordenação de um worker uvicorn no modo scale-out"""
+
+    def __init__(self, broker=None, worker_id: Optional[str] = None):
+        self.broker = broker or create_broker()
+        self.worker_id = worker_id or os.getenv("NEXUS_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+        self.ring = ConsistentHashRing([self.worker_id])
+        self._tasks: List[asyncio.Task] = []
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @property
+    def members(self) -> List[str]:
+        return sorted(self.ring.nodes)
+
+    async def start(self):
+        """Conectar ao broker, registrar o worker e manter o anel atualizado"""
+        await self.broker.connect()
+        await self.refresh_membership()
+        self._tasks.append(asyncio.create_task(self._heartbeat_loop()))
+        self.subscribe_owned("reply", self._on_reply)
+        logger.info(f"🔗 Worker {self.worker_id} registrado no cluster ({len(self.members)} membros)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self.broker.close()
+
+    async def refresh_membership(self):
+        await self.broker.set(f"members:{self.worker_id}", str(time.time()), expire=MEMBER_TTL)
+        live = {key.split(":", 1)[1] for key in await self.broker.keys("members:")}
+        live.add(self.worker_id)
+        if live != self.ring.nodes:
+            for node in self.ring.nodes - live:
+                self.ring.remove(node)
+            for node in live - self.ring.nodes:
+                self.ring.add(node)
+            logger.info(f"🔄 Anel de particionamento atualizado: {sorted(live)}")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self.refresh_membership()
+            except Exception as e:
+                logger.error(f"Erro no heartbeat do cluster: {e}")
+
+    def owner(self, device_id: str) -> str:
+        return self.ring.get_node(device_id) or self.worker_id
+
+    def owns(self, device_id: str) -> bool:
+        return self.owner(device_id) == self.worker_id
+
+    async def publish(self, channel: str, message: Dict):
+        """Publicar mensagem para todos os workers (incluindo este)"""
+        await self.broker.publish(channel, {**message, "_origin": self.worker_id})
+
+    async def send_to_owner(self, device_id: str, channel: str, message: Dict):
+        """Encaminhar mensagem para o worker dono do dispositivo
+
+        A mensagem sai marcada com _forwarded: quem a recebe processa
+        localmente, sem reconsultar o anel. Enquanto os workers discordam da
+        composição do anel, isso evita que ela fique indo e voltando.
+        """
+        await self.send_to_worker(self.owner(device_id), channel, message)
+
+    async def send_to_worker(self, worker_id: str, channel: str, message: Dict):
+        """Enviar mensagem a um worker específico (ex.: lote agrupado por dono)"""
+        await self.publish(f"{channel}:{worker_id}", {**message, "_forwarded": True})
+
+    def subscribe(self, channel: str, handler: Handler, include_own: bool = True):
+        """Consumir um canal em background chamando handler para cada mensagem"""
+        async def _consume():
+            async for message in self.broker.listen(channel):
+                if not include_own and message.get("_origin") == self.worker_id:
+                    continue
+                try:
+                    await handler(message)
+                except Exception as e:
+                    logger.error(f"Erro ao processar mensagem de {channel}: {e}")
+
+        self._tasks.append(asyncio.create_task(_consume()))
+
+    def subscribe_owned(self, channel: str, handler: Handler):
+        """Consumir mensagens endereçadas a este worker via send_to_owner"""
+        self.subscribe(f"{channel}:{self.worker_id}", handler)
+
+    # ===== Requisição/resposta =====
+    async def request(self, worker_id: str, channel: str, message: Dict,
+                      timeout: float = REQUEST_TIMEOUT) -> Dict:
+        """Enviar a um worker e aguardar a resposta do handler de serve()
+
+        O pub/sub não garante entrega: sem resposta dentro de timeout,
+        levanta asyncio.TimeoutError e quem chamou decide se reenvia.
+        """
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self.send_to_worker(worker_id, channel, {**message, "_request": request_id})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def serve(self, channel: str, handler: Callable[[Dict], Awaitable[Optional[Dict]]]):
+        """Atender requisições endereçadas a este worker; responde só se o handler concluir"""
+        async def _handle(message: Dict):
+            reply = await handler(message) or {}
+            await self.send_to_worker(message["_origin"], "reply", {**reply, "_request": message["_request"]})
+
+        self.subscribe_owned(channel, _handle)
+
+    async def _on_reply(self, message: Dict):
+        future = self._pending.get(message.get("_request"))
+        if future is not None and not future.done():
+            future.set_result(message)
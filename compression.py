@@ -0,0 +1,293 @@
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_ALGORITHM = os.getenv("NEXUS_COMPRESSION", "deadband")
+COMPRESSION_MAX_GAP = float(os.getenv("NEXUS_COMPRESSION_MAX_GAP", "60"))
+ALGORITHMS = ("off", "deadband", "swinging_door")
+
+# Erro máximo de reconstrução por campo (mesma unidade da leitura), ~3x o ruído dos sensores
+DEFAULT_TOLERANCES = {
+    "temperature": 3.0,
+    "vibration": 0.008,
+    "rpm": 40.0,
+    "pressure": 6.0,
+    "power_consumption": 0.2,
+}
+
+
+def parse_tolerances(spec: str) -> Dict[str, float]:
+    """Ler "temperature=0.5,rpm=10" (NEXUS_COMPRESSION_TOLERANCES)"""
+    tolerances = {}
+    for item in spec.split(","):
+        if "=" in item:
+            field, value = item.split("=", 1)
+            tolerances[field.strip()] = float(value)
+    return tolerances
+
+
+TOLERANCES = {**DEFAULT_TOLERANCES, **parse_tolerances(os.getenv("NEXUS_COMPRESSION_TOLERANCES", ""))}
+
+
+def _seconds(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    if isinstance(value, (int, float)):
+        return float(value)
+    return time.time()
+
+
+class _DeviceState:
+    __slots__ = ("algorithm", "tolerances", "archive_t", "archive", "held", "held_t", "decided_t", "lower",
+                 "upper", "received", "stored")
+
+    def __init__(self, algorithm: str, tolerances: Dict[str, float]):
+        self.algorithm = algorithm
+        self.tolerances = tolerances
+        self.archive_t: Optional[float] = None
+        self.archive: Dict[str, float] = {}
+        self.held: Optional[Dict] = None
+        self.held_t = 0.0
+        self.decided_t = -math.inf  # Timestamp da última leitura decidida (guardada ou descartada)
+        self.lower: Dict[str, float] = {}
+        self.upper: Dict[str, float] = {}
+        self.received = 0
+        self.stored = 0
+
+
+class TelemetryCompressor:
+    """Compressão de telemetria por dispositivo e campo (deadband ou swinging door)
+
+    Decide quais leituras são gravadas no banco e transmitidas. deadband
+    guarda a leitura quando algum campo se afasta mais que a tolerância do
+    último valor guardado (reconstrução por retenção). swinging_door
+    mantém, para cada campo, o intervalo de inclinações a partir do último
+    ponto arquivado que passa a menos da tolerância de todos os pontos
+    descartados; um candidato a ponto final só é aceito se sua inclinação
+    estiver nesse intervalo, então a interpolação linear entre pontos
+    guardados nunca erra mais que a tolerância. Como o ponto arquivado é o
+    anterior ao que fecha a porta, a saída atrasa uma leitura.
+
+    Leituras marcadas como anomalia e leituras após max_gap segundos sem
+    gravação sempre passam. Leituras com timestamp até o último ponto já
+    decidido (arquivado ou candidato) são descartadas: são reentregas do
+    WAL ou de gateways, e gravá-las de novo duplicaria pontos.
+
+    O ponto candidato só existe em memória; snapshot()/restore() permitem
+    salvá-lo junto com o offset do consumidor do WAL.
+    """
+
+    def __init__(self, algorithm: str = COMPRESSION_ALGORITHM, tolerances: Optional[Dict[str, float]] = None,
+                 max_gap: float = COMPRESSION_MAX_GAP):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Algoritmo de compressão desconhecido: {algorithm}")
+        self.algorithm = algorithm
+        self.tolerances = dict(tolerances if tolerances is not None else TOLERANCES)
+        self.max_gap = max_gap
+        self.devices: Dict[str, _DeviceState] = {}
+        self._overrides: Dict[str, tuple] = {}
+        self.stats = {"received": 0, "stored": 0, "anomalies": 0, "heartbeats": 0, "stale": 0}
+
+    def configure(self, device_id: str, algorithm: Optional[str] = None,
+                  tolerances: Optional[Dict[str, float]] = None):
+        """Algoritmo/tolerâncias específicos de um dispositivo (reinicia seu estado)"""
+        if algorithm is not None and algorithm not in ALGORITHMS:
+            raise ValueError(f"Algoritmo de compressão desconhecido: {algorithm}")
+        self._overrides[device_id] = (algorithm or self.algorithm, {**self.tolerances, **(tolerances or {})})
+        self.devices.pop(device_id, None)
+
+    def _state(self, device_id: str) -> _DeviceState:
+        state = self.devices.get(device_id)
+        if state is None:
+            algorithm, tolerances = self._overrides.get(device_id, (self.algorithm, self.tolerances))
+            state = self.devices[device_id] = _DeviceState(algorithm, tolerances)
+        return state
+
+    # ===== Decisão por leitura =====
+    def process(self, reading: Dict) -> List[Dict]:
+        """Retorna as leituras a gravar/transmitir agora (0, 1 ou 2 com swinging door)"""
+        state = self._state(reading.get("device_id"))
+        state.received += 1
+        self.stats["received"] += 1
+        emitted = self._decide(state, reading, _seconds(reading.get("timestamp")))
+        state.stored += len(emitted)
+        self.stats["stored"] += len(emitted)
+        return emitted
+
+    def process_batch(self, readings: List[Dict]) -> List[Dict]:
+        kept = []
+        for reading in readings:
+            kept.extend(self.process(reading))
+        return kept
+
+    def _decide(self, state: _DeviceState, reading: Dict, t: float) -> List[Dict]:
+        if state.algorithm == "off" or state.archive_t is None:
+            self._archive(state, reading, t)
+            state.decided_t = t
+            return [reading]
+        if t <= state.decided_t:
+            self.stats["stale"] += 1  # Já decidida (reentrega) ou fora de ordem
+            return []
+        state.decided_t = t
+
+        forced = None
+        if reading.get("anomaly"):
+            forced = "anomalies"
+        elif t - state.archive_t >= self.max_gap:
+            forced = "heartbeats"
+        if forced is not None:
+            self.stats[forced] += 1
+            emitted = [state.held] if state.held is not None else []
+            self._archive(state, reading, t)
+            return emitted + [reading]
+
+        if state.algorithm == "deadband":
+            for field, tolerance in state.tolerances.items():
+                value = reading.get(field)
+                if isinstance(value, (int, float)) and abs(value - state.archive.get(field, value)) > tolerance:
+                    self._archive(state, reading, t)
+                    return [reading]
+            return []
+
+        # swinging door: o candidato precisa caber no intervalo dos pontos já descartados
+        dt = t - state.archive_t
+        for field in state.tolerances:
+            value = reading.get(field)
+            if not isinstance(value, (int, float)) or field not in state.archive:
+                continue
+            slope = (value - state.archive[field]) / dt
+            if not state.lower.get(field, -math.inf) <= slope <= state.upper.get(field, math.inf):
+                held, held_t = state.held, state.held_t
+                self._archive(state, held, held_t)
+                self._widen(state, reading, t)
+                return [held]
+        self._widen(state, reading, t)
+        return []
+
+    def _widen(self, state: _DeviceState, reading: Dict, t: float):
+        """Tornar reading o ponto final candidato e restringir o intervalo de inclinações"""
+        dt = t - state.archive_t
+        for field, tolerance in state.tolerances.items():
+            value = reading.get(field)
+            if not isinstance(value, (int, float)) or field not in state.archive:
+                continue
+            base = state.archive[field]
+            state.lower[field] = max(state.lower.get(field, -math.inf), (value - tolerance - base) / dt)
+            state.upper[field] = min(state.upper.get(field, math.inf), (value + tolerance - base) / dt)
+        state.held, state.held_t = reading, t
+
+    def _archive(self, state: _DeviceState, reading: Dict, t: float):
+        state.archive_t = t
+        state.archive = {f: reading[f] for f in state.tolerances if isinstance(reading.get(f), (int, float))}
+        state.held = None
+        state.lower.clear()
+        state.upper.clear()
+
+    def flush(self) -> List[Dict]:
+        """Liberar os pontos retidos (ex.: no desligamento) para não perder o último trecho"""
+        held = []
+        for state in self.devices.values():
+            if state.held is not None:
+                held.append(state.held)
+                state.stored += 1
+                self._archive(state, state.held, state.held_t)
+        self.stats["stored"] += len(held)
+        return held
+
+    # ===== Estado =====
+    def snapshot(self, device_ids: Optional[Iterable[str]] = None) -> Dict[str, Optional[Dict]]:
+        """Estado por dispositivo serializável em JSON (None = dispositivo ainda sem estado)"""
+        ids = self.devices.keys() if device_ids is None else device_ids
+        snapshot = {}
+        for device_id in ids:
+            state = self.devices.get(device_id)
+            snapshot[device_id] = None if state is None else {
+                "algorithm": state.algorithm, "archive_t": state.archive_t, "archive": dict(state.archive),
+                "held": state.held, "held_t": state.held_t, "decided_t": state.decided_t, "lower": dict(state.lower),
+                "upper": dict(state.upper), "received": state.received, "stored": state.stored,
+            }
+        return snapshot
+
+    def restore(self, snapshot: Dict[str, Optional[Dict]]):
+        """Voltar os dispositivos do snapshot ao estado salvo (os demais não mudam)"""
+        for device_id, saved in snapshot.items():
+            self.devices.pop(device_id, None)
+            if saved is None:
+                continue
+            state = self._state(device_id)
+            if state.algorithm != saved["algorithm"]:
+                continue  # Configuração mudou: recomeça do zero
+            state.archive_t, state.archive = saved["archive_t"], dict(saved["archive"])
+            state.held, state.held_t, state.decided_t = saved["held"], saved["held_t"], saved["decided_t"]
+            state.lower, state.upper = dict(saved["lower"]), dict(saved["upper"])
+            state.received, state.stored = saved["received"], saved["stored"]
+
+    # ===== Relatórios =====
+    def ratios(self, top: int = 10) -> Dict:
+        """Taxa de compressão global e dos dispositivos menos compressíveis"""
+        received, stored = self.stats["received"], self.stats["stored"]
+        devices = sorted(self.devices.items(), key=lambda item: item[1].received / max(item[1].stored, 1))
+        return {
+            **self.stats,
+            "algorithm": self.algorithm,
+            "ratio": round(received / stored, 2) if stored else None,
+            "least_compressible": {
+                device_id: round(s.received / max(s.stored, 1), 2) for device_id, s in devices[:top]
+            },
+        }
+
+
+def reconstruct(stored: List[Dict], timestamps: np.ndarray, field: str, algorithm: str) -> np.ndarray:
+    """Reconstruir um campo nos instantes pedidos a partir dos pontos guardados"""
+    points = [(_seconds(r.get("timestamp")), r[field]) for r in stored if isinstance(r.get(field), (int, float))]
+    t = np.array([p[0] for p in points])
+    v = np.array([p[1] for p in points], dtype=np.float64)
+    if algorithm == "swinging_door":
+        return np.interp(timestamps, t, v)
+    index = np.clip(np.searchsorted(t, timestamps, side="right") - 1, 0, len(t) - 1)
+    return v[index]
+
+
+def evaluate_compression(records: List[Dict], algorithm: str = COMPRESSION_ALGORITHM,
+                         tolerances: Optional[Dict[str, float]] = None, max_gap: float = COMPRESSION_MAX_GAP) -> Dict:
+    """Avaliação offline: taxa de compressão e erro máximo de reconstrução por campo"""
+    compressor = TelemetryCompressor(algorithm, tolerances, max_gap)
+    stored = compressor.process_batch(records) + compressor.flush()
+    by_device: Dict[str, List[Dict]] = {}
+    for r in records:
+        by_device.setdefault(r.get("device_id"), []).append(r)
+    kept_by_device: Dict[str, List[Dict]] = {}
+    for r in stored:
+        kept_by_device.setdefault(r.get("device_id"), []).append(r)
+
+    max_error = {field: 0.0 for field in compressor.tolerances}
+    for device_id, rows in by_device.items():
+        kept = sorted(kept_by_device.get(device_id, []), key=lambda r: _seconds(r.get("timestamp")))
+        timestamps = np.array([_seconds(r.get("timestamp")) for r in rows])
+        for field in compressor.tolerances:
+            actual = np.array([r.get(field, np.nan) for r in rows], dtype=np.float64)
+            if not kept or np.isnan(actual).all():
+                continue
+            error = np.abs(reconstruct(kept, timestamps, field, algorithm) - actual)
+            max_error[field] = max(max_error[field], float(np.nanmax(error)))
+    return {
+        "samples": len(records),
+        "stored": len(stored),
+        "ratio": round(len(records) / max(len(stored), 1), 2),
+        "max_error": {f: round(e, 6) for f, e in max_error.items()},
+        "within_tolerance": all(max_error[f] <= compressor.tolerances[f] + 1e-9 for f in max_error),
+        "anomalies_kept": sum(1 for r in stored if r.get("anomaly")),
+        "anomalies": sum(1 for r in records if r.get("anomaly")),
+    }
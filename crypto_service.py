@@ -0,0 +1,302 @@
+import asyncio
+import errno
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing as mp
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncIterable, Dict, List, Optional
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # Windows: lock via msvcrt
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+KEYRING_PATH = os.getenv("NEXUS_KEYRING_PATH", "keys/fernet.keys")
+CRYPTO_WORKERS = int(os.getenv("NEXUS_CRYPTO_WORKERS", str(os.cpu_count() or 2)))
+BATCH_CHUNK = 2000            # Registros por tarefa no pool de processos
+INLINE_BATCH_LIMIT = 500      # Lotes menores são processados no próprio processo
+MAX_WEBHOOK_BODY = 10 * 1024 * 1024
+
+# Estado dos processos do pool (inicializado uma vez por processo)
+_worker_cipher: Optional[MultiFernet] = None
+
+
+def _init_worker(keys: List[bytes]):
+    global _worker_cipher
+    _worker_cipher = MultiFernet([Fernet(k) for k in keys])
+
+
+def _encrypt_chunk(items: List[bytes]) -> List[bytes]:
+    return [_worker_cipher.encrypt(item) for item in items]
+
+
+def _decrypt_chunk(tokens: List[bytes]) -> List[bytes]:
+    return [_worker_cipher.decrypt(token) for token in tokens]
+
+
+class KeyRing:
+    """Chaves Fernet persistentes; a primeira é a chave ativa de criptografia
+
+    As chaves vêm de NEXUS_FERNET_KEYS (separadas por vírgula) ou do arquivo
+    do keyring, criado com uma chave nova na primeira execução. Chaves
+    antigas continuam válidas para descriptografar após a rotação.
+
+    Vários workers podem subir ao mesmo tempo: o arquivo é escrito em um
+    temporário exclusivo do processo e publicado com link(), que falha com
+    EEXIST se outro worker criou o keyring primeiro - nesse caso vale o dele.
+    Rotações são serializadas por um lock de arquivo ao lado do keyring.
+    """
+
+    def __init__(self, path: str = KEYRING_PATH):
+        self.path = Path(path)
+        self.from_env = bool(os.getenv("NEXUS_FERNET_KEYS"))
+        self._mtime = 0.0
+        self.keys: List[bytes] = self._load()
+
+    def _load(self) -> List[bytes]:
+        env_keys = os.getenv("NEXUS_FERNET_KEYS")
+        if env_keys:
+            return [k.strip().encode() for k in env_keys.split(",") if k.strip()]
+        keys = self._read()
+        if keys:
+            return keys
+        keys = [Fernet.generate_key()]
+        if self._save(keys, exclusive=True):
+            logger.info(f"🔑 Novo keyring criado em {self.path}")
+            self._mtime = self.path.stat().st_mtime
+            return keys
+        return self._read()
+
+    def _read(self) -> List[bytes]:
+        try:
+            mtime = self.path.stat().st_mtime
+            keys = [line.strip().encode() for line in self.path.read_text().splitlines() if line.strip()]
+        except FileNotFoundError:
+            return []
+        self._mtime = mtime
+        return keys
+
+    def _save(self, keys: List[bytes], exclusive: bool = False) -> bool:
+        """Gravar o keyring; com exclusive=True retorna False se ele já existe"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # mkstemp: nome único criado com O_CREAT | O_EXCL e permissão 0600
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent)
+        tmp = Path(tmp)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write("\n".join(k.decode() for k in keys) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if not exclusive:
+                os.replace(tmp, self.path)
+                return True
+            try:
+                os.link(tmp, self.path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                return False
+            return True
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    @contextmanager
+    def _locked(self):
+        """Lock exclusivo (bloqueante) entre processos; liberado ao fechar o fd"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path.with_name(self.path.name + ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            yield
+        finally:
+            os.close(fd)
+
+    def reload(self, force: bool = False) -> bool:
+        """Reler o arquivo se outro worker rotacionou a chave; retorna True se mudou"""
+        if self.from_env:
+            return False
+        try:
+            if not force and self.path.stat().st_mtime == self._mtime:
+                return False
+        except FileNotFoundError:
+            return False
+        keys = self._read()
+        if not keys or keys == self.keys:
+            return False
+        self.keys = keys
+        return True
+
+    def rotate(self, keep: int = 3) -> bytes:
+        """Gerar nova chave ativa, mantendo as `keep` mais recentes para leitura
+
+        Sob o lock, relê o arquivo antes de gravar: uma rotação concorrente de
+        outro worker não é sobrescrita (a chave dela segue entre as de leitura).
+        """
+        if self.from_env:
+            raise RuntimeError("Chaves definidas em NEXUS_FERNET_KEYS: rotacione pela variável de ambiente")
+        with self._locked():
+            self.reload(force=True)
+            key = Fernet.generate_key()
+            self.keys = [key] + self.keys[:max(0, keep - 1)]
+            self._save(self.keys)
+            self._mtime = self.path.stat().st_mtime
+        return key
+
+
+class CryptoService:
+    """Criptografia Fernet em lote e verificação HMAC em streaming"""
+
+    def __init__(self, keyring: Optional[KeyRing] = None, hmac_secret: Optional[bytes] = None,
+                 workers: int = CRYPTO_WORKERS):
+        self.keyring = keyring or KeyRing()
+        self.hmac_secret = hmac_secret
+        self.workers = workers
+        self.cipher = MultiFernet([Fernet(k) for k in self.keyring.keys])
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    # ===== Chaves =====
+    def rotate_key(self, keep: int = 3):
+        self.keyring.rotate(keep)
+        self.cipher = MultiFernet([Fernet(k) for k in self.keyring.keys])
+        self._shutdown_pool()  # Workers precisam das chaves novas
+        logger.info("🔑 Chave de criptografia rotacionada")
+
+    def reload_keys(self) -> bool:
+        """Adotar as chaves gravadas por outro worker (após rotate_key remoto)"""
+        if not self.keyring.reload():
+            return False
+        self.cipher = MultiFernet([Fernet(k) for k in self.keyring.keys])
+        self._shutdown_pool()
+        logger.info("🔑 Chaves de criptografia recarregadas do keyring")
+        return True
+
+    def reencrypt(self, token: str) -> str:
+        """Recriptografar token antigo com a chave ativa"""
+        return self.cipher.rotate(token.encode()).decode()
+
+    # ===== Registro único =====
+    def encrypt(self, data: str) -> str:
+        return self.cipher.encrypt(data.encode()).decode()
+
+    def decrypt(self, token: str) -> str:
+        try:
+            return self.cipher.decrypt(token.encode()).decode()
+        except InvalidToken:
+            # Token pode ter sido gerado com uma chave rotacionada em outro worker
+            if not self.reload_keys():
+                raise
+            return self.cipher.decrypt(token.encode()).decode()
+
+    # ===== Lotes =====
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: o fork de um processo com event loop e threads ativos não é seguro
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.keyring.keys,),
+            )
+        return self._pool
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def close(self):
+        self._shutdown_pool()
+
+    async def _map(self, func, local_func, items: List[bytes]) -> List[bytes]:
+        if len(items) <= INLINE_BATCH_LIMIT or self.workers <= 1:
+            return [local_func(item) for item in items]
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        chunks = [items[i:i + BATCH_CHUNK] for i in range(0, len(items), BATCH_CHUNK)]
+        results = await asyncio.gather(*[loop.run_in_executor(pool, func, chunk) for chunk in chunks])
+        return [item for chunk in results for item in chunk]
+
+    async def encrypt_batch(self, values: List[str]) -> List[str]:
+        tokens = await self._map(_encrypt_chunk, self.cipher.encrypt, [v.encode() for v in values])
+        return [t.decode() for t in tokens]
+
+    async def decrypt_batch(self, tokens: List[str]) -> List[str]:
+        try:
+            values = await self._map(_decrypt_chunk, self.cipher.decrypt, [t.encode() for t in tokens])
+        except InvalidToken:
+            if not self.reload_keys():
+                raise
+            values = await self._map(_decrypt_chunk, self.cipher.decrypt, [t.encode() for t in tokens])
+        return [v.decode() for v in values]
+
+    async def encrypt_records(self, records: List[Dict]) -> List[str]:
+        """Criptografar registros (ex.: telemetria em repouso) serializados em JSON"""
+        return await self.encrypt_batch([json.dumps(r, default=str) for r in records])
+
+    async def decrypt_records(self, tokens: List[str]) -> List[Dict]:
+        return [json.loads(v) for v in await self.decrypt_batch(tokens)]
+
+    # ===== HMAC =====
+    @staticmethod
+    def _normalize_signature(signature: Optional[str]) -> Optional[str]:
+        if not signature:
+            return None
+        signature = signature.strip()
+        if signature.startswith("sha256="):
+            signature = signature[len("sha256="):]
+        return signature.lower()
+
+    def sign(self, payload: bytes) -> str:
+        if self.hmac_secret is None:
+            raise RuntimeError("Segredo HMAC não configurado")
+        return hmac.new(self.hmac_secret, payload, hashlib.sha256).hexdigest()
+
+    async def verify(self, signature: Optional[str], payload: bytes) -> bool:
+        """Verificar HMAC-SHA256 de um corpo já lido (fora do loop se for grande)
+
+        Sem segredo configurado toda assinatura é rejeitada (fail closed).
+        """
+        expected_signature = self._normalize_signature(signature)
+        if expected_signature is None or self.hmac_secret is None:
+            return False
+        if len(payload) > 64 * 1024:
+            digest = await asyncio.to_thread(self.sign, payload)
+        else:
+            digest = self.sign(payload)
+        return hmac.compare_digest(digest, expected_signature)
+
+    async def read_verified(self, chunks: AsyncIterable[bytes], signature: Optional[str],
+                            max_size: int = MAX_WEBHOOK_BODY) -> Optional[bytes]:
+        """Ler o corpo em streaming calculando o HMAC incrementalmente
+
+        Retorna o corpo se a assinatura confere, ou None (assinatura ausente,
+        inválida, corpo acima de max_size ou segredo HMAC não configurado).
+        """
+        expected_signature = self._normalize_signature(signature)
+        if expected_signature is None or self.hmac_secret is None:
+            return None
+        mac = hmac.new(self.hmac_secret, digestmod=hashlib.sha256)
+        body = bytearray()
+        async for chunk in chunks:
+            if len(body) + len(chunk) > max_size:
+                return None
+            mac.update(chunk)
+            body += chunk
+        if not hmac.compare_digest(mac.hexdigest(), expected_signature):
+            return None
+        return bytes(body)
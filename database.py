@@ -1,6 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, JSON, insert
+from datetime import datetime
+from typing import Dict, List
 import os
 from dotenv import load_dotenv
 
@@ -33,6 +35,17 @@ async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+TELEMETRY_COLUMNS = {c.name for c in TelemetryDB.__table__.columns} - {"id", "created_at"}
+
+async def bulk_insert_telemetry(rows: List[Dict]):
+    """Inserir lote de leituras de telemetria em uma única instrução"""
+    if not rows:
+        return
+    values = [{k: v for k, v in row.items() if k in TELEMETRY_COLUMNS} for row in rows]
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(TelemetryDB), values)
+        await session.commit()
+
 async def get_db() -> AsyncSession:
     """Obter sessão do banco de dados"""
     async with AsyncSessionLocal() as session:
@@ -0,0 +1,403 @@
+import asyncio
+import logging
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEVICE_OFFLINE_AFTER = float(os.getenv("NEXUS_DEVICE_OFFLINE_AFTER", "60"))
+REGISTRY_KEY = "devices"
+
+ONLINE, OFFLINE = 1, 0
+INDEXED_FIELDS = ("location", "type", "firmware_version")
+
+
+def _epoch(value) -> Optional[float]:
+    """last_seen (datetime UTC ingênuo, ISO ou epoch) em segundos"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+class TimingWheel:
+    """Timing wheel hierárquico: inserção O(1) e expiração sem varrer todos os timers
+
+    O nível 0 tem um slot por tick; cada nível seguinte cobre a volta
+    inteira do anterior. Quando um nível inferior completa a volta, o slot
+    correspondente do nível acima é redistribuído (cascata).
+    """
+
+    def __init__(self, tick: float = 1.0, sizes: tuple = (256, 64, 64, 64), start: Optional[float] = None):
+        self.tick = tick
+        self.sizes = sizes
+        self.spans = [1]
+        for size in sizes[:-1]:
+            self.spans.append(self.spans[-1] * size)
+        self.levels = [[[] for _ in range(size)] for size in sizes]
+        self.current = int((start if start is not None else time.time()) / tick)
+        self.count = 0
+
+    def add(self, item, deadline: float):
+        self.count += 1
+        self._place(max(int(deadline / self.tick), self.current + 1), item)
+
+    def _place(self, t: int, item):
+        delta = t - self.current
+        for level, (span, size) in enumerate(zip(self.spans, self.sizes)):
+            if delta < span * size or level == len(self.sizes) - 1:
+                # Além do horizonte: fica no último slot alcançável e é reagendado na cascata
+                slot_t = min(t, self.current + span * size - 1)
+                self.levels[level][(slot_t // span) % size].append((t, item))
+                return
+
+    def advance(self, now: float) -> List:
+        """Avançar até now e retornar os itens expirados"""
+        target = int(now / self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            # Cascata do nível mais alto para o mais baixo
+            for level in range(len(self.sizes) - 1, 0, -1):
+                span = self.spans[level]
+                if self.current % span == 0:
+                    slot = (self.current // span) % self.sizes[level]
+                    bucket, self.levels[level][slot] = self.levels[level][slot], []
+                    for t, item in bucket:
+                        self._place(max(t, self.current), item)
+            slot = self.current % self.sizes[0]
+            bucket, self.levels[0][slot] = self.levels[0][slot], []
+            for t, item in bucket:
+                if t <= self.current:
+                    expired.append(item)
+                else:
+                    self._place(t, item)
+        self.count -= len(expired)
+        return expired
+
+
+class DeviceRegistry:
+    """Registro de dispositivos com índices secundários e detecção de offline
+
+    Busca por ID em O(1) (dict id -> slot); last_seen e status ficam em
+    arrays compactos indexados pelo slot, então atualizar o last_seen a
+    cada leitura não aloca objetos. Índices por localização, tipo e
+    firmware mapeiam valor -> conjunto de IDs.
+
+    Cada dispositivo online tem no máximo um timer no timing wheel. Ao
+    expirar, o timer confere o last_seen: se houve leitura recente, é
+    reagendado; senão o dispositivo vira offline. Leituras nunca mexem no
+    wheel, e não há varredura periódica de todos os dispositivos.
+
+    Em cluster (attach_cluster), cada dispositivo vive só no worker dono.
+    """
+
+    def __init__(self, offline_after: float = DEVICE_OFFLINE_AFTER, tick: float = 1.0,
+                 on_status_change: Optional[Callable[[str, str, Dict], None]] = None):
+        self.offline_after = offline_after
+        self.on_status_change = on_status_change
+        self.wheel = TimingWheel(tick=tick)
+        self._slots: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._records: List[Optional[Dict]] = []
+        self._free: List[int] = []
+        self._last_seen = array("d")
+        self._status = bytearray()
+        self._armed = bytearray()
+        self.indexes: Dict[str, Dict[str, Set[str]]] = {field: {} for field in INDEXED_FIELDS}
+        self._task: Optional[asyncio.Task] = None
+        self.cluster = None
+        self._dirty: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._handover: List[Dict] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._slots
+
+    # ===== Cadastro =====
+    def register(self, device) -> int:
+        """Cadastrar ou atualizar um dispositivo (models.Device ou dict com "id")"""
+        record = device.dict() if hasattr(device, "dict") else dict(device)
+        device_id = record["id"]
+        last_seen = record.pop("last_seen", None)
+        record.pop("status", None)
+        slot = self._slots.get(device_id)
+        if slot is not None:
+            self._unindex(device_id, self._records[slot])
+        else:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._ids)
+                self._ids.append(None)
+                self._records.append(None)
+                self._last_seen.append(0.0)
+                self._status.append(OFFLINE)
+                self._armed.append(0)
+            self._slots[device_id] = slot
+            self._ids[slot] = device_id
+            last_seen = _epoch(last_seen)
+            self._last_seen[slot] = last_seen if last_seen is not None else time.time()
+            self._set_online(slot)
+        self._records[slot] = record
+        self._index(device_id, record)
+        self._mark(device_id)
+        return slot
+
+    def unregister(self, device_id: str):
+        slot = self._slots.pop(device_id, None)
+        if slot is None:
+            return
+        self._unindex(device_id, self._records[slot])
+        self._ids[slot] = None
+        self._records[slot] = None
+        self._status[slot] = OFFLINE
+        self._free.append(slot)  # O timer pendente (se houver) é descartado ao expirar
+        if self.cluster is not None:
+            self._dirty.discard(device_id)
+            self._removed.add(device_id)
+
+    def update(self, device_id: str, **fields):
+        """Atualizar campos (ex.: firmware_version) mantendo os índices"""
+        slot = self._slots[device_id]
+        record = self._records[slot]
+        self._unindex(device_id, record)
+        record.update(fields)
+        self._index(device_id, record)
+        self._mark(device_id)
+
+    def _mark(self, device_id: str):
+        if self.cluster is not None:
+            self._dirty.add(device_id)
+            self._removed.discard(device_id)
+
+    def _index(self, device_id: str, record: Dict):
+        for field in INDEXED_FIELDS:
+            value = record.get(field)
+            if value is not None:
+                self.indexes[field].setdefault(value, set()).add(device_id)
+
+    def _unindex(self, device_id: str, record: Dict):
+        for field in INDEXED_FIELDS:
+            members = self.indexes[field].get(record.get(field))
+            if members is not None:
+                members.discard(device_id)
+                if not members:
+                    del self.indexes[field][record.get(field)]
+
+    # ===== Caminho quente =====
+    def touch(self, device_id: str, now: Optional[float] = None):
+        """Registrar leitura do dispositivo (cadastra automaticamente IDs desconhecidos)"""
+        now = now if now is not None else time.time()
+        slot = self._slots.get(device_id)
+        if slot is None:
+            slot = self.register({"id": device_id, "last_seen": now})
+        self._last_seen[slot] = now
+        if self.cluster is not None:
+            self._dirty.add(device_id)
+        if not self._status[slot]:
+            self._set_online(slot)
+
+    def _set_online(self, slot: int):
+        was_registered = self._records[slot] is not None
+        self._status[slot] = ONLINE
+        if not self._armed[slot]:
+            self._armed[slot] = 1
+            self.wheel.add(slot, self._last_seen[slot] + self.offline_after)
+        if was_registered:
+            self._mark(self._ids[slot])
+            self._notify(slot, "online")
+
+    # ===== Detecção de offline =====
+    def check_offline(self, now: Optional[float] = None) -> List[str]:
+        """Processar timers vencidos; retorna os IDs que ficaram offline"""
+        now = now if now is not None else time.time()
+        went_offline = []
+        for slot in self.wheel.advance(now):
+            if self._ids[slot] is None or not self._status[slot]:
+                self._armed[slot] = 0
+                continue
+            if self.cluster is not None and not self.cluster.owns(self._ids[slot]):
+                # O anel mudou: o novo dono assume o dispositivo (e o alerta, se for o caso)
+                device_id = self._ids[slot]
+                self._handover.append(self.get(device_id))
+                self._armed[slot] = 0
+                self.unregister(device_id)
+                self._removed.discard(device_id)
+                continue
+            deadline = self._last_seen[slot] + self.offline_after
+            if deadline > now:
+                self.wheel.add(slot, deadline)
+                continue
+            self._armed[slot] = 0
+            self._status[slot] = OFFLINE
+            self._mark(self._ids[slot])
+            went_offline.append(self._ids[slot])
+            self._notify(slot, "offline")
+        return went_offline
+
+    def _notify(self, slot: int, status: str):
+        if self.on_status_change is not None:
+            try:
+                self.on_status_change(self._ids[slot], status, self.get(self._ids[slot]))
+            except Exception as e:
+                logger.error(f"Erro no callback de status do dispositivo: {e}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            went_offline = self.check_offline()
+            if went_offline:
+                logger.warning(f"📴 {len(went_offline)} dispositivo(s) offline")
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar registro de dispositivos: {e}")
+
+    # ===== Cluster =====
+    def attach_cluster(self, cluster):
+        """Particionar o registro pelo mesmo anel da ingestão
+
+        Só o worker dono cadastra o dispositivo e arma o timer de offline;
+        leituras e cadastros recebidos em outro worker são encaminhados a
+        ele. O dono espelha cadastro, status e last_seen no hash "devices"
+        do broker a cada tick, e é esse hash que as consultas leem.
+        """
+        self.cluster = cluster
+        self._dirty.update(self._slots)
+        cluster.subscribe_owned("registry", self._on_remote)
+
+    async def _on_remote(self, message: Dict):
+        if message.get("op") == "register":
+            self.register(message["device"])
+        elif message.get("op") == "touch":
+            for device_id in message["device_ids"]:
+                self.touch(device_id, message["timestamp"])
+
+    def _owner(self, device_id: str) -> Optional[str]:
+        """Worker dono, ou None se o dispositivo é deste worker"""
+        if self.cluster is None or self.cluster.owns(device_id):
+            return None
+        return self.cluster.owner(device_id)
+
+    async def register_routed(self, device) -> Dict:
+        """Cadastrar no worker dono e publicar o registro para as consultas"""
+        record = device.dict() if hasattr(device, "dict") else dict(device)
+        if self._owner(record["id"]) is None:
+            self.register(record)
+            view = self.get(record["id"])
+        else:
+            await self.cluster.send_to_owner(record["id"], "registry", {"op": "register", "device": record})
+            view = {**record, "status": "online", "last_seen": record.get("last_seen") or datetime.utcnow()}
+        if self.cluster is not None:
+            await self.cluster.broker.hset(REGISTRY_KEY, record["id"], view)
+        return view
+
+    async def touch_routed(self, device_ids: List[str], now: Optional[float] = None):
+        """touch de um lote: dispositivos deste worker localmente, os demais num envio por dono"""
+        now = now if now is not None else time.time()
+        remote: Dict[str, Set[str]] = {}
+        for device_id in device_ids:
+            owner = self._owner(device_id)
+            if owner is None:
+                self.touch(device_id, now)
+            else:
+                remote.setdefault(owner, set()).add(device_id)
+        for owner, ids in remote.items():
+            await self.cluster.send_to_worker(owner, "registry", {"op": "touch", "device_ids": sorted(ids),
+                                                                   "timestamp": now})
+
+    async def sync(self):
+        """Espelhar no broker o que mudou desde a última sincronização"""
+        if self.cluster is None:
+            return
+        dirty, self._dirty = self._dirty, set()
+        removed, self._removed = self._removed, set()
+        handover, self._handover = self._handover, []
+        try:
+            await self.cluster.broker.hset_many(REGISTRY_KEY, {d: self.get(d) for d in dirty if d in self._slots})
+            for device_id in removed:
+                await self.cluster.broker.hdel(REGISTRY_KEY, device_id)
+            for device in handover:
+                await self.cluster.send_to_owner(device["id"], "registry", {"op": "register", "device": device})
+        except Exception:
+            self._dirty |= dirty
+            self._removed |= removed
+            self._handover.extend(handover)
+            raise
+
+    # ===== Consultas =====
+    def get(self, device_id: str) -> Optional[Dict]:
+        slot = self._slots.get(device_id)
+        if slot is None:
+            return None
+        return {
+            **self._records[slot],
+            "status": "online" if self._status[slot] else "offline",
+            "last_seen": datetime.utcfromtimestamp(self._last_seen[slot]),
+        }
+
+    async def get_routed(self, device_id: str) -> Optional[Dict]:
+        """Dispositivo de qualquer worker (local se for deste, senão pelo broker)"""
+        if self._owner(device_id) is None and device_id in self._slots:
+            return self.get(device_id)
+        if self.cluster is None:
+            return None
+        return await self.cluster.broker.hget(REGISTRY_KEY, device_id)
+
+    async def query_routed(self, location: Optional[str] = None, type: Optional[str] = None,
+                           firmware_version: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        """Consulta sobre o cluster inteiro (hash do broker); sem cluster usa os índices locais"""
+        if self.cluster is None:
+            return [self.get(d) for d in self.query(location, type, firmware_version, status)]
+        filters = [(f, v) for f, v in (("location", location), ("type", type),
+                                       ("firmware_version", firmware_version), ("status", status)) if v is not None]
+        records = await self.cluster.broker.hgetall(REGISTRY_KEY)
+        return [records[d] for d in sorted(records) if all(records[d].get(f) == v for f, v in filters)]
+
+    def last_seen(self, device_id: str) -> Optional[float]:
+        slot = self._slots.get(device_id)
+        return self._last_seen[slot] if slot is not None else None
+
+    def is_online(self, device_id: str) -> bool:
+        slot = self._slots.get(device_id)
+        return slot is not None and bool(self._status[slot])
+
+    def query(self, location: Optional[str] = None, type: Optional[str] = None,
+              firmware_version: Optional[str] = None, status: Optional[str] = None) -> List[str]:
+        """IDs que atendem a todos os filtros (interseção a partir do menor índice)"""
+        filters = [(f, v) for f, v in (("location", location), ("type", type),
+                                       ("firmware_version", firmware_version)) if v is not None]
+        if filters:
+            sets = sorted((self.indexes[f].get(v, set()) for f, v in filters), key=len)
+            result = set(sets[0]).intersection(*sets[1:])
+        else:
+            result = self._slots.keys()
+        if status is not None:
+            wanted = ONLINE if status == "online" else OFFLINE
+            result = [d for d in result if self._status[self._slots[d]] == wanted]
+        return sorted(result)
+
+    def stats(self) -> Dict:
+        online = sum(self._status[slot] for slot in self._slots.values())
+        return {"devices": len(self._slots), "online": online, "offline": len(self._slots) - online,
+                "pending_timers": self.wheel.count}
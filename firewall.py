@@ -0,0 +1,241 @@
+import ipaddress
+import socket
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Faixas tratadas como privadas (equivalente a ipaddress.is_private)
+PRIVATE_NETWORKS = [
+    "0.0.0.0/8", "10.0.0.0/8", "127.0.0.0/8", "169.254.0.0/16", "172.16.0.0/12",
+    "192.0.0.0/29", "192.0.0.170/31", "192.0.2.0/24", "192.168.0.0/16", "198.18.0.0/15",
+    "198.51.100.0/24", "203.0.113.0/24", "240.0.0.0/4", "255.255.255.255/32",
+    "::1/128", "::/128", "::ffff:0:0/96", "100::/64", "2001::/23", "2001:db8::/32",
+    "2001:10::/28", "fc00::/7", "fe80::/10",
+]
+
+ALLOW = "allow"
+BLOCK = "block"
+INVALID = "invalid"
+DEFAULT = "default"
+
+
+def parse_ports(spec) -> Optional[Tuple[frozenset, Tuple[Tuple[int, int], ...]]]:
+    """Converter "443,8080" / "1000-2000" / "*" em (portas, faixas); None = qualquer porta"""
+    if spec is None or str(spec).strip() in ("", "*"):
+        return None
+    singles, ranges = set(), []
+    for part in str(spec).split(","):
+        part = part.strip()
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            ranges.append((int(lo), int(hi)))
+        elif part:
+            singles.add(int(part))
+    return frozenset(singles), tuple(ranges)
+
+
+class FirewallRule:
+    __slots__ = ("action", "network", "ports", "order")
+
+    def __init__(self, action: str, network, ports, order: int):
+        self.action = action
+        self.network = network
+        self.ports = ports
+        self.order = order
+
+    def matches_port(self, port: Optional[int]) -> bool:
+        if self.ports is None or port is None:
+            return True
+        singles, ranges = self.ports
+        return port in singles or any(lo <= port <= hi for lo, hi in ranges)
+
+    def to_dict(self) -> Dict:
+        return {"rule": self.action, "ip_range": str(self.network), "order": self.order}
+
+
+class PrefixTable:
+    """Tabela de prefixos de uma família de endereços
+
+    Um dicionário por comprimento de prefixo (chave = bits de rede); a busca
+    faz uma consulta O(1) por comprimento distinto presente nas regras, em
+    vez de percorrer todas as regras.
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.tables: Dict[int, Dict[int, List[FirewallRule]]] = {}
+        self.lengths: List[int] = []
+        self._vector: Optional[List] = None
+
+    def add(self, rule: FirewallRule):
+        length = rule.network.prefixlen
+        table = self.tables.setdefault(length, {})
+        key = int(rule.network.network_address) >> (self.bits - length)
+        bucket = table.setdefault(key, [])
+        bucket.append(rule)
+        bucket.sort(key=lambda r: r.order)
+        self.lengths = sorted(self.tables, reverse=True)
+        self._vector = None
+
+    def lookup(self, address: int, port: Optional[int]) -> Optional[FirewallRule]:
+        best = None
+        for length in self.lengths:
+            bucket = self.tables[length].get(address >> (self.bits - length))
+            if not bucket:
+                continue
+            for rule in bucket:
+                if best is not None and rule.order >= best.order:
+                    break
+                if rule.matches_port(port):
+                    best = rule
+                    break
+        return best
+
+    def vector_index(self):
+        """Por comprimento: arrays (chaves, ordens) de todas as regras, ordenados por (chave, ordem)
+
+        Independe da porta (montado uma vez por compilação); o filtro de
+        porta é aplicado na consulta.
+        """
+        if self._vector is None:
+            index = []
+            for length in self.lengths:
+                pairs = sorted((key, rule.order) for key, bucket in self.tables[length].items() for rule in bucket)
+                index.append((length, np.array([k for k, _ in pairs], dtype=np.uint64),
+                              np.array([o for _, o in pairs], dtype=np.int64)))
+            self._vector = index
+        return self._vector
+
+
+def _parse_address(ip: str) -> Tuple[int, int]:
+    """(versão, inteiro) sem construir objetos ipaddress"""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+
+
+class CompiledRuleSet:
+    """Conjunto de regras compilado e imutável (primeira regra na ordem vence)"""
+
+    def __init__(self, rules: Iterable[Dict], trust_private: bool = True):
+        self.rules: List[FirewallRule] = []
+        self.v4 = PrefixTable(32)
+        self.v6 = PrefixTable(128)
+        order = 0
+        if trust_private:
+            # IPs privados são liberados antes de qualquer regra
+            for cidr in PRIVATE_NETWORKS:
+                self._add(ALLOW, cidr, None, order)
+                order += 1
+        self.private_rules = order
+        for rule in rules:
+            self._add(rule["rule"], rule["ip_range"], parse_ports(rule.get("port")), order)
+            order += 1
+        self._compile_ports()
+
+    def _compile_ports(self):
+        """Portas de cada regra como faixas [lo, hi] numa matriz (regra x faixa) para o filtro vetorizado"""
+        ranges = [[(p, p) for p in sorted(rule.ports[0])] + list(rule.ports[1]) if rule.ports is not None else []
+                  for rule in self.rules]
+        width = max((len(r) for r in ranges), default=0) or 1
+        self._any_port = np.array([rule.ports is None for rule in self.rules], dtype=bool)
+        self._port_lo = np.ones((len(self.rules), width), dtype=np.int64)
+        self._port_hi = np.zeros((len(self.rules), width), dtype=np.int64)  # lo > hi: faixa vazia
+        for i, rule_ranges in enumerate(ranges):
+            for j, (lo, hi) in enumerate(rule_ranges):
+                self._port_lo[i, j], self._port_hi[i, j] = lo, hi
+
+    def _ports_match(self, orders: np.ndarray, ports: np.ndarray) -> np.ndarray:
+        """Regra orders[i] aceita a porta ports[i]? (-1 = sem porta: qualquer regra)"""
+        p = ports[:, None]
+        in_range = (self._port_lo[orders] <= p) & (p <= self._port_hi[orders])
+        return self._any_port[orders] | (ports < 0) | in_range.any(axis=1)
+
+    def _add(self, action: str, cidr: str, ports, order: int):
+        rule = FirewallRule(action, ipaddress.ip_network(cidr, strict=False), ports, order)
+        self.rules.append(rule)
+        (self.v4 if rule.network.version == 4 else self.v6).add(rule)
+
+    def __len__(self) -> int:
+        return len(self.rules) - self.private_rules
+
+    def match(self, ip: str, port: Optional[int] = None) -> Optional[FirewallRule]:
+        version, address = _parse_address(ip)
+        return (self.v4 if version == 4 else self.v6).lookup(address, port)
+
+    def classify(self, ip: str, port: Optional[int] = None) -> str:
+        try:
+            rule = self.match(ip, port)
+        except (OSError, ValueError, TypeError):
+            return INVALID
+        return rule.action if rule is not None else DEFAULT
+
+    def classify_batch(self, ips: List[str], port: Union[None, int, Sequence[Optional[int]]] = None) -> List[str]:
+        """Classificar um lote de IPs; IPv4 é resolvido de forma vetorizada
+
+        port pode ser uma porta para o lote todo ou uma lista com a porta de
+        cada IP (ex.: logs de varredura de portas), sem custo por porta distinta.
+        """
+        ports = list(port) if isinstance(port, (list, tuple)) else [port] * len(ips)
+        results = [DEFAULT] * len(ips)
+        v4_positions, v4_addresses = [], []
+        for i, ip in enumerate(ips):
+            try:
+                version, address = _parse_address(ip)
+            except (OSError, ValueError, TypeError):
+                results[i] = INVALID
+                continue
+            if version == 4:
+                v4_positions.append(i)
+                v4_addresses.append(address)
+            else:
+                rule = self.v6.lookup(address, ports[i])
+                if rule is not None:
+                    results[i] = rule.action
+        if v4_addresses:
+            v4_ports = np.array([ports[i] if ports[i] is not None else -1 for i in v4_positions], dtype=np.int64)
+            orders = self._vector_lookup_v4(np.array(v4_addresses, dtype=np.uint64), v4_ports)
+            for i, order in zip(v4_positions, orders.tolist()):
+                if order >= 0:
+                    results[i] = self.rules[order].action
+        return results
+
+    def _vector_lookup_v4(self, addresses: np.ndarray, ports: np.ndarray) -> np.ndarray:
+        no_match = np.iinfo(np.int64).max
+        best = np.full(len(addresses), no_match, dtype=np.int64)
+        for length, keys, orders in self.v4.vector_index():
+            probe = addresses >> np.uint64(32 - length)
+            lo = np.searchsorted(keys, probe, side="left")
+            hi = np.searchsorted(keys, probe, side="right")
+            # Regras da mesma chave em ordem crescente: a primeira que aceita a porta vence
+            pending = np.nonzero(lo < hi)[0]
+            offset = 0
+            while len(pending):
+                candidates = orders[lo[pending] + offset]
+                ok = self._ports_match(candidates, ports[pending])
+                hit = pending[ok]
+                best[hit] = np.minimum(best[hit], candidates[ok])
+                pending = pending[~ok]
+                offset += 1
+                pending = pending[lo[pending] + offset < hi[pending]]
+        best[best == no_match] = -1
+        return best
+
+
+class Firewall:
+    """Ponto de acesso às regras ativas; reload troca o conjunto compilado atomicamente"""
+
+    def __init__(self, rules: Iterable[Dict]):
+        self.ruleset = CompiledRuleSet(rules)
+
+    def reload(self, rules: Iterable[Dict]):
+        # Compilar fora do caminho de leitura e publicar com uma única atribuição
+        self.ruleset = CompiledRuleSet(rules)
+
+    def is_allowed(self, ip: str, port: Optional[int] = None) -> bool:
+        action = self.ruleset.classify(ip, port)
+        return action in (ALLOW, DEFAULT)
+
+    def check_batch(self, ips: List[str], port: Union[None, int, Sequence[Optional[int]]] = None) -> List[bool]:
+        return [action in (ALLOW, DEFAULT) for action in self.ruleset.classify_batch(ips, port)]
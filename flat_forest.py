@@ -0,0 +1,167 @@
+"""Isolation Forest achatado para score de lotes pequenos
+
+Limitação: a travessia achatada só é mais rápida que o score_samples do
+scikit-learn em lotes pequenos. Em lotes grandes (da ordem de 10 mil
+linhas, como nos backtests) ela perde: cada passo de profundidade percorre
+todas as árvores do bloco, enquanto o laço compilado do scikit-learn sai
+cedo das folhas rasas. Por isso isolation_scores usa o scikit-learn acima de
+FLAT_FOREST_MAX_ROWS (NEXUS_FLAT_FOREST_MAX_ROWS). Um worker que só tem o
+modelo achatado (mmap, sem o estimador original) usa a travessia achatada
+em qualquer tamanho e fica mais lento nesses lotes grandes.
+"""
+import json
+import logging
+import os
+from collections import deque
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FLAT_FOREST_DIR = "isolation_forest_flat"
+_ARRAYS = ("feature", "threshold", "left", "value", "roots")
+SCORE_CHUNK = 256  # Linhas por bloco na travessia (mantém os buffers no cache)
+# Acima disto o laço compilado do scikit-learn (uma árvore por vez) é mais rápido
+FLAT_FOREST_MAX_ROWS = int(os.getenv("NEXUS_FLAT_FOREST_MAX_ROWS", "4096"))
+_EULER_GAMMA = 0.5772156649015329
+
+
+def average_path_length(n: np.ndarray) -> np.ndarray:
+    """c(n): comprimento médio de caminho de busca sem sucesso em uma BST (igual ao scikit-learn)"""
+    n = np.asarray(n, dtype=np.float64)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    big = n > 2
+    result[big] = 2.0 * (np.log(n[big] - 1.0) + _EULER_GAMMA) - 2.0 * (n[big] - 1.0) / n[big]
+    return result
+
+
+def _float32_floor(threshold: np.ndarray) -> np.ndarray:
+    """Maior float32 <= threshold: para x float32, x <= t64 equivale a x <= t32"""
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+def isolation_scores(X: np.ndarray, flat_forest=None, isolation_forest=None,
+                     max_rows: int = FLAT_FOREST_MAX_ROWS) -> np.ndarray:
+    """score_samples pelo caminho mais rápido para o tamanho do lote
+
+    A travessia achatada não tem o custo fixo por chamada do scikit-learn e
+    vence com folga em lotes pequenos (leitura a leitura, lotes do Azure);
+    em lotes grandes (backtests) o scikit-learn é mais rápido. Os dois dão
+    o mesmo resultado, então a escolha é só de desempenho.
+    """
+    stock = isolation_forest is not None and hasattr(isolation_forest, "estimators_")
+    if flat_forest is not None and (len(X) <= max_rows or not stock):
+        return flat_forest.score_samples(X)
+    return isolation_forest.score_samples(X)
+
+
+class FlatIsolationForest:
+    """Isolation Forest achatado em arrays NumPy contíguos
+
+    Os nós de todas as árvores ficam em arrays globais, numerados de forma
+    que o filho direito é sempre left + 1. Folhas apontam para si mesmas
+    com threshold +inf e guardam em value a profundidade + c(amostras na
+    folha), então a travessia de todas as árvores para um bloco de linhas
+    é um laço de max_depth passos sem ramificação. Os arrays podem ser
+    mapeados em memória e compartilhados entre workers.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], max_depth: int, max_samples: int):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.max_depth = max_depth
+        self.max_samples = max_samples
+        self.denominator = len(self.roots) * float(average_path_length(np.array([max_samples]))[0])
+
+    @classmethod
+    def from_sklearn(cls, forest) -> "FlatIsolationForest":
+        feature, threshold, left, value, roots = [], [], [], [], []
+        max_depth = 0
+        for tree, features in zip(forest.estimators_, forest.estimators_features_):
+            t = tree.tree_
+            leaf_length = average_path_length(t.n_node_samples)
+            roots.append(len(feature))
+            position = {0: len(feature)}
+            feature.append(0), threshold.append(0.0), left.append(0), value.append(0.0)
+            queue = deque([(0, 0)])
+            while queue:  # BFS: filhos alocados em pares adjacentes
+                node, depth = queue.popleft()
+                p = position[node]
+                if t.children_left[node] < 0:
+                    threshold[p], left[p], value[p] = np.inf, p, depth + leaf_length[node]
+                    max_depth = max(max_depth, depth)
+                    continue
+                feature[p] = int(features[t.feature[node]])
+                threshold[p] = t.threshold[node]
+                left[p] = len(feature)
+                for child in (t.children_left[node], t.children_right[node]):
+                    position[child] = len(feature)
+                    feature.append(0), threshold.append(0.0), left.append(0), value.append(0.0)
+                    queue.append((child, depth + 1))
+
+        arrays = {
+            "feature": np.asarray(feature, dtype=np.intp),
+            "threshold": _float32_floor(np.asarray(threshold, dtype=np.float64)),
+            "left": np.asarray(left, dtype=np.intp),
+            "value": np.asarray(value, dtype=np.float64),
+            "roots": np.asarray(roots, dtype=np.intp),
+        }
+        return cls(arrays, max_depth, int(forest.max_samples_))
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Equivalente a IsolationForest.score_samples (quanto menor, mais anômalo)"""
+        # As árvores do scikit-learn comparam as features em float32
+        X = np.ascontiguousarray(np.atleast_2d(X), dtype=np.float32)
+        n_trees = len(self.roots)
+        depths = np.empty(len(X))
+        # Buffers reutilizados: np.take com out= evita alocação e conversão de índices
+        size = min(len(X), SCORE_CHUNK)
+        node = np.empty((size, n_trees), dtype=np.intp)
+        index = np.empty((size, n_trees), dtype=np.intp)
+        values = np.empty((size, n_trees), dtype=np.float32)
+        thresholds = np.empty((size, n_trees), dtype=np.float32)
+        go_right = np.empty((size, n_trees), dtype=bool)
+        for start in range(0, len(X), SCORE_CHUNK):
+            chunk = X[start:start + SCORE_CHUNK]
+            m = len(chunk)
+            flat = chunk.ravel()
+            row_offset = (np.arange(m, dtype=np.intp) * chunk.shape[1])[:, None]
+            nd, ix, xv, th, go = node[:m], index[:m], values[:m], thresholds[:m], go_right[:m]
+            nd[:] = self.roots
+            for _ in range(self.max_depth):
+                np.take(self.feature, nd, out=ix)
+                np.add(ix, row_offset, out=ix)
+                np.take(flat, ix, out=xv)
+                np.take(self.threshold, nd, out=th)
+                np.greater(xv, th, out=go)
+                np.take(self.left, nd, out=nd)
+                np.add(nd, go, out=nd)
+            depths[start:start + m] = np.take(self.value, nd).sum(axis=1)
+        return -np.exp2(-depths / self.denominator)
+
+    # ===== Persistência (mmap) =====
+    def save(self, directory: str):
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        with open(path / "meta.json", "w") as f:
+            json.dump({"max_depth": self.max_depth, "max_samples": self.max_samples}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "FlatIsolationForest":
+        path = Path(directory)
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None) for name in _ARRAYS}
+        return cls(arrays, meta["max_depth"], meta["max_samples"])
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "meta.json"))
@@ -0,0 +1,358 @@
+"""Gerador de carga e simulação realista de telemetria
+
+Uso standalone (teste de capacidade):
+    python load_generator.py --devices 10000 --rate 20000 --duration 30 --sink direct
+    python load_generator.py --sink http --url http://localhost:8000/api/webhooks/azure
+
+--sink direct passa cada lote pelo pipeline em processo (validação, score
+do detector e compressão, sem banco); --sink null descarta os lotes e mede
+só o gerador.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import urllib.request
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ["temperature", "vibration", "rpm", "pressure", "power_consumption"]
+MQTT_TOPIC = "factory/plantA/device/{device_id}/telemetry"
+
+# Tipos de falha injetada
+FAULT_NONE, FAULT_BEARING, FAULT_OVERHEAT, FAULT_LEAK = 0, 1, 2, 3
+
+
+class FleetSimulator:
+    """Simulação vetorizada (NumPy) de uma frota de dispositivos
+
+    Cada dispositivo tem setpoints próprios, uma carga latente AR(1)
+    correlacionada com a carga da planta, desgaste que cresce lentamente,
+    falhas injetadas que evoluem ao longo do tempo (rolamento,
+    superaquecimento, vazamento) e rajadas de anomalias em parte da frota.
+    """
+
+    def __init__(
+        self,
+        devices: int = 1000,
+        fault_rate: float = 1e-4,
+        fault_duration: float = 300.0,
+        burst_rate: float = 1e-3,
+        burst_fraction: float = 0.05,
+        burst_duration: float = 10.0,
+        anomaly_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.rng = np.random.default_rng(seed)
+        n = devices
+        self.devices = n
+        self.device_ids = np.array([f"device_{i}" for i in range(n)], dtype=object)
+        self.fault_rate = fault_rate
+        self.fault_duration = fault_duration
+        self.burst_rate = burst_rate
+        self.burst_fraction = burst_fraction
+        self.burst_duration = burst_duration
+        self.anomaly_rate = anomaly_rate
+
+        self.rpm_setpoint = self.rng.normal(1500, 30, n)
+        self.temp_base = self.rng.normal(68, 2, n)
+        self.pressure_base = self.rng.normal(100, 5, n)
+        self.load = np.zeros(n)
+        self.wear = self.rng.uniform(0, 0.2, n)
+        self.fault = np.zeros(n, dtype=np.int8)
+        self.fault_age = np.zeros(n)
+        self.burst_until = np.zeros(n)
+        self.plant_load = 0.0
+        self.clock = 0.0
+
+    def step(self, idx: np.ndarray, dt: float) -> Dict[str, np.ndarray]:
+        """Avançar e amostrar os dispositivos em idx; retorna colunas NumPy
+
+        dt é o tempo decorrido desde a amostra anterior de cada dispositivo.
+        """
+        rng = self.rng
+        m = len(idx)
+        self.clock += dt * m / self.devices
+
+        # Carga da planta (compartilhada) e carga por dispositivo correlacionada
+        self.plant_load = 0.995 * self.plant_load + 0.05 * rng.normal()
+        self.load[idx] = 0.95 * self.load[idx] + 0.05 * rng.normal(size=m) + 0.02 * self.plant_load
+        self.wear[idx] = np.minimum(1.0, self.wear[idx] + dt * 1e-6)
+
+        # Início e evolução de falhas
+        healthy = self.fault[idx] == FAULT_NONE
+        starts = healthy & (rng.random(m) < self.fault_rate)
+        if starts.any():
+            self.fault[idx[starts]] = rng.integers(1, 4, starts.sum())
+            self.fault_age[idx[starts]] = 0.0
+        faulty = ~healthy | starts
+        self.fault_age[idx[faulty]] += dt
+        repaired = faulty & (self.fault_age[idx] > self.fault_duration)
+        if repaired.any():
+            self.fault[idx[repaired]] = FAULT_NONE
+            self.wear[idx[repaired]] = 0.0
+
+        # Rajadas de anomalias em uma fração aleatória da frota
+        if rng.random() < self.burst_rate:
+            hit = rng.random(self.devices) < self.burst_fraction
+            self.burst_until[hit] = self.clock + self.burst_duration
+
+        fault = self.fault[idx]
+        severity = np.minimum(self.fault_age[idx] / (self.fault_duration / 3), 1.0)
+        load = self.load[idx]
+        wear = self.wear[idx]
+
+        rpm = self.rpm_setpoint[idx] * (1 + 0.02 * load) + rng.normal(0, 10, m)
+        temperature = self.temp_base[idx] + 8 * load + 10 * wear + rng.normal(0, 1.0, m)
+        vibration = 0.02 * (1 + wear) + rng.normal(0, 0.002, m)
+        pressure = self.pressure_base[idx] + 3 * load + rng.normal(0, 2, m)
+
+        bearing = fault == FAULT_BEARING
+        vibration += bearing * 0.04 * severity
+        temperature += bearing * 5 * severity
+        temperature += (fault == FAULT_OVERHEAT) * 25 * severity
+        pressure -= (fault == FAULT_LEAK) * 30 * severity
+
+        burst = self.burst_until[idx] > self.clock
+        vibration = np.where(burst, vibration * 4, vibration)
+        point = rng.random(m) < self.anomaly_rate
+        vibration = np.where(point, vibration * 5, vibration)
+
+        power = 2.4 * (rpm / 1500) * (1 + 0.2 * load) + 0.5 * wear + rng.normal(0, 0.05, m)
+
+        return {
+            "device_id": self.device_ids[idx],
+            "temperature": np.round(temperature, 2),
+            "vibration": np.round(np.clip(vibration, 0, 1), 4),
+            "rpm": np.clip(rpm, 0, 10000).astype(np.int64),
+            "pressure": np.round(pressure, 2),
+            "power_consumption": np.round(np.maximum(power, 0), 3),
+            "label": (fault != FAULT_NONE) | burst | point,
+        }
+
+    @staticmethod
+    def to_records(columns: Dict[str, np.ndarray], timestamp: Optional[str] = None) -> List[Dict]:
+        timestamp = timestamp or datetime.utcnow().isoformat()
+        keys = ["device_id"] + FEATURES
+        rows = zip(*(columns[k].tolist() for k in keys))
+        return [dict(zip(keys, row), timestamp=timestamp) for row in rows]
+
+
+# ===== Destinos =====
+class DirectSink:
+    """Entrega os lotes diretamente a um handler async do pipeline"""
+
+    def __init__(self, handler: Callable[[List[Dict]], Awaitable[None]]):
+        self.handler = handler
+
+    async def send(self, records: List[Dict]):
+        await self.handler(records)
+
+
+class MQTTMessage:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+
+
+class LocalMQTTBroker:
+    """Broker MQTT em memória (substituto local) com wildcards + e #
+
+    Os callbacks seguem a assinatura do paho (client, userdata, msg), então
+    mqtt_client.on_message pode ser registrado diretamente.
+    """
+
+    def __init__(self):
+        self.subscriptions: List[tuple] = []
+        self.published = 0
+
+    def subscribe(self, pattern: str, callback: Callable):
+        self.subscriptions.append((pattern.split("/"), callback))
+
+    @staticmethod
+    def _matches(pattern: List[str], topic: List[str]) -> bool:
+        for i, part in enumerate(pattern):
+            if part == "#":
+                return True
+            if i >= len(topic) or (part != "+" and part != topic[i]):
+                return False
+        return len(pattern) == len(topic)
+
+    def publish(self, topic: str, payload: bytes):
+        self.published += 1
+        parts = topic.split("/")
+        message = MQTTMessage(topic, payload)
+        for pattern, callback in self.subscriptions:
+            if self._matches(pattern, parts):
+                callback(None, None, message)
+
+
+class MQTTSink:
+    """Publica cada leitura em um broker MQTT (paho ou LocalMQTTBroker)"""
+
+    def __init__(self, broker, topic: str = MQTT_TOPIC):
+        self.broker = broker
+        self.topic = topic
+
+    async def send(self, records: List[Dict]):
+        for record in records:
+            self.broker.publish(self.topic.format(device_id=record["device_id"]), json.dumps(record).encode())
+
+
+class HTTPBatchSink:
+    """Envia lotes ao endpoint de ingestão em lote (webhook Azure), assinados com HMAC"""
+
+    def __init__(self, url: str, secret: str, batch_size: int = 1000):
+        self.url = url
+        self.secret = secret.encode()
+        self.batch_size = batch_size
+        self.errors = 0
+
+    def _post(self, body: bytes):
+        signature = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        request = urllib.request.Request(
+            self.url, data=body, method="POST",
+            headers={"Content-Type": "application/json", "X-Signature": signature},
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+    async def send(self, records: List[Dict]):
+        for i in range(0, len(records), self.batch_size):
+            messages = [
+                {
+                    "messageId": uuid.uuid4().hex,
+                    "systemProperties": {"iothub-connection-device-id": r["device_id"]},
+                    "body": r,
+                }
+                for r in records[i:i + self.batch_size]
+            ]
+            try:
+                await asyncio.to_thread(self._post, json.dumps({"data": messages}).encode())
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Erro ao enviar lote: {e}")
+
+
+class LoadGenerator:
+    """Gera leituras na taxa alvo e mede a taxa efetivamente alcançada"""
+
+    def __init__(self, simulator: FleetSimulator, sink, rate: float, tick: float = 0.1):
+        self.simulator = simulator
+        self.sink = sink
+        self.rate = rate
+        self.tick = tick
+        self._cursor = 0
+
+    async def run(self, duration: Optional[float] = None, count: Optional[int] = None) -> Dict:
+        if duration is None and count is None:
+            raise ValueError("Informe duration ou count")
+        sent = labeled = 0
+        carry = 0.0
+        max_lag = 0.0
+        started = time.perf_counter()
+        next_tick = started
+        while True:
+            elapsed = time.perf_counter() - started
+            if (duration is not None and elapsed >= duration) or (count is not None and sent >= count):
+                break
+            carry += self.rate * self.tick
+            n = int(carry)
+            carry -= n
+            if count is not None:
+                n = min(n, count - sent)
+            if n:
+                # Round-robin sobre a frota: cada tick amostra os próximos n dispositivos
+                idx = (self._cursor + np.arange(n)) % self.simulator.devices
+                self._cursor = int((self._cursor + n) % self.simulator.devices)
+                columns = self.simulator.step(idx, self.simulator.devices / self.rate)
+                labeled += int(columns["label"].sum())
+                await self.sink.send(self.simulator.to_records(columns))
+                sent += n
+            next_tick += self.tick
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+                await asyncio.sleep(0)
+        elapsed = time.perf_counter() - started
+        report = {
+            "target_rate": self.rate,
+            "achieved_rate": round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+            "sent": sent,
+            "labeled_anomalies": labeled,
+            "elapsed_seconds": round(elapsed, 3),
+            "max_lag_seconds": round(max_lag, 3),
+        }
+        logger.info(f"📈 Carga: {report['achieved_rate']}/{self.rate} leituras/s ({sent} enviadas)")
+        return report
+
+
+async def _pipeline_sink() -> tuple:
+    """DirectSink que processa os lotes como o consumidor do Azure (sem persistência)"""
+    from anomaly_detection import AnomalyDetector
+    from azure_ingest import AzureIngestConsumer
+    from compression import TelemetryCompressor
+
+    detector = AnomalyDetector()
+    await detector.load_model()
+    consumer = AzureIngestConsumer(detector, compressor=TelemetryCompressor())
+    counts = {"processed": 0, "stored": 0}
+
+    async def process(records: List[Dict]):
+        batch = [(uuid.uuid4().hex, {"body": r}) for r in records]
+        counts["processed"] += len(await consumer.process_batch(batch))
+        counts["stored"] = consumer.compressor.stats["stored"]
+
+    return DirectSink(process), counts
+
+
+async def _main(args):
+    simulator = FleetSimulator(devices=args.devices, anomaly_rate=args.anomaly_rate, seed=args.seed)
+    counts = {}
+    if args.sink == "http":
+        sink = HTTPBatchSink(args.url, os.getenv("NEXUS_WEBHOOK_SECRET", args.secret))
+    elif args.sink == "mqtt":
+        broker = LocalMQTTBroker()
+        counts["received"] = 0
+
+        def on_message(client, userdata, msg):
+            counts["received"] += 1
+
+        broker.subscribe("factory/plantA/device/+/telemetry", on_message)
+        sink = MQTTSink(broker)
+    elif args.sink == "direct":
+        sink, counts = await _pipeline_sink()
+    else:
+        async def discard(records):
+            return None
+        sink = DirectSink(discard)
+    report = await LoadGenerator(simulator, sink, rate=args.rate, tick=args.tick).run(duration=args.duration)
+    print(json.dumps({**report, **counts}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerador de carga de telemetria")
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=10000, help="leituras por segundo")
+    parser.add_argument("--duration", type=float, default=10, help="segundos")
+    parser.add_argument("--tick", type=float, default=0.1)
+    parser.add_argument("--anomaly-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sink", choices=["direct", "mqtt", "http", "null"], default="direct")
+    parser.add_argument("--url", default="http://localhost:8000/api/webhooks/azure")
+    parser.add_argument("--secret", default="your-super-secret-key-2025-digital-factory")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
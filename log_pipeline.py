@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = int(os.getenv("NEXUS_LOG_QUEUE_SIZE", "1000"))
+LOG_BATCH_SIZE = 5000
+
+FAILED_ACTIONS = {"failure", "failed", "fail", "denied", "login_failed"}
+IP_FIELDS = ("src_ip", "src", "source_ip", "clientip", "client_ip")
+PORT_FIELDS = ("dest_port", "dst_port", "port")
+
+
+class WindowCounter:
+    """Contador em janela deslizante por chave, com buckets de tempo fixos
+
+    Memória O(buckets) por chave; chaves ociosas são despejadas e o número
+    total de chaves é limitado (as mais antigas saem primeiro).
+    """
+
+    def __init__(self, window: float, buckets: int = 6, max_keys: int = 100000):
+        self.window = window
+        self.width = window / buckets
+        self.buckets = buckets
+        self.max_keys = max_keys
+        self.keys: Dict[str, list] = {}  # chave -> [contagens, último bucket, total]
+
+    def add(self, key: str, t: float, amount: int = 1) -> int:
+        bucket = int(t // self.width)
+        entry = self.keys.get(key)
+        if entry is None:
+            if len(self.keys) >= self.max_keys:
+                self.evict(t)
+            entry = self.keys[key] = [[0] * self.buckets, bucket, 0]
+        counts, last, total = entry
+        if bucket > last:
+            for step in range(1, min(bucket - last, self.buckets) + 1):
+                idx = (last + step) % self.buckets
+                total -= counts[idx]
+                counts[idx] = 0
+            entry[1] = bucket
+        elif bucket <= last - self.buckets:
+            return total  # Evento mais antigo que a janela
+        counts[bucket % self.buckets] += amount
+        entry[2] = total + amount
+        return entry[2]
+
+    def evict(self, now: float):
+        current = int(now // self.width)
+        self.keys = {k: v for k, v in self.keys.items() if v[1] > current - self.buckets}
+        while len(self.keys) >= self.max_keys:
+            del self.keys[next(iter(self.keys))]
+
+
+class DistinctWindow:
+    """Valores distintos por chave em janela fixa, limitado a cap valores por chave"""
+
+    def __init__(self, window: float, cap: int, max_keys: int = 100000):
+        self.window = window
+        self.cap = cap
+        self.max_keys = max_keys
+        self.keys: Dict[str, tuple] = {}
+
+    def add(self, key: str, value, t: float) -> int:
+        window_id = int(t // self.window)
+        entry = self.keys.get(key)
+        if entry is None or entry[0] != window_id:
+            if entry is None and len(self.keys) >= self.max_keys:
+                self.keys = {k: v for k, v in self.keys.items() if v[0] >= window_id - 1}
+                while len(self.keys) >= self.max_keys:
+                    del self.keys[next(iter(self.keys))]
+            entry = self.keys[key] = (window_id, set())
+        values = entry[1]
+        if len(values) < self.cap:
+            values.add(value)
+        return len(values)
+
+
+class CorrelationRule:
+    """Regra de correlação: observa eventos e retorna um achado quando dispara"""
+    name = "rule"
+    severity = "medium"
+
+    def __init__(self, window: float, threshold: int):
+        self.window = window
+        self.threshold = threshold
+        self._fired: Dict[str, float] = {}
+
+    def _cooldown(self, key: str, t: float) -> bool:
+        """Disparar no máximo uma vez por janela para a mesma chave"""
+        last = self._fired.get(key)
+        if last is not None and t - last < self.window:
+            return False
+        if len(self._fired) > 100000:
+            self._fired = {k: v for k, v in self._fired.items() if t - v < self.window}
+        self._fired[key] = t
+        return True
+
+    def observe(self, event: Dict) -> Optional[Dict]:
+        raise NotImplementedError
+
+
+class FailedLoginRule(CorrelationRule):
+    """N logins com falha do mesmo IP dentro da janela"""
+    name = "brute_force_login"
+    severity = "high"
+
+    def __init__(self, window: float = 60.0, threshold: int = 10):
+        super().__init__(window, threshold)
+        self.counter = WindowCounter(window)
+
+    def observe(self, event: Dict) -> Optional[Dict]:
+        if not event["failed"] or not event["ip"]:
+            return None
+        count = self.counter.add(event["ip"], event["time"])
+        if count >= self.threshold and self._cooldown(event["ip"], event["time"]):
+            return {"source_ip": event["ip"], "failed_logins": count, "window_seconds": self.window}
+        return None
+
+
+class PortScanRule(CorrelationRule):
+    """Um IP tocando muitas portas distintas dentro da janela"""
+    name = "port_scan"
+    severity = "high"
+
+    def __init__(self, window: float = 60.0, threshold: int = 20):
+        super().__init__(window, threshold)
+        self.distinct = DistinctWindow(window, cap=threshold)
+
+    def observe(self, event: Dict) -> Optional[Dict]:
+        if event["port"] is None or not event["ip"]:
+            return None
+        distinct = self.distinct.add(event["ip"], event["port"], event["time"])
+        if distinct >= self.threshold and self._cooldown(event["ip"], event["time"]):
+            return {"source_ip": event["ip"], "distinct_ports": distinct, "window_seconds": self.window}
+        return None
+
+
+class BlockedSourceRule(CorrelationRule):
+    """Atividade de IP bloqueado pelo firewall"""
+    name = "blocked_ip_activity"
+    severity = "medium"
+
+    def __init__(self, window: float = 300.0):
+        super().__init__(window, 1)
+
+    def observe(self, event: Dict) -> Optional[Dict]:
+        if event["allowed"] or not event["ip"]:
+            return None
+        if self._cooldown(event["ip"], event["time"]):
+            return {"source_ip": event["ip"], "port": event["port"]}
+        return None
+
+
+def iter_splunk_events(payload) -> Iterator[Dict]:
+    """Extrair eventos de um payload do Splunk (HEC, lista ou NDJSON) incrementalmente"""
+    if isinstance(payload, (bytes, str)):
+        text = payload.decode() if isinstance(payload, bytes) else payload
+        for line in text.splitlines():
+            line = line.strip()
+            if line:
+                try:
+                    yield from iter_splunk_events(json.loads(line))
+                except ValueError:
+                    continue
+        return
+    if isinstance(payload, list):
+        for item in payload:
+            yield from iter_splunk_events(item)
+        return
+    if not isinstance(payload, dict):
+        return
+    if "events" in payload:
+        yield from iter_splunk_events(payload["events"])
+    elif "raw" in payload:
+        yield from iter_splunk_events(payload["raw"])
+    elif "result" in payload:
+        # Formato de alertas/webhooks de busca do Splunk
+        yield _normalize(payload["result"], payload.get("time"))
+    else:
+        event = payload.get("event", payload)
+        yield _normalize(event if isinstance(event, dict) else {"message": event}, payload.get("time"))
+
+
+def _normalize(event: Dict, event_time=None) -> Dict:
+    ip = next((event[f] for f in IP_FIELDS if event.get(f)), None)
+    port = next((event[f] for f in PORT_FIELDS if event.get(f) is not None), None)
+    try:
+        port = int(port) if port is not None else None
+    except (TypeError, ValueError):
+        port = None
+    action = str(event.get("action") or event.get("status") or event.get("event_type") or "").lower()
+    try:
+        t = float(event_time if event_time is not None else event.get("_time", time.time()))
+    except (TypeError, ValueError):
+        t = time.time()
+    return {
+        "ip": ip,
+        "port": port,
+        "user": event.get("user") or event.get("username"),
+        "failed": action in FAILED_ACTIONS,
+        "time": t,
+        "allowed": True,
+    }
+
+
+class SecurityLogPipeline:
+    """Pipeline de logs de segurança em streaming
+
+    O webhook apenas enfileira o payload (fila limitada); um consumidor em
+    background extrai os eventos, enriquece em lote com o firewall compilado,
+    aplica as regras de correlação em janelas e registra os achados em
+    SecurityMonitor.log_security_event.
+    """
+
+    def __init__(self, security_monitor, rules: Optional[List[CorrelationRule]] = None,
+                 queue_size: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE):
+        self.security_monitor = security_monitor
+        self.rules = rules if rules is not None else [FailedLoginRule(), PortScanRule(), BlockedSourceRule()]
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"payloads": 0, "dropped_payloads": 0, "events": 0, "findings": 0}
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def enqueue(self, payload) -> bool:
+        """Enfileirar payload sem bloquear; False se a fila estiver cheia"""
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.stats["dropped_payloads"] += 1
+            return False
+        self.stats["payloads"] += 1
+        return True
+
+    async def _consume(self):
+        while True:
+            payload = await self.queue.get()
+            try:
+                batch = []
+                for event in iter_splunk_events(payload):
+                    batch.append(event)
+                    if len(batch) >= self.batch_size:
+                        await self.process_batch(batch)
+                        batch = []
+                        await asyncio.sleep(0)  # Ceder o loop entre lotes grandes
+                if batch:
+                    await self.process_batch(batch)
+            except Exception as e:
+                logger.error(f"Erro no pipeline de logs: {e}")
+
+    async def process_batch(self, events: List[Dict]):
+        # Enriquecimento em lote com o firewall compilado (uma chamada, porta de cada evento)
+        with_ip = [event for event in events if event["ip"]]
+        if with_ip:
+            verdicts = self.security_monitor.check_ip_threats([e["ip"] for e in with_ip], [e["port"] for e in with_ip])
+            for event, allowed in zip(with_ip, verdicts):
+                event["allowed"] = allowed
+
+        findings = []
+        for event in events:
+            for rule in self.rules:
+                finding = rule.observe(event)
+                if finding is not None:
+                    findings.append((rule, finding))
+        self.stats["events"] += len(events)
+        self.stats["findings"] += len(findings)
+
+        for rule, finding in findings:
+            await self.security_monitor.log_security_event(rule.name, rule.severity, finding)
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, BackgroundTasks, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
@@ -15,17 +15,25 @@ from pathlib import Path
 # Nota: Assumindo que os módulos ml.* estão no PYTHONPATH ou na mesma pasta.
 # Ajuste conforme sua estrutura de pastas real (ex: from ml.auth import ...)
 try:
-    from ml.auth import auth_router
+    from ml.auth import auth_router, enforce_login_rate_limit, login_limiter
 except ImportError:
-    from auth import auth_router # Fallback se estiver na mesma pasta
+    from auth import auth_router, enforce_login_rate_limit, login_limiter # Fallback se estiver na mesma pasta
 from models import TelemetryData, User, Alert, Device, Token
-from database import init_db, get_db
-from mqtt_client import MQTTClientManager
+from database import init_db, get_db, bulk_insert_telemetry
+from mqtt_client import MQTTClientManager, attach_wal
 from anomaly_detection import AnomalyDetector
 from security import SecurityMonitor, get_current_user, create_access_token, verify_password, get_password_hash
 from ai_engine import AIEngine
 from cache import RedisCache
 from metrics import MetricsCollector
+from cluster import ClusterNode
+from qos import AdmissionController, Priority
+from azure_ingest import AzureIngestConsumer
+from load_generator import FleetSimulator, LoadGenerator, DirectSink
+from device_registry import DeviceRegistry
+from wal import WriteAheadLog, WALConsumer
+from compression import TelemetryCompressor, COMPRESSION_ALGORITHM
+from backtest import run_backtest, load_export, load_from_db, load_incidents, resolve_export_path, compression_bias
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -74,6 +82,28 @@ security_monitor = SecurityMonitor()
 ai_engine = AIEngine()
 cache = RedisCache()
 metrics_collector = MetricsCollector()
+cluster = ClusterNode()
+telemetry_compressor = TelemetryCompressor()
+azure_consumer = AzureIngestConsumer(
+    anomaly_detector,
+    persist=bulk_insert_telemetry,
+    on_batch=lambda readings, kept: handle_azure_batch(readings, kept),
+    compressor=telemetry_compressor,
+    route=lambda readings: forward_to_owners(readings),
+)
+ingest_wal = WriteAheadLog()
+wal_consumers = [
+    # O ponto candidato da compressão é salvo junto com o offset
+    WALConsumer(ingest_wal, "scoring", lambda readings: handle_wal_scoring(readings), state=telemetry_compressor),
+]
+device_registry = DeviceRegistry(on_status_change=lambda device_id, status, device: on_device_status(device_id, status, device))
+
+# Controle de admissão: alertas > dashboards > análises ad-hoc
+admission = AdmissionController()
+admission.register("ws_alerts", Priority.CRITICAL)
+admission.register("telemetry_latest", Priority.DASHBOARD)
+admission.register("ws_telemetry", Priority.DASHBOARD)
+admission.register("ai_analyze", Priority.ANALYSIS, max_concurrency=8)
 
 # Conexões WebSocket ativas
 active_connections: List[WebSocket] = []
@@ -83,9 +113,25 @@ active_connections: List[WebSocket] = []
 async def startup_event():
     """Inicialização do sistema"""
     await init_db()
+    await cluster.start()
+    cluster.subscribe("telemetry", send_to_local_connections)
+    cluster.subscribe_owned("ingest", ingest_owned_reading)
+    cluster.serve("ingest.wal", accept_forwarded_readings)
+    security_monitor.attach_cluster(cluster)
+    device_registry.attach_cluster(cluster)
+    ai_engine.attach_cluster(cluster)
+    await security_monitor.start()
+    login_limiter.event_sink = security_monitor.log_security_event
+    # WAL antes do MQTT: consumidores retomam do último offset confirmado
+    ingest_wal.open()
+    attach_wal(ingest_wal)
     mqtt_manager.start()
     await anomaly_detector.load_model()
     await ai_engine.initialize()
+    await azure_consumer.start()
+    await device_registry.start()
+    for consumer in wal_consumers:
+        await consumer.start()
     await cache.connect()
     logger.info("✅ Sistema inicializado - IoT Platform 2025")
     logger.info(f"📊 Modelo de IA carregado: {anomaly_detector.model_accuracy:.1%} accuracy")
@@ -95,17 +141,35 @@ async def startup_event():
 async def shutdown_event():
     """Limpeza ao desligar"""
     await cache.disconnect()
+    await azure_consumer.stop()
+    await device_registry.stop()
+    for consumer in wal_consumers:
+        await consumer.stop()
+    # Pontos retidos gravados antes do checkpoint final, para não voltarem no próximo start
+    await persist_telemetry(telemetry_compressor.flush())
+    for consumer in wal_consumers:
+        await consumer.checkpoint()
+    ingest_wal.close()
+    await security_monitor.stop()
+    ai_engine.close()
+    await cluster.stop()
     logger.info("🔴 Sistema desligando...")
 
 # ===== ENDPOINTS DE AUTENTICAÇÃO =====
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
 @app.post("/api/auth/token", response_model=Token, tags=["auth"])
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """Autenticação JWT"""
+    # Rejeitar IPs/usuários bloqueados antes do bcrypt
+    client_ip = request.client.host
+    await enforce_login_rate_limit(client_ip, form_data.username)
+    
     user = await get_user_from_db(form_data.username)
     if not user or not verify_password(form_data.password, user.hashed_password):
+        await login_limiter.record_failure(client_ip, form_data.username)
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
+    await login_limiter.record_success(client_ip, form_data.username)
     
     # Verificar se o usuário está ativo
     if not user.is_active:
@@ -152,21 +216,29 @@ async def get_latest_telemetry(
     current_user: User = Depends(get_current_user)
 ):
     """Obter última leitura de telemetria"""
-    if device_id:
-        data = await mqtt_manager.get_device_telemetry(device_id)
-    else:
-        data = await mqtt_manager.get_latest_telemetry()
-    
-    if not data:
-        raise HTTPException(status_code=404, detail="Nenhuma telemetria disponível")
-    
-    # Análise de anomalias em tempo real
-    anomaly_result = await anomaly_detector.analyze(data)
-    data["anomaly"] = anomaly_result["is_anomaly"]
-    data["anomaly_score"] = anomaly_result["score"]
-    data["health_score"] = await ai_engine.calculate_health_score(data)
-    
-    return data
+    async with admission.admit("telemetry_latest") as ticket:
+        if device_id:
+            data = await mqtt_manager.get_device_telemetry(device_id)
+        else:
+            data = await mqtt_manager.get_latest_telemetry()
+        
+        if not data:
+            raise HTTPException(status_code=404, detail="Nenhuma telemetria disponível")
+        
+        # Análise de anomalias em tempo real (sem Isolation Forest sob sobrecarga)
+        anomaly_result = await anomaly_detector.analyze(data, use_isolation_forest=not ticket.degraded)
+        data["anomaly"] = anomaly_result["is_anomaly"]
+        data["anomaly_score"] = anomaly_result["score"]
+        
+        # Sob sobrecarga, servir o último score calculado pelo scheduler
+        cached_score = ai_engine.health_scores.get(data.get("device_id")) if ticket.degraded else None
+        if cached_score is not None:
+            data["health_score"] = cached_score
+        else:
+            data["health_score"] = await ai_engine.calculate_health_score(data)
+        data["degraded"] = ticket.degraded
+        
+        return data
 
 @app.get("/api/telemetry/history", tags=["telemetry"])
 async def get_telemetry_history(
@@ -191,15 +263,52 @@ async def get_telemetry_history(
 async def simulate_telemetry(
     count: int = 100,
     anomaly_rate: float = 0.1,
+    devices: int = Query(12, ge=1, le=100000),
+    rate: float = Query(10.0, gt=0, le=100000),
+    mode: str = Query("direct", pattern="^(direct|batch)$"),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
-    """Gerar dados de telemetria simulados (para testes)"""
+    """Gerar dados de telemetria simulados (para testes e carga)
+
+    mode=direct processa leitura a leitura; mode=batch usa a ingestão em lote.
+    """
     background_tasks.add_task(
         generate_simulation_data,
         count=count,
-        anomaly_rate=anomaly_rate
+        anomaly_rate=anomaly_rate,
+        devices=devices,
+        rate=rate,
+        mode=mode
     )
-    return {"message": f"Simulação iniciada para {count} amostras"}
+    return {"message": f"Simulação iniciada para {count} amostras", "devices": devices, "target_rate": rate}
+
+# ===== ENDPOINTS DE DISPOSITIVOS =====
+@app.get("/api/devices", tags=["devices"])
+async def list_devices(
+    location: Optional[str] = None,
+    type: Optional[str] = None,
+    firmware_version: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(online|offline)$"),
+    limit: int = Query(1000, ge=1, le=100000),
+    current_user: User = Depends(get_current_user)
+):
+    """Listar dispositivos de todo o cluster por localização, tipo, firmware e status"""
+    devices = await device_registry.query_routed(location=location, type=type,
+                                                 firmware_version=firmware_version, status=status)
+    return {"total": len(devices), "devices": devices[:limit]}
+
+@app.get("/api/devices/{device_id}", tags=["devices"])
+async def get_device(device_id: str, current_user: User = Depends(get_current_user)):
+    """Dados cadastrais, status e última leitura de um dispositivo"""
+    device = await device_registry.get_routed(device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
+    return device
+
+@app.post("/api/devices", tags=["devices"])
+async def register_device(device: Device, current_user: User = Depends(get_current_user)):
+    """Cadastrar ou atualizar um dispositivo (no worker dono)"""
+    return await device_registry.register_routed(device)
 
 # ===== ENDPOINTS DE ANÁLISE COM IA =====
 @app.post("/api/ai/analyze", tags=["analytics"])
@@ -208,17 +317,26 @@ async def analyze_with_ai(
     analysis_type: str = "all",
     current_user: User = Depends(get_current_user)
 ):
-    """Análise avançada com IA"""
-    if analysis_type == "predictive":
-        result = await ai_engine.predict_failure(data)
-    elif analysis_type == "pattern":
-        result = await ai_engine.detect_patterns(data)
-    elif analysis_type == "optimization":
-        result = await ai_engine.optimize_parameters(data)
-    else:
-        result = await ai_engine.comprehensive_analysis(data)
-    
-    return result
+    """Análise avançada com IA
+
+    Sob carga (ticket degradado), a análise completa cobre só saúde e
+    previsão de falha; padrões e otimização ficam para quando houver folga.
+    """
+    async with admission.admit("ai_analyze") as ticket:
+        try:
+            if analysis_type == "predictive":
+                result = await ai_engine.predict_failure(data)
+            elif analysis_type == "pattern":
+                result = await ai_engine.detect_patterns(data)
+            elif analysis_type == "optimization":
+                result = await ai_engine.optimize_parameters(data)
+            else:
+                result = await ai_engine.comprehensive_analysis(data, degraded=ticket.degraded)
+        except asyncio.TimeoutError:
+            # Análise encaminhada ao worker dono sem resposta
+            raise HTTPException(status_code=504, detail="Worker dono do dispositivo não respondeu")
+        
+        return result
 
 @app.get("/api/ai/performance", tags=["analytics"])
 async def get_ai_performance():
@@ -229,9 +347,45 @@ async def get_ai_performance():
         "recall": anomaly_detector.recall,
         "f1_score": anomaly_detector.f1_score,
         "last_trained": anomaly_detector.last_trained,
-        "training_samples": anomaly_detector.training_samples
+        "training_samples": anomaly_detector.training_samples,
+        "backtest": anomaly_detector.last_backtest
     }
 
+@app.post("/api/ai/backtest", tags=["analytics"])
+async def backtest_detector(
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    export_path: Optional[str] = Query(None, description="Exportação colunar (.npz/.parquet/.csv) em NEXUS_BACKTEST_EXPORT_DIR, em vez do banco"),
+    threshold: Optional[float] = None,
+    cascade: Optional[str] = Query(None, description="Estágios da cascata; vazio = modelos completos"),
+    z_max: Optional[float] = None,
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    current_user: User = Depends(get_current_user)
+):
+    """Reproduzir telemetria arquivada pelo pipeline de score (tempo de evento, todos os núcleos)
+
+    Sem parâmetros de configuração, avalia a configuração em uso e atualiza
+    /api/ai/performance; com eles, o resultado fica só no relatório. Sobre
+    o banco comprimido o relatório é marcado como enviesado e nunca
+    atualiza /api/ai/performance.
+    """
+    if not anomaly_detector.shared_model_dir:
+        raise HTTPException(status_code=400, detail="Backtest requer o modelo compartilhado (NEXUS_SHARED_MODEL_DIR)")
+    if export_path is None and start_time is None:
+        raise HTTPException(status_code=400, detail="Informe start_time ou export_path")
+    if export_path is not None:
+        try:
+            export_path = resolve_export_path(export_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    config = anomaly_detector.backtest_config()
+    overrides = {"threshold": threshold, "stages": cascade, "z_max": z_max}
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    bias = compression_bias(COMPRESSION_ALGORITHM) if export_path is None else None
+    live = all(v is None for v in overrides.values()) and bias is None
+    background_tasks.add_task(run_detector_backtest, start_time, end_time, export_path, config, live, bias)
+    return {"message": "Backtest iniciado", "config": config, "updates_performance": live, "bias": bias}
+
 # ===== ENDPOINTS DE CIBERSEGURANÇA =====
 @app.get("/api/security/status", tags=["security"])
 async def get_security_status(current_user: User = Depends(get_current_user)):
@@ -242,12 +396,28 @@ async def get_security_status(current_user: User = Depends(get_current_user)):
 @app.get("/api/security/threats", tags=["security"])
 async def get_recent_threats(
     hours: int = 24,
+    severity: Optional[str] = None,
+    event_type: Optional[str] = None,
+    resolved: Optional[bool] = None,
+    limit: int = Query(100, le=1000),
     current_user: User = Depends(get_current_user)
 ):
     """Ameaças de segurança recentes"""
-    threats = await security_monitor.get_recent_threats(hours)
+    threats = await security_monitor.get_recent_threats(
+        hours, severity=severity, event_type=event_type, resolved=resolved, limit=limit
+    )
     return threats
 
+@app.post("/api/security/threats/{event_id}/resolve", tags=["security"])
+async def resolve_threat(
+    event_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Marcar ameaça como resolvida"""
+    if not await security_monitor.resolve_threat(event_id):
+        raise HTTPException(status_code=404, detail="Ameaça não encontrada ou já resolvida")
+    return {"status": "resolved"}
+
 @app.post("/api/security/scan", tags=["security"])
 async def run_security_scan(
     scan_type: str = "quick",
@@ -259,23 +429,39 @@ async def run_security_scan(
 
 # ===== WEBHOOKS PARA INTEGRAÇÃO =====
 @app.post("/api/webhooks/azure")
-async def azure_webhook(payload: Dict):
+async def azure_webhook(request: Request):
     """Webhook para integração com Azure IoT Hub"""
-    # Verificar assinatura
-    signature = payload.get("signature")
-    if not security_monitor.verify_signature(signature):
+    if not security_monitor.webhooks_enabled():
+        raise HTTPException(status_code=503, detail="Webhook desabilitado: NEXUS_WEBHOOK_SECRET não configurado")
+    # Verificar assinatura HMAC sobre o corpo bruto, em streaming
+    signature = request.headers.get("X-Signature") or request.headers.get("X-Hub-Signature-256")
+    body = await security_monitor.read_verified_body(request.stream(), signature)
+    if body is None:
         raise HTTPException(status_code=401, detail="Assinatura inválida")
+    try:
+        payload = json.loads(body)
+        data = payload["data"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Payload inválido: JSON com campo 'data' esperado")
     
-    # Processar dados do Azure
-    await process_azure_data(payload["data"])
+    # Enfileirar para o consumidor em lote e confirmar imediatamente
+    result = azure_consumer.enqueue(data)
+    if result["rejected"]:
+        # Fila cheia: o IoT Hub reenvia, e as mensagens já aceitas viram no-ops
+        raise HTTPException(status_code=503, detail="Fila de ingestão cheia", headers={"Retry-After": "1"})
     
-    return {"status": "processed"}
+    return JSONResponse(status_code=202, content={"status": "queued", **result})
 
 @app.post("/api/webhooks/splunk")
 async def splunk_webhook(payload: Dict):
     """Webhook para integração com Splunk"""
-    # Processar logs de segurança
-    await security_monitor.process_splunk_logs(payload)
+    # Apenas enfileirar - o pipeline de correlação processa em background
+    if not security_monitor.process_splunk_logs(payload):
+        raise HTTPException(
+            status_code=503,
+            detail="Fila de logs cheia",
+            headers={"Retry-After": "1"}
+        )
     
     return {"status": "logs_received"}
 
@@ -290,14 +476,23 @@ async def websocket_telemetry(websocket: WebSocket):
         while True:
             # Enviar dados a cada segundo
             telemetry = await mqtt_manager.get_latest_telemetry()
+            ticket = admission.try_acquire("ws_telemetry") if telemetry else None
             
-            if telemetry:
-                # Análise em tempo real
-                anomaly_result = await anomaly_detector.analyze(telemetry)
-                telemetry["anomaly"] = anomaly_result["is_anomaly"]
-                telemetry["anomaly_score"] = anomaly_result["score"]
-                
-                await websocket.send_json(telemetry)
+            if telemetry and ticket is None:
+                # Sobrecarga: pular este ciclo
+                admission.record_shed("ws_telemetry")
+            elif telemetry:
+                try:
+                    # Análise em tempo real
+                    anomaly_result = await anomaly_detector.analyze(
+                        telemetry, use_isolation_forest=not ticket.degraded
+                    )
+                    telemetry["anomaly"] = anomaly_result["is_anomaly"]
+                    telemetry["anomaly_score"] = anomaly_result["score"]
+                    
+                    await websocket.send_json(telemetry)
+                finally:
+                    admission.release(ticket)
             
             await asyncio.sleep(1)
     except WebSocketDisconnect:
@@ -308,19 +503,27 @@ async def websocket_telemetry(websocket: WebSocket):
 
 @app.websocket("/ws/alerts")
 async def websocket_alerts(websocket: WebSocket):
-    """WebSocket para alertas em tempo real"""
+    """WebSocket para alertas em tempo real (push, sem polling)"""
     await websocket.accept()
+    subscription = security_monitor.alert_bus.subscribe()
     
     try:
         while True:
-            # Verificar novos alertas
-            new_alerts = await security_monitor.get_new_alerts()
-            for alert in new_alerts:
+            # Aguardar próximo alerta publicado no barramento
+            alert = await subscription.get()
+            ticket = await admission.acquire("ws_alerts")
+            if ticket is None:
+                # O alerta continua persistido e disponível em /api/security/threats
+                admission.record_shed("ws_alerts")
+                continue
+            try:
                 await websocket.send_json(alert)
-            
-            await asyncio.sleep(5)
+            finally:
+                admission.release(ticket)
     except WebSocketDisconnect:
         pass
+    finally:
+        security_monitor.alert_bus.unsubscribe(subscription)
 
 # ===== ENDPOINTS DE MONITORAMENTO DO SISTEMA =====
 @app.get("/api/health", tags=["monitoring"])
@@ -336,6 +539,21 @@ async def health_check():
             "ai_model": anomaly_detector.is_loaded(),
             "security_monitor": security_monitor.is_running()
         },
+        "cluster": {
+            "worker_id": cluster.worker_id,
+            "members": cluster.members
+        },
+        "scheduler": ai_engine.scheduler.stats(),
+        "qos": admission.stats(),
+        "alerts": security_monitor.alert_bus.stats,
+        "security_logs": security_monitor.log_pipeline.stats,
+        "login_limiter": login_limiter.stats,
+        "azure_ingest": azure_consumer.stats,
+        "anomaly_cascade": anomaly_detector.cascade.pass_rates() if anomaly_detector.cascade else None,
+        "devices": device_registry.stats(),
+        "compression": telemetry_compressor.ratios(),
+        "wal": {**ingest_wal.stats, "lag_bytes": ingest_wal.lag(),
+                "consumers": {c.name: c.stats for c in wal_consumers}},
         "metrics": {
             "active_connections": len(active_connections),
             "messages_processed": metrics_collector.get_counter("messages_processed"),
@@ -351,38 +569,169 @@ async def get_metrics():
 
 # ===== FUNÇÕES AUXILIARES =====
 async def broadcast_telemetry(telemetry: Dict):
-    """Transmitir telemetria para todas as conexões WebSocket"""
-    for connection in active_connections:
+    """Transmitir telemetria para as conexões WebSocket de todos os workers"""
+    await cluster.publish("telemetry", telemetry)
+
+async def send_to_local_connections(telemetry: Dict):
+    """Enviar telemetria para as conexões WebSocket deste worker"""
+    telemetry.pop("_origin", None)
+    for connection in list(active_connections):
         try:
             await connection.send_json(telemetry)
         except Exception as e:
             logger.error(f"Erro ao enviar para WebSocket: {e}")
             active_connections.remove(connection)
 
-async def generate_simulation_data(count: int, anomaly_rate: float):
-    """Gerar dados de simulação para testes"""
-    for i in range(count):
-        data = {
-            "device_id": f"device_{i % 12}",
-            "temperature": 70 + (random.random() * 20 - 10),
-            "vibration": 0.02 + (random.random() * 0.03 * (1 if random.random() > anomaly_rate else 5)),
-            "rpm": 1500 + (random.random() * 100 - 50),
-            "pressure": 100 + (random.random() * 20),
-            "power_consumption": 2.4 + (random.random() * 1),
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        # Detectar anomalia
-        anomaly_result = await anomaly_detector.analyze(data)
-        data["anomaly"] = anomaly_result["is_anomaly"]
-        
-        # Armazenar no cache
-        await cache.set(f"telemetry:{data['device_id']}:latest", data, expire=60)
-        
-        # Broadcast via WebSocket
-        await broadcast_telemetry(data)
-        
-        await asyncio.sleep(0.1)
+def on_device_status(device_id: str, status: str, device: Dict):
+    """Alertar quando um dispositivo para de enviar leituras"""
+    if status == "offline":
+        asyncio.create_task(security_monitor.trigger_alert({
+            "event_type": "device_offline",
+            "severity": "medium",
+            "details": {"device_id": device_id, "location": device.get("location"),
+                        "last_seen": device["last_seen"].isoformat()}
+        }))
+
+async def handle_azure_batch(readings: List[Dict], kept: List[Dict]):
+    """Atualizar estado por dispositivo e cache após um lote do Azure; dashboards recebem só kept
+
+    Só chegam aqui leituras de dispositivos deste worker (forward_to_owners
+    encaminhou as demais), então o estado no ai_engine e na compressão
+    fica com um único dono por dispositivo.
+    """
+    await device_registry.touch_routed([reading["device_id"] for reading in readings])
+    results = await asyncio.gather(*(ai_engine.process_reading(r) for r in readings))
+    latest = {}
+    for reading, result in zip(readings, results):
+        reading["health_score"] = result["health_score"]
+        latest[reading["device_id"]] = reading
+    for device_id, reading in latest.items():
+        await cache.set(f"telemetry:{device_id}:latest", reading, expire=60)
+    for reading in kept:
+        await broadcast_telemetry(reading)
+
+async def forward_to_owners(readings: List[Dict]) -> List[Dict]:
+    """Gravar no WAL do dono as leituras de dispositivos de outro worker; retorna as locais
+
+    Só retorna depois que cada dono responde que gravou: sem resposta
+    (timeout) a exceção faz o lote ser reentregue (WAL) ou reenviado pelo
+    IoT Hub (Azure), e o WAL do dono descarta as que já tinha.
+    """
+    local, remote = [], {}
+    for reading in readings:
+        if reading.get("_forwarded") or cluster.owns(reading["device_id"]):
+            local.append(reading)
+        else:
+            remote.setdefault(cluster.owner(reading["device_id"]), []).append(reading)
+    await asyncio.gather(*(cluster.request(owner, "ingest.wal", {"readings": batch})
+                           for owner, batch in remote.items()))
+    return local
+
+async def handle_wal_scoring(readings: List[Dict]):
+    """Consumidor do WAL: score, estado por dispositivo, cache, broadcast e gravação comprimida
+
+    Leituras de dispositivos de outro worker vão para o WAL do dono, e o
+    lote só é confirmado depois que o dono responde que as gravou.
+    """
+    local = await forward_to_owners(readings)
+    # Se a gravação falhar, a compressão volta ao estado anterior ao lote: na
+    # reentrega as leituras não são descartadas como já decididas
+    compression_state = telemetry_compressor.snapshot({r["device_id"] for r in local})
+    try:
+        results = await asyncio.gather(*(ingest_reading(r) for r in local))
+        await persist_telemetry([row for kept in results for row in kept])
+    except BaseException:  # Inclui o cancelamento no desligamento
+        telemetry_compressor.restore(compression_state)
+        raise
+
+async def accept_forwarded_readings(message: Dict) -> Dict:
+    """Lote encaminhado pelo WAL de outro worker: gravar (durável) no WAL deste antes de responder"""
+    readings = [{**reading, "_forwarded": True} for reading in message["readings"]]
+    offsets = await asyncio.to_thread(ingest_wal.append_many, readings, True)
+    return {"accepted": sum(1 for offset in offsets if offset is not None)}
+
+async def ingest_owned_reading(data: Dict):
+    """Leitura encaminhada por outro worker: processar e gravar os pontos mantidos"""
+    await persist_telemetry(await ingest_reading(data))
+
+async def persist_telemetry(readings: List[Dict]):
+    """Persistência em lote no banco"""
+    if not readings:
+        return
+    rows = []
+    for reading in readings:
+        row = dict(reading)
+        if isinstance(row.get("timestamp"), str):
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00")).replace(tzinfo=None)
+        elif isinstance(row.get("timestamp"), (int, float)):
+            row["timestamp"] = datetime.utcfromtimestamp(row["timestamp"])
+        rows.append(row)
+    await bulk_insert_telemetry(rows)
+
+async def ingest_reading(data: Dict) -> List[Dict]:
+    """Processar leitura no worker dono do dispositivo (particionamento por hash consistente)
+
+    Retorna as leituras que a compressão manteve para gravação.
+    """
+    data.pop("_origin", None)
+    forwarded = data.pop("_forwarded", False)
+    if not forwarded and not cluster.owns(data["device_id"]):
+        await cluster.send_to_owner(data["device_id"], "ingest", data)
+        return []
+    device_registry.touch(data["device_id"])
+    
+    # Detectar anomalia
+    anomaly_result = await anomaly_detector.analyze(data)
+    data["anomaly"] = anomaly_result["is_anomaly"]
+    
+    # Análises com estado por dispositivo, em ordem
+    device_result = await ai_engine.process_reading(data)
+    data["health_score"] = device_result["health_score"]
+    
+    # Armazenar no cache
+    await cache.set(f"telemetry:{data['device_id']}:latest", data, expire=60)
+    
+    # Compressão (anomalias sempre passam): só os pontos mantidos são transmitidos e gravados
+    kept = telemetry_compressor.process(data)
+    for reading in kept:
+        await broadcast_telemetry(reading)
+    return kept
+
+async def run_detector_backtest(start_time: Optional[datetime], end_time: Optional[datetime],
+                                export_path: Optional[str], config: Dict, live: bool, bias: Optional[Dict] = None):
+    """Carregar a telemetria arquivada e executar o backtest fora do event loop"""
+    try:
+        if export_path:
+            columns = await asyncio.to_thread(load_export, export_path)
+        else:
+            columns = await load_from_db(start_time, end_time)
+        report = await asyncio.to_thread(
+            run_backtest, columns, anomaly_detector.shared_model_dir, load_incidents(), **config
+        )
+    except Exception as e:
+        logger.error(f"Erro no backtest: {e}")
+        return
+    if bias is not None:
+        report["bias"] = bias
+    if live:
+        anomaly_detector.apply_backtest(report)
+    else:
+        anomaly_detector.last_backtest = report
+
+async def generate_simulation_data(count: int, anomaly_rate: float, devices: int = 12,
+                                   rate: float = 10.0, mode: str = "direct"):
+    """Gerar dados de simulação (frota vetorizada) na taxa alvo"""
+    async def ingest_each(records: List[Dict]):
+        await asyncio.gather(*(ingest_reading(r) for r in records))
+
+    async def ingest_batch(records: List[Dict]):
+        azure_consumer.enqueue([{"body": r} for r in records])
+
+    simulator = FleetSimulator(devices=devices, anomaly_rate=anomaly_rate)
+    sink = DirectSink(ingest_batch if mode == "batch" else ingest_each)
+    report = await LoadGenerator(simulator, sink, rate=rate).run(count=count)
+    logger.info(f"Simulação concluída: {report}")
+    return report
 
 # Função principal
 if __name__ == "__main__":
@@ -7,6 +7,12 @@ PORT = 1883
 TOPIC = "factory/plantA/device/+/telemetry"
 
 latest_message = None
+wal = None  # WriteAheadLog: leituras ficam duráveis antes de qualquer processamento
+
+def attach_wal(log):
+    """Gravar toda leitura recebida no WAL de ingestão"""
+    global wal
+    wal = log
 
 def on_connect(client, userdata, flags, rc):
     print("MQTT connected:", rc)
@@ -17,6 +23,10 @@ def on_message(client, userdata, msg):
     try:
         payload = json.loads(msg.payload.decode())
         latest_message = payload
+        if wal is not None:
+            # factory/plantA/device/<id>/telemetry
+            payload.setdefault("device_id", msg.topic.split("/")[3])
+            wal.append(payload)
     except Exception as e:
         print("MQTT parse error:", e)
 
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZER_WORKERS = int(os.getenv("NEXUS_OPTIMIZER_WORKERS", str(os.cpu_count() or 2)))
+
+# Variáveis de decisão (setpoints) e seus limites operacionais
+SETPOINTS = ["rpm", "pressure", "temperature"]
+DEFAULT_BOUNDS = {"rpm": (1000.0, 2000.0), "pressure": (60.0, 140.0), "temperature": (50.0, 90.0)}
+NOMINAL_POWER = 2.4     # kW de referência para normalizar o custo de energia
+MIN_FIT_SAMPLES = 20
+MIN_SETPOINT_SPREAD = 0.05  # Amplitude mínima de cada setpoint no histórico (fração da faixa)
+
+
+def health_score_batch(temperature, vibration, rpm, pressure=None) -> np.ndarray:
+    """Versão vetorizada das penalidades de AIEngine.calculate_health_score"""
+    score = 100.0 - (np.abs(temperature - 70) / 30) * 30
+    score = score - np.maximum(0, (vibration / 0.05) * 40)
+    score = score - (np.abs(rpm - 1500) / 200) * 20
+    if pressure is not None:
+        score = score - (np.abs(pressure - 100) / 50) * 10
+    return np.clip(score, 0, 100)
+
+
+class QuadraticModel:
+    """Regressão ridge em termos quadráticos dos setpoints normalizados"""
+
+    def __init__(self, bounds: Dict[str, tuple] = DEFAULT_BOUNDS, coef: Optional[np.ndarray] = None):
+        self.low = np.array([bounds[k][0] for k in SETPOINTS])
+        self.span = np.array([bounds[k][1] - bounds[k][0] for k in SETPOINTS])
+        self.coef = coef
+
+    def _features(self, X: np.ndarray) -> np.ndarray:
+        u = (X - self.low) / self.span
+        r, p, t = u[:, 0], u[:, 1], u[:, 2]
+        return np.stack([np.ones_like(r), r, p, t, r * r, p * p, t * t, r * p, r * t, p * t], axis=1)
+
+    def fit(self, X: np.ndarray, y: np.ndarray, alpha: float = 1e-3) -> "QuadraticModel":
+        F = self._features(X)
+        self.coef = np.linalg.solve(F.T @ F + alpha * np.eye(F.shape[1]), F.T @ y)
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self._features(X) @ self.coef
+
+
+def _prior_models(bounds: Dict[str, tuple]) -> tuple:
+    """Modelos a priori (física simplificada) para quando não há histórico suficiente"""
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(*bounds[k], 500) for k in SETPOINTS])
+    rpm, pressure, temperature = X.T
+    power = 2.4 * (rpm / 1500) ** 2 * (1 + 0.3 * (pressure - 100) / 100) * (1 + 0.1 * (70 - temperature) / 30)
+    vibration = 0.02 * (rpm / 1500) ** 2 * (1 + 0.2 * np.abs(pressure - 100) / 50)
+    return QuadraticModel(bounds).fit(X, power), QuadraticModel(bounds).fit(X, vibration)
+
+
+def fit_models(history: List[Dict], bounds: Dict[str, tuple] = DEFAULT_BOUNDS) -> Optional[tuple]:
+    """Aprender modelos de potência e vibração a partir do histórico de leituras
+
+    Retorna None (e o chamador usa o modelo do tipo ou o a priori) quando o
+    histórico não identifica o modelo: poucas amostras, algum setpoint que
+    quase não variou ou termos quadráticos colineares. Sem isso, a ridge
+    extrapola livremente na direção não observada e o CMA-ES recomenda o limite.
+    """
+    rows = [r for r in history
+            if all(isinstance(r.get(k), (int, float)) for k in SETPOINTS + ["power_consumption", "vibration"])]
+    if len(rows) < MIN_FIT_SAMPLES:
+        return None
+    X = np.array([[r[k] for k in SETPOINTS] for r in rows], dtype=np.float64)
+    model = QuadraticModel(bounds)
+    if (np.ptp(X, axis=0) < MIN_SETPOINT_SPREAD * model.span).any():
+        return None
+    F = model._features(X)
+    if np.linalg.matrix_rank(F) < F.shape[1]:
+        return None
+    power = np.array([r["power_consumption"] for r in rows], dtype=np.float64)
+    vibration = np.array([r["vibration"] for r in rows], dtype=np.float64)
+    return QuadraticModel(bounds).fit(X, power), QuadraticModel(bounds).fit(X, vibration)
+
+
+def cma_es(objective: Callable[[np.ndarray], np.ndarray], x0: np.ndarray, sigma: float = 0.3,
+           popsize: int = 16, max_iter: int = 80, tol: float = 1e-4, seed: int = 0) -> tuple:
+    """CMA-ES no hipercubo [0, 1]^d com avaliação vetorizada da população
+
+    Retorna (melhor x, melhor valor, número de avaliações).
+    """
+    rng = np.random.default_rng(seed)
+    d = len(x0)
+    mu = popsize // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= weights.sum()
+    mueff = 1.0 / (weights ** 2).sum()
+    cc = (4 + mueff / d) / (d + 4 + 2 * mueff / d)
+    cs = (mueff + 2) / (d + mueff + 5)
+    c1 = 2 / ((d + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((d + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0.0, np.sqrt((mueff - 1) / (d + 1)) - 1) + cs
+    chi_n = np.sqrt(d) * (1 - 1 / (4 * d) + 1 / (21 * d * d))
+
+    mean = np.asarray(x0, dtype=np.float64).copy()
+    C = np.eye(d)
+    B, D = np.eye(d), np.ones(d)
+    pc, ps = np.zeros(d), np.zeros(d)
+    best_x, best_f = np.clip(mean, 0, 1), float(objective(np.clip(mean, 0, 1)[None, :])[0])
+    evaluations = 1
+
+    for generation in range(max_iter):
+        y = rng.standard_normal((popsize, d)) @ (B * D).T
+        x = mean + sigma * y
+        clipped = np.clip(x, 0, 1)
+        # Penalidade quadrática fora dos limites mantém a busca dentro do hipercubo
+        f = objective(clipped) + 1e3 * ((x - clipped) ** 2).sum(axis=1)
+        evaluations += popsize
+        order = np.argsort(f)
+        if f[order[0]] < best_f:
+            best_f, best_x = float(f[order[0]]), clipped[order[0]].copy()
+
+        selected = y[order[:mu]]
+        y_w = weights @ selected
+        mean = mean + sigma * y_w
+        ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) * (B @ ((B.T @ y_w) / D))
+        hsig = np.linalg.norm(ps) / np.sqrt(1 - (1 - cs) ** (2 * (generation + 1))) / chi_n < 1.4 + 2 / (d + 1)
+        pc = (1 - cc) * pc + hsig * np.sqrt(cc * (2 - cc) * mueff) * y_w
+        C = ((1 - c1 - cmu) * C
+             + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C)
+             + cmu * (selected.T * weights) @ selected)
+        sigma *= np.exp((cs / damps) * (np.linalg.norm(ps) / chi_n - 1))
+        eigenvalues, B = np.linalg.eigh((C + C.T) / 2)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        if sigma * D.max() < tol:
+            break
+    return best_x, best_f, evaluations
+
+
+def _optimize_task(task: Dict) -> Dict:
+    """Otimizar um dispositivo (executado no pool de processos)"""
+    low, span = task["low"], task["span"]
+    power_model, vibration_model = task["power_model"], task["vibration_model"]
+    power_weight = task["power_weight"]
+
+    def objective(U: np.ndarray) -> np.ndarray:
+        X = low + U * span
+        power = np.maximum(power_model.predict(X), 0)
+        vibration = np.maximum(vibration_model.predict(X), 0)
+        health = health_score_batch(X[:, 2], vibration, X[:, 0], X[:, 1])
+        return -health + power_weight * 100 * power / NOMINAL_POWER
+
+    best_u, best_f, evaluations = cma_es(objective, task["x0"], sigma=task["sigma"], seed=task["seed"])
+    best = low + best_u * span
+    power = float(max(power_model.predict(best[None, :])[0], 0))
+    vibration = float(max(vibration_model.predict(best[None, :])[0], 0))
+    return {
+        "device_id": task["device_id"],
+        "x": best_u,
+        "recommended": {k: round(float(v), 2) for k, v in zip(SETPOINTS, best)},
+        "expected_health_score": round(float(health_score_batch(best[2], vibration, best[0], best[1])), 1),
+        "expected_power_consumption": round(power, 3),
+        "expected_vibration": round(vibration, 4),
+        "evaluations": evaluations,
+    }
+
+
+class SetpointOptimizer:
+    """Sugestão de setpoints que maximizam o health score e minimizam o consumo
+
+    Modelos de potência e vibração aprendidos do histórico (por dispositivo
+    ou por tipo), busca CMA-ES vetorizada distribuída em um pool de
+    processos e warm start a partir da última solução de cada tipo.
+    """
+
+    def __init__(self, bounds: Optional[Dict[str, tuple]] = None, power_weight: float = 0.3,
+                 workers: int = OPTIMIZER_WORKERS):
+        self.bounds = dict(bounds or DEFAULT_BOUNDS)
+        self.power_weight = power_weight
+        self.workers = workers
+        self.low = np.array([self.bounds[k][0] for k in SETPOINTS])
+        self.span = np.array([self.bounds[k][1] - self.bounds[k][0] for k in SETPOINTS])
+        self.prior = _prior_models(self.bounds)
+        self.type_models: Dict[str, tuple] = {}
+        self.warm_starts: Dict[str, np.ndarray] = {}
+        self.version = 0  # Incrementada quando um modelo por tipo é (re)ajustado
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def rules(self) -> Dict:
+        return {"bounds": self.bounds, "power_weight": self.power_weight,
+                "warm_started_types": sorted(self.warm_starts)}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def fit_type(self, device_type: str, histories: List[List[Dict]]):
+        """Aprender os modelos de um tipo de equipamento com o histórico da frota"""
+        models = fit_models([r for h in histories for r in h], self.bounds)
+        if models is not None:
+            self.type_models[device_type] = models
+            self.version += 1
+
+    def _task(self, device_id: str, device_type: str, history: List[Dict]) -> Dict:
+        models, source = fit_models(history, self.bounds), "device"
+        if models is None:
+            models, source = self.type_models.get(device_type), "type"
+        if models is None:
+            models, source = self.prior, "prior"
+        warm = self.warm_starts.get(device_type)
+        return {
+            "device_id": device_id,
+            "device_type": device_type,
+            "model": source,
+            "low": self.low,
+            "span": self.span,
+            "power_model": models[0],
+            "vibration_model": models[1],
+            "power_weight": self.power_weight,
+            "x0": warm if warm is not None else np.full(len(SETPOINTS), 0.5),
+            "sigma": 0.1 if warm is not None else 0.3,
+            "warm_start": warm is not None,
+            "seed": zlib.crc32(str(device_id).encode()),
+        }
+
+    def _finish(self, task: Dict, result: Dict, history: List[Dict]) -> Dict:
+        self.warm_starts[task["device_type"]] = result.pop("x")
+        result["device_type"] = task["device_type"]
+        result["model"] = task["model"]
+        result["warm_start"] = task["warm_start"]
+        current = history[-1] if history else {}
+        result["current"] = {k: current.get(k) for k in SETPOINTS + ["power_consumption"]}
+        if isinstance(current.get("power_consumption"), (int, float)) and current["power_consumption"] > 0:
+            saving = 1 - result["expected_power_consumption"] / current["power_consumption"]
+            result["power_saving_pct"] = round(100 * saving, 1)
+        return result
+
+    async def optimize(self, device_id: str, device_type: str, history: List[Dict]) -> Dict:
+        task = self._task(device_id, device_type, history)
+        result = await asyncio.to_thread(_optimize_task, task)
+        return self._finish(task, result, history)
+
+    async def optimize_line(self, devices: Dict[str, tuple]) -> Dict[str, Dict]:
+        """Otimizar uma linha inteira: devices = {device_id: (device_type, histórico)}"""
+        tasks = [self._task(d, t, h) for d, (t, h) in devices.items()]
+        if not tasks:
+            return {}
+        loop = asyncio.get_running_loop()
+        if self.workers <= 1 or len(tasks) < 4:
+            results = [await asyncio.to_thread(_optimize_task, task) for task in tasks]
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"))
+            results = await asyncio.gather(*[loop.run_in_executor(self._pool, _optimize_task, t) for t in tasks])
+        return {task["device_id"]: self._finish(task, result, devices[task["device_id"]][1])
+                for task, result in zip(tasks, results)}
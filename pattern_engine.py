@@ -0,0 +1,342 @@
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from statistics import NormalDist
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PATTERN_WINDOW = int(os.getenv("NEXUS_PATTERN_WINDOW", "32"))
+PATTERN_LIBRARY_PATH = os.getenv("NEXUS_PATTERN_LIBRARY", "models/failure_signatures.json")
+PATTERN_WORKERS = int(os.getenv("NEXUS_PATTERN_WORKERS", str(os.cpu_count() or 2)))
+PATTERN_FIELDS = ["temperature", "vibration", "rpm", "pressure", "power_consumption"]
+PERIODIC_FIELDS = ["vibration", "rpm"]
+SAX_SEGMENTS = 8
+SAX_ALPHABET = 4
+
+
+# ===== Séries temporais =====
+def znorm(x: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Normalização z; janelas constantes viram zeros"""
+    mean = x.mean(axis=axis, keepdims=True)
+    std = x.std(axis=axis, keepdims=True)
+    return np.divide(x - mean, std, out=np.zeros_like(x, dtype=np.float64), where=std > 1e-8)
+
+
+def sliding_windows(x: np.ndarray, m: int) -> np.ndarray:
+    return np.lib.stride_tricks.sliding_window_view(x, m)
+
+
+def matrix_profile(series: np.ndarray, m: int, block: int = 1024):
+    """Matrix profile (self-join) com distância euclidiana z-normalizada
+
+    As distâncias saem do produto escalar das janelas normalizadas
+    (d² = 2m(1 - corr)), calculado em blocos de linhas para limitar memória.
+    Retorna (profile, index); vizinhos triviais (|i-j| < m/2) são excluídos.
+    """
+    windows = znorm(sliding_windows(np.asarray(series, dtype=np.float64), m))
+    k = len(windows)
+    profile = np.full(k, np.inf)
+    index = np.full(k, -1, dtype=np.int64)
+    exclusion = max(1, m // 2)
+    columns = np.arange(k)
+    for start in range(0, k, block):
+        rows = np.arange(start, min(start + block, k))
+        corr = windows[rows] @ windows.T / m
+        dist = np.sqrt(np.maximum(2 * m * (1 - corr), 0))
+        dist[np.abs(rows[:, None] - columns[None, :]) < exclusion] = np.inf
+        index[rows] = dist.argmin(axis=1)
+        profile[rows] = dist[np.arange(len(rows)), index[rows]]
+    return profile, index
+
+
+def top_k(profile: np.ndarray, index: np.ndarray, k: int, m: int, largest: bool) -> List[Dict]:
+    """Motifs (menores distâncias) ou discords (maiores) sem sobreposição"""
+    finite = np.flatnonzero(np.isfinite(profile))
+    order = finite[np.argsort(profile[finite])]
+    if largest:
+        order = order[::-1]
+    results, taken = [], []
+    for i in order:
+        if any(abs(i - t) < m for t in taken):
+            continue
+        taken.append(i)
+        results.append({"index": int(i), "neighbor": int(index[i]), "distance": round(float(profile[i]), 4)})
+        if len(results) >= k:
+            break
+    return results
+
+
+def periodicity(series: np.ndarray, sample_interval: float = 1.0, min_ratio: float = 0.2) -> Dict:
+    """Frequência dominante via FFT (série sem tendência, janela de Hann)"""
+    x = np.asarray(series, dtype=np.float64)
+    n = len(x)
+    if n < 8:
+        return {"periodic": False}
+    t = np.arange(n)
+    x = x - np.polyval(np.polyfit(t, x, 1), t)
+    power = np.abs(np.fft.rfft(x * np.hanning(n))) ** 2
+    power[0] = 0.0
+    total = power.sum()
+    if total <= 0:
+        return {"periodic": False}
+    peak = int(power.argmax())
+    ratio = float(power[peak] / total)
+    period_samples = n / peak
+    return {
+        "periodic": ratio >= min_ratio and period_samples < n / 2,
+        "period_samples": round(period_samples, 2),
+        "period_seconds": round(period_samples * sample_interval, 2),
+        "frequency_hz": round(peak / (n * sample_interval), 5),
+        "power_ratio": round(ratio, 3),
+    }
+
+
+# ===== SAX =====
+_BREAKPOINTS = np.array([NormalDist().inv_cdf(i / SAX_ALPHABET) for i in range(1, SAX_ALPHABET)])
+_SYMBOL_DIST = np.zeros((SAX_ALPHABET, SAX_ALPHABET))
+for _a in range(SAX_ALPHABET):
+    for _b in range(SAX_ALPHABET):
+        if abs(_a - _b) > 1:
+            _SYMBOL_DIST[_a, _b] = _BREAKPOINTS[max(_a, _b) - 1] - _BREAKPOINTS[min(_a, _b)]
+
+
+def paa(x: np.ndarray, segments: int = SAX_SEGMENTS) -> np.ndarray:
+    """Piecewise Aggregate Approximation (aceita lote na última dimensão)"""
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    edges = np.linspace(0, n, segments + 1).astype(int)
+    return np.stack([x[..., a:b].mean(axis=-1) for a, b in zip(edges[:-1], edges[1:])], axis=-1)
+
+
+def sax(x: np.ndarray, segments: int = SAX_SEGMENTS) -> np.ndarray:
+    """Palavra SAX (símbolos inteiros) da série z-normalizada"""
+    return np.searchsorted(_BREAKPOINTS, paa(znorm(x), segments))
+
+
+def _resample(x: np.ndarray, length: int) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == length:
+        return x
+    return np.interp(np.linspace(0, len(x) - 1, length), np.arange(len(x)), x)
+
+
+def _builtin_signatures(length: int) -> List[Dict]:
+    t = np.linspace(0, 1, length)
+    return [
+        {"name": "bearing_wear", "field": "vibration", "severity": "high",
+         "description": "Vibração crescente progressiva", "shape": t ** 2},
+        {"name": "imbalance", "field": "vibration", "severity": "medium",
+         "description": "Oscilação periódica de vibração", "shape": np.sin(2 * np.pi * 4 * t)},
+        {"name": "overheating", "field": "temperature", "severity": "high",
+         "description": "Aumento exponencial de temperatura", "shape": np.expm1(3 * t)},
+        {"name": "pressure_leak", "field": "pressure", "severity": "high",
+         "description": "Queda abrupta de pressão", "shape": -1.0 / (1 + np.exp(-30 * (t - 0.5)))},
+        {"name": "motor_stall", "field": "rpm", "severity": "critical",
+         "description": "Queda brusca de rotação", "shape": -(t > 0.7).astype(float)},
+    ]
+
+
+class SignatureLibrary:
+    """Biblioteca de assinaturas de falha indexada por palavras SAX
+
+    A busca usa a distância MINDIST do SAX (limite inferior da distância
+    euclidiana z-normalizada) para descartar assinaturas de forma vetorizada,
+    e calcula a distância exata apenas dos candidatos restantes.
+    """
+
+    def __init__(self, length: int = PATTERN_WINDOW, signatures: Optional[List[Dict]] = None):
+        self.length = length
+        self.version = 0
+        self.signatures: List[Dict] = []
+        self._shapes: Dict[str, np.ndarray] = {}
+        self._words: Dict[str, np.ndarray] = {}
+        for signature in signatures if signatures is not None else _builtin_signatures(length):
+            self.add(**signature)
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def add(self, name: str, field: str, shape, severity: str = "medium", description: str = ""):
+        shape = znorm(_resample(shape, self.length))
+        self.signatures.append({"name": name, "field": field, "severity": severity,
+                                "description": description, "shape": shape})
+        self.version += 1
+        self._rebuild(field)
+
+    def _rebuild(self, field: str):
+        members = [s for s in self.signatures if s["field"] == field]
+        self._shapes[field] = np.stack([s["shape"] for s in members])
+        self._words[field] = sax(self._shapes[field])
+
+    def search(self, field: str, window: np.ndarray, max_distance: float) -> List[Dict]:
+        if field not in self._shapes:
+            return []
+        query = znorm(_resample(window, self.length))
+        word = sax(query)
+        scale = np.sqrt(self.length / SAX_SEGMENTS)
+        lower = scale * np.sqrt((_SYMBOL_DIST[word[None, :], self._words[field]] ** 2).sum(axis=1))
+        candidates = np.flatnonzero(lower <= max_distance)
+        if len(candidates) == 0:
+            return []
+        exact = np.sqrt(((self._shapes[field][candidates] - query) ** 2).sum(axis=1))
+        members = [s for s in self.signatures if s["field"] == field]
+        matches = []
+        for i, distance in zip(candidates, exact):
+            if distance <= max_distance:
+                s = members[i]
+                matches.append({"signature": s["name"], "field": field, "severity": s["severity"],
+                                "description": s["description"], "distance": round(float(distance), 4)})
+        return sorted(matches, key=lambda m: m["distance"])
+
+    # ===== Persistência =====
+    def save(self, path: str = PATTERN_LIBRARY_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        data = [{**s, "shape": s["shape"].round(6).tolist()} for s in self.signatures]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"length": self.length, "signatures": data}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = PATTERN_LIBRARY_PATH) -> "SignatureLibrary":
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            data = json.load(f)
+        return cls(length=data["length"], signatures=data["signatures"])
+
+
+# ===== Análise =====
+def history_columns(history: List[Dict], fields: List[str] = PATTERN_FIELDS) -> Dict[str, np.ndarray]:
+    """Converter o histórico (lista de leituras) em colunas NumPy, mais o intervalo de amostragem"""
+    columns = {}
+    for field in fields:
+        values = [r.get(field) for r in history]
+        if values and all(isinstance(v, (int, float)) for v in values):
+            columns[field] = np.asarray(values, dtype=np.float64)
+    columns["_interval"] = _sample_interval(history)
+    return columns
+
+
+def _sample_interval(history: List[Dict]) -> float:
+    times = []
+    for r in history[-64:]:
+        ts = r.get("timestamp")
+        if isinstance(ts, str):
+            try:
+                ts = datetime.fromisoformat(ts.replace("Z", "+00:00")).replace(tzinfo=None)
+            except ValueError:
+                continue
+        if isinstance(ts, datetime):
+            times.append(ts.timestamp())
+    if len(times) < 2:
+        return 1.0
+    diffs = np.diff(times)
+    diffs = diffs[diffs > 0]
+    return float(np.median(diffs)) if len(diffs) else 1.0
+
+
+def analyze_columns(columns: Dict[str, np.ndarray], library: SignatureLibrary, window: int = PATTERN_WINDOW,
+                    top: int = 3, match_distance: Optional[float] = None) -> Dict:
+    """Motifs/discords, periodicidade e assinaturas de falha de um dispositivo"""
+    interval = columns.get("_interval", 1.0)
+    fields = [f for f in PATTERN_FIELDS if f in columns]
+    samples = len(columns[fields[0]]) if fields else 0
+    if samples < 2 * window:
+        return {"status": "insufficient_history", "samples": samples, "required": 2 * window}
+
+    # Limite de casamento: fração da distância máxima entre janelas z-normalizadas
+    match_distance = match_distance if match_distance is not None else 0.35 * np.sqrt(2 * window)
+    motifs, discords, periodic, matches = {}, {}, {}, []
+    for field in fields:
+        series = columns[field]
+        if series.std() < 1e-8:
+            continue
+        profile, index = matrix_profile(series, window)
+        motifs[field] = top_k(profile, index, top, window, largest=False)
+        discords[field] = top_k(profile, index, top, window, largest=True)
+        if field in PERIODIC_FIELDS:
+            periodic[field] = periodicity(series, interval)
+        matches.extend(library.search(field, series[-window:], match_distance))
+
+    return {
+        "status": "ok",
+        "samples": samples,
+        "window": window,
+        "motifs": motifs,
+        "discords": discords,
+        "periodicity": periodic,
+        "signature_matches": sorted(matches, key=lambda m: m["distance"]),
+    }
+
+
+# Estado dos processos do pool (biblioteca carregada uma vez por processo)
+_worker_library: Optional[SignatureLibrary] = None
+
+
+def _init_worker(length: int, signatures: List[Dict]):
+    global _worker_library
+    _worker_library = SignatureLibrary(length, signatures)
+
+
+def _analyze_chunk(items: List[tuple]) -> Dict[str, Dict]:
+    return {device_id: analyze_columns(columns, _worker_library, window)
+            for device_id, columns, window in items}
+
+
+class PatternEngine:
+    """Detecção de padrões em séries temporais por dispositivo e em lote para a frota"""
+
+    def __init__(self, library: Optional[SignatureLibrary] = None, window: int = PATTERN_WINDOW,
+                 workers: int = PATTERN_WORKERS):
+        self.library = library or SignatureLibrary.load()
+        self.window = window
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            signatures = [{k: v for k, v in s.items()} for s in self.library.signatures]
+            # spawn: fork com o event loop e as threads dos shards ativos não é seguro
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                                             initializer=_init_worker,
+                                             initargs=(self.library.length, signatures))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def add_signature(self, **signature):
+        self.library.add(**signature)
+        self.close()  # Workers precisam da biblioteca nova
+
+    def analyze(self, history: List[Dict]) -> Dict:
+        return analyze_columns(history_columns(history), self.library, self.window)
+
+    async def analyze_fleet(self, histories: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+        """Analisar muitos dispositivos distribuindo blocos entre todos os núcleos"""
+        items = [(device_id, history_columns(h), self.window) for device_id, h in histories.items()]
+        if not items:
+            return {}
+        loop = asyncio.get_running_loop()
+        if self.workers <= 1 or len(items) < 4:
+            return await loop.run_in_executor(
+                None, lambda: {d: analyze_columns(c, self.library, w) for d, c, w in items})
+        pool = self._get_pool()
+        size = max(1, len(items) // (self.workers * 4))
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        results = await asyncio.gather(*[loop.run_in_executor(pool, _analyze_chunk, chunk) for chunk in chunks])
+        merged: Dict[str, Dict] = {}
+        for result in results:
+            merged.update(result)
+        return merged
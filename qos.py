@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+QOS_CAPACITY = int(os.getenv("NEXUS_QOS_CAPACITY", "64"))
+
+
+class Priority(IntEnum):
+    CRITICAL = 0    # Alertas
+    DASHBOARD = 1   # Telemetria para dashboards
+    ANALYSIS = 2    # Análises ad-hoc
+
+
+# Fração da capacidade global que cada classe pode ocupar: o restante fica
+# reservado para as classes de maior prioridade
+PRIORITY_SHARE = {
+    Priority.CRITICAL: 1.0,
+    Priority.DASHBOARD: 0.8,
+    Priority.ANALYSIS: 0.5,
+}
+
+
+class RouteStats:
+    def __init__(self, name: str, priority: Priority, max_concurrency: int):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.inflight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.degraded = 0
+        self.latencies = deque(maxlen=1024)
+        self.latency_ewma = 0.0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class Ticket:
+    __slots__ = ("route", "degraded", "started")
+
+    def __init__(self, route: RouteStats, degraded: bool):
+        self.route = route
+        self.degraded = degraded
+        self.started = time.perf_counter()
+
+
+class AdmissionController:
+    """Controle de admissão com limites por rota e classes de prioridade
+
+    Rotas de menor prioridade só são admitidas enquanto a ocupação global
+    estiver abaixo da sua fatia da capacidade, mantendo folga para alertas.
+    Acima de degrade_at (ou quando a latência da rota passa do alvo) as
+    requisições são admitidas em modo degradado, e o handler deve usar o
+    caminho barato (scores em cache, sem Isolation Forest).
+    """
+
+    def __init__(
+        self,
+        capacity: int = QOS_CAPACITY,
+        degrade_at: float = 0.7,
+        latency_target: float = 0.25,
+        queue_timeout: float = 0.05,
+    ):
+        self.capacity = capacity
+        self.degrade_at = degrade_at
+        self.latency_target = latency_target
+        self.queue_timeout = queue_timeout
+        self.routes: Dict[str, RouteStats] = {}
+        self.inflight = 0
+        self._waiters = deque()
+
+    def register(self, name: str, priority: Priority, max_concurrency: Optional[int] = None):
+        self.routes[name] = RouteStats(name, priority, max_concurrency or self.capacity)
+
+    def _limit(self, route: RouteStats) -> float:
+        return self.capacity * PRIORITY_SHARE[route.priority]
+
+    def try_acquire(self, name: str) -> Optional[Ticket]:
+        """Admitir sem esperar; retorna None se a requisição deve ser descartada"""
+        route = self.routes[name]
+        if route.inflight >= route.max_concurrency or self.inflight >= self._limit(route):
+            return None
+        degraded = route.priority != Priority.CRITICAL and (
+            self.inflight >= self.degrade_at * self._limit(route)
+            or route.latency_ewma > self.latency_target
+        )
+        route.inflight += 1
+        route.admitted += 1
+        if degraded:
+            route.degraded += 1
+        self.inflight += 1
+        return Ticket(route, degraded)
+
+    def release(self, ticket: Ticket):
+        route = ticket.route
+        elapsed = time.perf_counter() - ticket.started
+        route.inflight -= 1
+        self.inflight -= 1
+        route.latencies.append(elapsed)
+        route.latency_ewma = 0.9 * route.latency_ewma + 0.1 * elapsed
+        # Acordar todos: o primeiro da fila pode não caber na sua fatia e a
+        # vaga ficaria ociosa; quem não for admitido volta para a fila
+        waiters, self._waiters = self._waiters, deque()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def acquire(self, name: str) -> Optional[Ticket]:
+        """Admitir esperando no máximo queue_timeout por uma vaga"""
+        ticket = self.try_acquire(name)
+        if ticket is not None or self.queue_timeout <= 0:
+            return ticket
+        deadline = time.monotonic() + self.queue_timeout
+        while ticket is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                break
+            ticket = self.try_acquire(name)
+        return ticket
+
+    @asynccontextmanager
+    async def admit(self, name: str):
+        """Context manager para endpoints HTTP; responde 503 ao descartar"""
+        ticket = await self.acquire(name)
+        if ticket is None:
+            self.routes[name].shed += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Sistema sobrecarregado, tente novamente",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def record_shed(self, name: str):
+        self.routes[name].shed += 1
+
+    def stats(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "inflight": self.inflight,
+            "routes": {
+                name: {
+                    "priority": route.priority.name.lower(),
+                    "inflight": route.inflight,
+                    "admitted": route.admitted,
+                    "shed": route.shed,
+                    "degraded": route.degraded,
+                    "p50_ms": _ms(route.percentile(0.5)),
+                    "p99_ms": _ms(route.percentile(0.99)),
+                }
+                for name, route in self.routes.items()
+            },
+        }
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
@@ -0,0 +1,207 @@
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None  # Backend Redis é opcional
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+KEY_PREFIX = os.getenv("NEXUS_CLUSTER_PREFIX", "nexus")
+
+
+class SlidingWindow:
+    """Contador de janela deslizante aproximada: duas janelas fixas, memória O(1)"""
+    __slots__ = ("window_start", "current", "previous", "expires")
+
+    def __init__(self, window_start: float):
+        self.window_start = window_start
+        self.current = 0
+        self.previous = 0
+        self.expires = 0.0
+
+    def roll(self, now: float, window: float):
+        elapsed = int((now - self.window_start) // window)
+        if elapsed >= 1:
+            self.previous = self.current if elapsed == 1 else 0
+            self.current = 0
+            self.window_start += elapsed * window
+
+    def estimate(self, now: float, window: float) -> float:
+        weight = 1.0 - (now - self.window_start) / window
+        return self.previous * max(0.0, weight) + self.current
+
+
+class InMemoryRateLimitBackend:
+    """Backend local: contadores e bloqueios com expiração e limite de chaves"""
+
+    def __init__(self, max_keys: int = 200000):
+        self.max_keys = max_keys
+        self.counters: Dict[str, SlidingWindow] = {}
+        self.locks: Dict[str, float] = {}
+
+    def _evict(self, now: float):
+        # Chaves são reinseridas a cada uso, então as mais antigas ficam no início:
+        # despejar pela cabeça enquanto expiradas, e forçar se ainda estiver cheio
+        for store, expiry in ((self.counters, lambda c: c.expires), (self.locks, lambda until: until)):
+            while store:
+                key = next(iter(store))
+                if expiry(store[key]) > now and len(store) < self.max_keys:
+                    break
+                del store[key]
+
+    async def hit(self, key: str, window: float, amount: int = 1) -> float:
+        now = time.monotonic()
+        counter = self.counters.pop(key, None)
+        if counter is None:
+            if len(self.counters) >= self.max_keys:
+                self._evict(now)
+            counter = SlidingWindow(now)
+        counter.roll(now, window)
+        counter.current += amount
+        counter.expires = counter.window_start + 2 * window
+        self.counters[key] = counter  # Reinserir no fim (ordem de uso recente)
+        return counter.estimate(now, window)
+
+    async def peek(self, key: str, window: float) -> float:
+        counter = self.counters.get(key)
+        if counter is None:
+            return 0.0
+        now = time.monotonic()
+        counter.roll(now, window)
+        return counter.estimate(now, window)
+
+    async def reset(self, key: str, window: float):
+        self.counters.pop(key, None)
+
+    async def lock(self, key: str, seconds: float):
+        if len(self.locks) >= self.max_keys:
+            self._evict(time.monotonic())
+        self.locks.pop(key, None)
+        self.locks[key] = time.monotonic() + seconds
+
+    async def locked_for(self, key: str) -> float:
+        until = self.locks.get(key)
+        if until is None:
+            return 0.0
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            del self.locks[key]
+            return 0.0
+        return remaining
+
+
+class RedisRateLimitBackend:
+    """Backend compartilhado entre workers (Redis ou compatível)"""
+
+    def __init__(self, url: str):
+        self.client = aioredis.from_url(url, decode_responses=True)
+
+    def _keys(self, key: str, window: float):
+        window_id = int(time.time() // window)
+        base = f"{KEY_PREFIX}:rl:{key}"
+        return f"{base}:{window_id}", f"{base}:{window_id - 1}", (time.time() % window) / window
+
+    async def hit(self, key: str, window: float, amount: int = 1) -> float:
+        current_key, previous_key, progress = self._keys(key, window)
+        pipe = self.client.pipeline()
+        pipe.incrby(current_key, amount)
+        pipe.expire(current_key, int(2 * window) + 1)
+        pipe.get(previous_key)
+        current, _, previous = await pipe.execute()
+        return int(previous or 0) * (1.0 - progress) + int(current)
+
+    async def peek(self, key: str, window: float) -> float:
+        current_key, previous_key, progress = self._keys(key, window)
+        current, previous = await self.client.mget(current_key, previous_key)
+        return int(previous or 0) * (1.0 - progress) + int(current or 0)
+
+    async def reset(self, key: str, window: float):
+        # Só as janelas atual e anterior entram na estimativa: apagar direto,
+        # sem SCAN (que varre o keyspace e trataria * ou ? no usuário como glob)
+        current_key, previous_key, _ = self._keys(key, window)
+        await self.client.delete(current_key, previous_key)
+
+    async def lock(self, key: str, seconds: float):
+        await self.client.set(f"{KEY_PREFIX}:lock:{key}", "1", ex=max(1, int(seconds)))
+
+    async def locked_for(self, key: str) -> float:
+        ttl = await self.client.ttl(f"{KEY_PREFIX}:lock:{key}")
+        return float(ttl) if ttl and ttl > 0 else 0.0
+
+
+def create_rate_limit_backend():
+    if REDIS_URL and aioredis is not None:
+        return RedisRateLimitBackend(REDIS_URL)
+    return InMemoryRateLimitBackend()
+
+
+class LoginRateLimiter:
+    """Limite de tentativas e bloqueio por força bruta nos endpoints de login
+
+    check() roda antes do bcrypt: IPs e usuários bloqueados ou acima do
+    limite são rejeitados sem custo de hash de senha.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ip_attempts: tuple = (30, 60),      # tentativas por IP (limite, janela em s)
+        ip_failures: tuple = (10, 300),     # falhas por IP antes do bloqueio
+        user_failures: tuple = (5, 900),    # falhas por usuário antes do bloqueio
+        lockout_seconds: float = 900,
+    ):
+        self.backend = backend or create_rate_limit_backend()
+        self.ip_attempts = ip_attempts
+        self.ip_failures = ip_failures
+        self.user_failures = user_failures
+        self.lockout_seconds = lockout_seconds
+        # Destino dos eventos de segurança (ex.: SecurityMonitor.log_security_event)
+        self.event_sink: Optional[Callable[[str, str, Dict], Awaitable[None]]] = None
+        self.stats = {"rejected": 0, "lockouts": 0}
+
+    async def _emit(self, event_type: str, severity: str, details: Dict):
+        if self.event_sink is None:
+            return
+        try:
+            await self.event_sink(event_type, severity, details)
+        except Exception as e:
+            logger.error(f"Erro ao registrar evento de login: {e}")
+
+    async def check(self, ip: str, username: str) -> Optional[int]:
+        """Retorna segundos para nova tentativa se a requisição deve ser rejeitada"""
+        for key in (f"ip:{ip}", f"user:{username}"):
+            remaining = await self.backend.locked_for(key)
+            if remaining > 0:
+                self.stats["rejected"] += 1
+                return int(remaining) + 1
+
+        limit, window = self.ip_attempts
+        attempts = await self.backend.hit(f"attempts:{ip}", window)
+        if attempts > limit:
+            self.stats["rejected"] += 1
+            if attempts <= limit + 1:
+                # Registrar apenas ao cruzar o limite, não a cada rejeição
+                await self._emit("login_rate_limited", "medium", {"source_ip": ip, "username": username})
+            return int(window)
+        return None
+
+    async def record_failure(self, ip: str, username: str):
+        limit, window = self.ip_failures
+        if await self.backend.hit(f"fail:ip:{ip}", window) >= limit:
+            await self._lock(f"ip:{ip}", {"source_ip": ip, "username": username, "reason": "ip_failures"})
+        limit, window = self.user_failures
+        if await self.backend.hit(f"fail:user:{username}", window) >= limit:
+            await self._lock(f"user:{username}", {"source_ip": ip, "username": username, "reason": "user_failures"})
+
+    async def record_success(self, ip: str, username: str):
+        await self.backend.reset(f"fail:user:{username}", self.user_failures[1])
+
+    async def _lock(self, key: str, details: Dict):
+        await self.backend.lock(key, self.lockout_seconds)
+        self.stats["lockouts"] += 1
+        await self._emit("brute_force_lockout", "high", {**details, "lockout_seconds": self.lockout_seconds})
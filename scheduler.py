@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from cluster import stable_hash
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_SHARDS = int(os.getenv("NEXUS_SCHEDULER_SHARDS", str(os.cpu_count() or 4)))
+SCHEDULER_IDLE_TTL = float(os.getenv("NEXUS_SCHEDULER_IDLE_TTL", "3600"))
+
+
+class DeviceState:
+    """Estado local de um dispositivo, acessado apenas pelo shard dono"""
+    __slots__ = ("device_id", "history", "health_score", "readings", "last_active", "data")
+
+    def __init__(self, device_id: str, history_size: int):
+        self.device_id = device_id
+        self.history = deque(maxlen=history_size)
+        self.health_score: Optional[float] = None
+        self.readings = 0
+        self.last_active = time.monotonic()
+        self.data: Dict[str, Any] = {}  # Estado extra das análises registradas
+
+
+class Shard:
+    """Fila e estados de um worker do scheduler"""
+
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.states: Dict[str, DeviceState] = {}
+        self.pending = Counter()   # Leituras em fila por dispositivo
+        self.load = Counter()      # Leituras processadas desde o último rebalanceamento
+        self.processed = 0
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+
+class DeviceScheduler:
+    """Scheduler de atores por dispositivo
+
+    Cada dispositivo pertence a exatamente um shard, que processa suas
+    leituras em ordem e mantém seu estado localmente - sem locks. Quando um
+    shard fica quente, dispositivos ociosos (sem leituras em fila) migram
+    para o shard mais frio, o que preserva a ordem por dispositivo.
+
+    Com use_threads e handler síncrono, cada shard roda numa thread própria
+    (handlers NumPy liberam o GIL). Estados sem leitura há idle_ttl
+    segundos são descartados no ciclo de rebalanceamento.
+    """
+
+    def __init__(
+        self,
+        handler: Callable,
+        num_shards: int = SCHEDULER_SHARDS,
+        queue_size: int = 10000,
+        history_size: int = 512,
+        rebalance_interval: float = 5.0,
+        hot_ratio: float = 2.0,
+        use_threads: bool = False,
+        idle_ttl: float = SCHEDULER_IDLE_TTL,
+    ):
+        self.handler = handler
+        self.is_async_handler = asyncio.iscoroutinefunction(handler)
+        self.history_size = history_size
+        self.rebalance_interval = rebalance_interval
+        self.hot_ratio = hot_ratio
+        self.use_threads = use_threads
+        self.idle_ttl = idle_ttl
+        self.evicted = 0
+        self.shards = [Shard(i, queue_size) for i in range(max(1, num_shards))]
+        self.overrides: Dict[str, int] = {}
+        self.migrations = 0
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        if self._tasks:
+            return
+        for shard in self.shards:
+            if self.use_threads and not self.is_async_handler:
+                # Uma thread por shard: handlers NumPy liberam o GIL e escalam entre núcleos
+                shard.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shard-{shard.index}")
+            self._tasks.append(asyncio.create_task(self._run_shard(shard)))
+        self._tasks.append(asyncio.create_task(self._rebalance_loop()))
+        logger.info(f"⚙️  Scheduler de dispositivos iniciado com {len(self.shards)} shards")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        for shard in self.shards:
+            if shard.executor:
+                shard.executor.shutdown(wait=False)
+                shard.executor = None
+
+    def shard_for(self, device_id: str) -> Shard:
+        index = self.overrides.get(device_id)
+        if index is None:
+            index = stable_hash(device_id) % len(self.shards)
+        return self.shards[index]
+
+    def submit_nowait(self, device_id: str, reading: Dict) -> asyncio.Future:
+        """Enfileirar leitura no shard dono; levanta asyncio.QueueFull se saturado"""
+        shard = self.shard_for(device_id)
+        future = asyncio.get_running_loop().create_future()
+        shard.queue.put_nowait((device_id, reading, future))
+        shard.pending[device_id] += 1
+        return future
+
+    async def submit(self, device_id: str, reading: Dict) -> Any:
+        """Processar leitura no shard dono e aguardar o resultado"""
+        shard = self.shard_for(device_id)
+        future = asyncio.get_running_loop().create_future()
+        shard.pending[device_id] += 1
+        await shard.queue.put((device_id, reading, future))
+        return await future
+
+    def get_state(self, device_id: str) -> Optional[DeviceState]:
+        return self.shard_for(device_id).states.get(device_id)
+
+    def iter_states(self):
+        for shard in self.shards:
+            yield from shard.states.values()
+
+    async def _run_shard(self, shard: Shard):
+        loop = asyncio.get_running_loop()
+        while True:
+            device_id, reading, future = await shard.queue.get()
+            state = shard.states.get(device_id)
+            if state is None:
+                state = shard.states[device_id] = DeviceState(device_id, self.history_size)
+            try:
+                if self.is_async_handler:
+                    result = await self.handler(state, reading)
+                elif shard.executor:
+                    result = await loop.run_in_executor(shard.executor, self.handler, state, reading)
+                else:
+                    result = self.handler(state, reading)
+                state.readings += 1
+                state.last_active = time.monotonic()
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Erro ao processar leitura de {device_id}: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                shard.processed += 1
+                shard.load[device_id] += 1
+                shard.pending[device_id] -= 1
+                if shard.pending[device_id] <= 0:
+                    del shard.pending[device_id]
+
+    async def _rebalance_loop(self):
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            self.rebalance()
+            self.evict_idle()
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Descartar estados de dispositivos sem leituras há idle_ttl segundos"""
+        now = now if now is not None else time.monotonic()
+        evicted = 0
+        for shard in self.shards:
+            idle = [d for d, s in shard.states.items()
+                    if now - s.last_active >= self.idle_ttl and not shard.pending.get(d)]
+            for device_id in idle:
+                del shard.states[device_id]
+                self.overrides.pop(device_id, None)
+            evicted += len(idle)
+        self.evicted += evicted
+        return evicted
+
+    def rebalance(self) -> int:
+        """Migrar dispositivos ociosos do shard mais quente para o mais frio"""
+        if len(self.shards) < 2:
+            return 0
+        by_load = sorted(self.shards, key=lambda s: sum(s.load.values()))
+        cold, hot = by_load[0], by_load[-1]
+        hot_load, cold_load = sum(hot.load.values()), sum(cold.load.values())
+        moved = 0
+        if hot_load > self.hot_ratio * max(cold_load, 1):
+            target = (hot_load - cold_load) / 2
+            # Mover primeiro os dispositivos mais ativos que não têm leituras em fila
+            for device_id, count in hot.load.most_common():
+                if target <= 0:
+                    break
+                if hot.pending.get(device_id) or count > target or device_id not in hot.states:
+                    continue
+                cold.states[device_id] = hot.states.pop(device_id)
+                self.overrides[device_id] = cold.index
+                target -= count
+                moved += 1
+        for shard in self.shards:
+            shard.load.clear()
+        self.migrations += moved
+        if moved:
+            logger.info(f"🔀 {moved} dispositivos migrados do shard {hot.index} para o shard {cold.index}")
+        return moved
+
+    def stats(self) -> Dict:
+        return {
+            "shards": [
+                {
+                    "index": shard.index,
+                    "devices": len(shard.states),
+                    "queued": shard.queue.qsize(),
+                    "processed": shard.processed,
+                }
+                for shard in self.shards
+            ],
+            "migrations": self.migrations,
+            "evicted": self.evicted,
+        }
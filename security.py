@@ -1,29 +1,82 @@
-import hashlib
-import hmac
 import base64
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Sequence, Union
 import jwt
 from passlib.context import CryptContext
-from cryptography.fernet import Fernet
-import ipaddress
+import logging
+import os
 import re
+from alert_bus import AlertBus
+from crypto_service import CryptoService
+from firewall import Firewall
+from log_pipeline import SecurityLogPipeline
+from threat_store import ThreatStore
+
+logger = logging.getLogger(__name__)
 
 # Configuração de criptografia
 SECRET_KEY = "your-super-secret-key-2025-digital-factory"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Segredo próprio dos webhooks (nunca a chave do JWT); sem ele, webhooks assinados são recusados
+WEBHOOK_SECRET = os.getenv("NEXUS_WEBHOOK_SECRET")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-fernet_key = Fernet.generate_key()
-cipher_suite = Fernet(fernet_key)
 
 class SecurityMonitor:
     def __init__(self):
-        self.threats = []
+        self.threats = ThreatStore()
         self.scans = []
         self.firewall_rules = self.load_firewall_rules()
+        self.firewall = Firewall(self.firewall_rules)
         self.encryption_active = True
+        self.crypto = CryptoService(hmac_secret=WEBHOOK_SECRET.encode() if WEBHOOK_SECRET else None)
+        if not WEBHOOK_SECRET:
+            logger.warning("⚠️ NEXUS_WEBHOOK_SECRET não definido: webhooks assinados serão recusados")
+        self.cluster = None
+        self.alert_bus = AlertBus()
+        self.log_pipeline = SecurityLogPipeline(self)
+    
+    async def start(self):
+        """Iniciar barramento de alertas e pipeline de logs em background"""
+        await self.alert_bus.start()
+        await self.log_pipeline.start()
+    
+    async def stop(self):
+        await self.log_pipeline.stop()
+        await self.alert_bus.stop()
+        self.crypto.close()
+    
+    def process_splunk_logs(self, payload) -> bool:
+        """Enfileirar logs do Splunk para o pipeline de correlação"""
+        return self.log_pipeline.enqueue(payload)
+    
+    def is_running(self) -> bool:
+        return self.alert_bus.running
+    
+    def attach_cluster(self, cluster):
+        """Replicar eventos de segurança entre os workers do cluster"""
+        self.cluster = cluster
+        cluster.subscribe("security.events", self._on_remote_event, include_own=False)
+        cluster.subscribe("alerts", self._on_remote_alert, include_own=False)
+        cluster.subscribe("security.resolved", self._on_remote_resolve, include_own=False)
+        cluster.subscribe("crypto.rotated", self._on_remote_rotate, include_own=False)
+    
+    async def _on_remote_event(self, message: Dict):
+        event = {k: v for k, v in message.items() if k != "_origin"}
+        event["timestamp"] = datetime.fromisoformat(event["timestamp"])
+        self.threats.insert(event)
+    
+    async def _on_remote_resolve(self, message: Dict):
+        self.threats.resolve(message["id"])
+    
+    async def _on_remote_rotate(self, message: Dict):
+        self.crypto.reload_keys()
+    
+    async def _on_remote_alert(self, message: Dict):
+        # Alerta já deduplicado, limitado e persistido no worker de origem
+        self.alert_bus.deliver({k: v for k, v in message.items() if k != "_origin"}, persist=False)
         
     def load_firewall_rules(self) -> List[Dict]:
         return [
@@ -34,55 +87,62 @@ class SecurityMonitor:
     
     async def verify_signature(self, signature: str, payload: bytes) -> bool:
         """Verificar assinatura HMAC"""
-        expected_signature = hmac.new(
-            SECRET_KEY.encode(),
-            payload,
-            hashlib.sha256
-        ).hexdigest()
-        return hmac.compare_digest(signature, expected_signature)
+        return await self.crypto.verify(signature, payload)
+    
+    def webhooks_enabled(self) -> bool:
+        return self.crypto.hmac_secret is not None
+    
+    async def read_verified_body(self, chunks, signature: Optional[str]) -> Optional[bytes]:
+        """Ler corpo da requisição em streaming verificando o HMAC"""
+        return await self.crypto.read_verified(chunks, signature)
     
     def encrypt_data(self, data: str) -> str:
         """Criptografar dados sensíveis"""
         if not self.encryption_active:
             return data
-        return cipher_suite.encrypt(data.encode()).decode()
+        return self.crypto.encrypt(data)
     
     def decrypt_data(self, encrypted_data: str) -> str:
         """Descriptografar dados"""
         if not self.encryption_active:
             return encrypted_data
-        return cipher_suite.decrypt(encrypted_data.encode()).decode()
+        return self.crypto.decrypt(encrypted_data)
+    
+    async def encrypt_records(self, records: List[Dict]) -> List[str]:
+        """Criptografar lote de registros no pool de processos"""
+        return await self.crypto.encrypt_records(records)
     
-    def check_ip_threat(self, ip_address: str) -> bool:
+    async def decrypt_records(self, tokens: List[str]) -> List[Dict]:
+        return await self.crypto.decrypt_records(tokens)
+    
+    async def rotate_encryption_key(self):
+        """Rotacionar chave ativa (chaves anteriores seguem válidas para leitura)"""
+        self.crypto.rotate_key()
+        if self.cluster is not None:
+            # Os demais workers releem o keyring; quem perder o aviso relê ao falhar um decrypt
+            await self.cluster.publish("crypto.rotated", {})
+    
+    def reload_firewall_rules(self, rules: List[Dict]):
+        """Recompilar regras de firewall (troca atômica do conjunto ativo)"""
+        self.firewall.reload(rules)
+        self.firewall_rules = rules
+    
+    def check_ip_threat(self, ip_address: str, port: Optional[int] = None) -> bool:
         """Verificar se IP está em lista negra"""
-        try:
-            ip = ipaddress.ip_address(ip_address)
-            
-            # Verificar IPs privados (permitir apenas em ambientes internos)
-            if ip.is_private:
-                return True
-                
-            # Verificar regras de firewall
-            for rule in self.firewall_rules:
-                network = ipaddress.ip_network(rule["ip_range"])
-                if ip in network:
-                    return rule["rule"] == "allow"
-                    
-        except ValueError:
-            return False
-        return True
+        # IPs privados são liberados (apenas em ambientes internos); depois
+        # vale a primeira regra de firewall que cobre o IP e a porta
+        return self.firewall.is_allowed(ip_address, port)
+    
+    def check_ip_threats(self, ip_addresses: List[str],
+                         port: Union[None, int, Sequence[Optional[int]]] = None) -> List[bool]:
+        """Verificar um lote de IPs (ex.: logs do Splunk); port pode ser uma lista, uma por IP"""
+        return self.firewall.check_batch(ip_addresses, port)
     
     async def log_security_event(self, event_type: str, severity: str, details: Dict):
         """Registrar evento de segurança"""
-        event = {
-            "id": hashlib.md5(f"{event_type}{datetime.utcnow().isoformat()}".encode()).hexdigest(),
-            "event_type": event_type,
-            "severity": severity,
-            "timestamp": datetime.utcnow(),
-            "details": details,
-            "resolved": False
-        }
-        self.threats.append(event)
+        event = self.threats.add(event_type, severity, details)
+        if self.cluster is not None:
+            await self.cluster.publish("security.events", event)
         
         # Alertar se for crítica
         if severity in ["high", "critical"]:
@@ -90,17 +150,50 @@ class SecurityMonitor:
     
     async def trigger_alert(self, event: Dict):
         """Disparar alerta de segurança"""
-        # Implementar notificações (email, Slack, etc.)
-        print(f"🚨 ALERTA DE SEGURANÇA: {event}")
+        alert = self.alert_bus.publish(event)
+        if alert is None:
+            return  # Duplicado ou acima do limite da origem
+        logger.warning(f"🚨 ALERTA DE SEGURANÇA: {alert['event_type']} ({alert['severity']}) - {alert['source']}")
+        if self.cluster is not None:
+            await self.cluster.publish("alerts", alert)
     
-    def get_status(self) -> Dict:
+    async def get_status(self) -> Dict:
         return {
             "encryption": "AES-256" if self.encryption_active else "INACTIVE",
             "firewall_rules": len(self.firewall_rules),
-            "active_threats": len([t for t in self.threats if not t["resolved"]]),
+            "active_threats": self.threats.unresolved_count,
+            "threats": self.threats.summary(),
             "last_scan": self.scans[-1]["timestamp"] if self.scans else None,
             "compliance": ["ISO 27001", "NIST", "GDPR"]
         }
+    
+    async def get_recent_threats(
+        self,
+        hours: int = 24,
+        severity: Optional[str] = None,
+        event_type: Optional[str] = None,
+        resolved: Optional[bool] = None,
+        limit: int = 100
+    ) -> Dict:
+        """Ameaças das últimas horas, mais recentes primeiro"""
+        since = datetime.utcnow() - timedelta(hours=hours)
+        return {
+            "total": self.threats.count(since, severity=severity, event_type=event_type, resolved=resolved),
+            "threats": self.threats.query(
+                since=since,
+                severity=severity,
+                event_type=event_type,
+                resolved=resolved,
+                limit=limit
+            )
+        }
+    
+    async def resolve_threat(self, event_id: str) -> bool:
+        if not self.threats.resolve(event_id):
+            return False
+        if self.cluster is not None:
+            await self.cluster.publish("security.resolved", {"id": event_id})
+        return True
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -0,0 +1,372 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+
+from flat_forest import FLAT_FOREST_DIR, FlatIsolationForest
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+QUANTIZED_MODES = ("float16", "int8")
+INT8_MAX = 127
+ISOLATION_FOREST_FILE = "isolation_forest.pkl"
+SUPPORTED_LAYERS = {"LSTM", "BatchNormalization", "Dropout", "Dense"}
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
+
+def export_shared_model(detector, directory: str):
+    """Exportar pesos do detector para arquivos .npy compartilháveis via mmap
+
+    Cada exportação vira uma versão nova (.<nome>-<versão>) e directory é
+    um symlink trocado atomicamente para ela: workers concorrentes nunca
+    veem uma exportação parcial e um modelo retreinado sempre substitui o
+    anterior. Quem já mapeou a versão antiga continua com ela até recarregar.
+    """
+    target = Path(directory)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".export-", dir=target.parent))
+
+    layers = []
+    for index, layer in enumerate(detector.model.layers):
+        kind = type(layer).__name__
+        if kind not in SUPPORTED_LAYERS:
+            shutil.rmtree(staging)
+            raise ValueError(f"Camada não suportada para exportação: {kind}")
+        config = layer.get_config()
+        files = []
+        for w_index, weights in enumerate(layer.get_weights()):
+            name = f"layer{index}_{w_index}.npy"
+            np.save(staging / name, np.ascontiguousarray(weights, dtype=np.float32))
+            files.append(name)
+        layers.append({
+            "type": kind,
+            "activation": config.get("activation", "linear"),
+            "recurrent_activation": config.get("recurrent_activation", "sigmoid"),
+            "epsilon": config.get("epsilon", 1e-3),
+            "weights": files,
+        })
+
+    np.save(staging / "scaler_mean.npy", np.asarray(detector.scaler.mean_, dtype=np.float64))
+    np.save(staging / "scaler_scale.npy", np.asarray(detector.scaler.scale_, dtype=np.float64))
+    if hasattr(detector.isolation_forest, "estimators_"):
+        joblib.dump(detector.isolation_forest, staging / ISOLATION_FOREST_FILE)
+        FlatIsolationForest.from_sklearn(detector.isolation_forest).save(staging / FLAT_FOREST_DIR)
+
+    version = f"{time.time_ns()}-{os.getpid()}"
+    with open(staging / MANIFEST_FILE, "w") as f:
+        json.dump({"features": detector.features, "threshold": detector.threshold, "layers": layers,
+                   "cascade_z_max": getattr(detector, "cascade_z_max", None), "version": version}, f)
+
+    _publish_version(staging, target, version)
+    logger.info(f"📦 Modelo exportado para compartilhamento em {target} (versão {version})")
+
+
+def _publish_version(staging: Path, target: Path, version: str, keep: int = 2):
+    """Renomear staging para uma versão e apontar o symlink target para ela"""
+    versioned = target.parent / f".{target.name}-{version}"
+    os.rename(staging, versioned)
+    if target.exists() and not target.is_symlink():
+        # Layout antigo (diretório real): preservar como versão anterior
+        os.rename(target, target.parent / f".{target.name}-legacy-{version}")
+    link = target.parent / f".{target.name}.link-{os.getpid()}"
+    if link.is_symlink():
+        link.unlink()
+    os.symlink(versioned.name, link)
+    os.replace(link, target)
+
+    # Manter só as versões mais recentes (mmaps abertos sobrevivem à remoção dos arquivos)
+    current = os.readlink(target)
+    versions = sorted((p for p in target.parent.glob(f".{target.name}-*") if p.is_dir()),
+                      key=lambda p: p.stat().st_mtime)
+    for old in versions[:-keep]:
+        if old.name != current:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def has_shared_model(directory: str) -> bool:
+    return (Path(directory) / MANIFEST_FILE).exists()
+
+
+def shared_model_mtime(directory: str) -> float:
+    """Instante da exportação em uso (mtime do manifesto da versão apontada)"""
+    return (Path(directory) / MANIFEST_FILE).stat().st_mtime
+
+
+class SharedModel:
+    """Autoencoder avaliado em NumPy sobre pesos mapeados em memória (mmap)
+
+    Todos os workers da mesma máquina compartilham as mesmas páginas de
+    memória dos pesos, sem carregar uma cópia do grafo TensorFlow cada um.
+    """
+
+    def __init__(self, manifest: Dict, layers: List[Dict], mean: np.ndarray, scale: np.ndarray):
+        self.features = manifest["features"]
+        self.threshold = manifest["threshold"]
+        self.cascade_z_max = manifest.get("cascade_z_max")  # Calibrado no treino; None em exportações antigas
+        self.version = manifest.get("version")
+        self.directory: Optional[Path] = None  # Diretório da versão carregada (symlink resolvido)
+        self.layers = layers
+        self.mean = mean
+        self.scale = scale
+
+    @classmethod
+    def load(cls, directory: str) -> "SharedModel":
+        path = Path(directory)
+        with open(path / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        layers = []
+        for spec in manifest["layers"]:
+            weights = [np.load(path / name, mmap_mode="r") for name in spec["weights"]]
+            layers.append({**spec, "arrays": weights})
+        mean = np.load(path / "scaler_mean.npy", mmap_mode="r")
+        scale = np.load(path / "scaler_scale.npy", mmap_mode="r")
+        model = cls(manifest, layers, mean, scale)
+        model.directory = path.resolve()
+        return model
+
+    @staticmethod
+    def load_isolation_forest(directory: str):
+        path = Path(directory) / ISOLATION_FOREST_FILE
+        if not path.exists():
+            return None
+        return joblib.load(path, mmap_mode="r")
+
+    @staticmethod
+    def load_flat_forest(directory: str):
+        """Isolation Forest achatado (arrays mapeados em memória), se exportado"""
+        path = Path(directory) / FLAT_FOREST_DIR
+        if not FlatIsolationForest.exists(path):
+            return None
+        return FlatIsolationForest.load(path)
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Equivalente a StandardScaler.transform"""
+        return (X - self.mean) / self.scale
+
+    def reconstruct(self, X_scaled: np.ndarray) -> np.ndarray:
+        """Forward pass do autoencoder (sequências de comprimento 1)"""
+        h = np.asarray(X_scaled, dtype=np.float32)
+        for spec in self.layers:
+            kind = spec["type"]
+            if kind == "LSTM":
+                h = self._lstm_step(h, spec)
+            elif kind == "BatchNormalization":
+                gamma, beta, mean, var = spec["arrays"]
+                h = gamma * (h - mean) / np.sqrt(var + spec["epsilon"]) + beta
+            elif kind == "Dense":
+                kernel, bias = spec["arrays"]
+                h = _ACTIVATIONS[spec["activation"]](h @ kernel + bias)
+            # Dropout é identidade em inferência
+        return h
+
+    @staticmethod
+    def _lstm_step(x: np.ndarray, spec: Dict) -> np.ndarray:
+        # Com estado inicial zero e um único passo, h0 @ recurrent_kernel = 0
+        # e o termo f * c0 desaparece
+        kernel, _, bias = spec["arrays"]
+        units = kernel.shape[1] // 4
+        z = x @ kernel + bias
+        gate = _ACTIVATIONS[spec["recurrent_activation"]]
+        act = _ACTIVATIONS[spec["activation"]]
+        i = gate(z[:, :units])
+        c = i * act(z[:, 2 * units:3 * units])
+        o = gate(z[:, 3 * units:])
+        return o * act(c)
+
+    def quantize(self, mode: str, calibration: np.ndarray) -> "QuantizedAutoencoder":
+        """Versão quantizada do autoencoder, calibrada com telemetria separada (já normalizada)"""
+        return QuantizedAutoencoder.from_shared(self, mode, calibration)
+
+
+def _quantize_columns(kernel: np.ndarray) -> tuple:
+    """Pesos int8 simétricos com uma escala por coluna (neurônio de saída)"""
+    scale = np.abs(kernel).max(axis=0) / INT8_MAX
+    scale[scale == 0] = 1.0
+    q = np.clip(np.round(kernel / scale), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+class QuantizedAutoencoder:
+    """Forward pass do autoencoder com pesos e ativações em precisão reduzida
+
+    float16: pesos e entradas de cada camada arredondados para float16.
+    int8: pesos int8 por coluna e ativações int8 por camada, com escalas
+    calibradas (percentil 99.99 do |valor| na telemetria de calibração).
+    Produtos inteiros são acumulados via BLAS float32, exatos para as
+    dimensões do modelo. BatchNormalization é dobrada em escala + deslocamento.
+    O threshold é recalibrado para maximizar a concordância das decisões
+    com o modelo em precisão completa, pesando igualmente as leituras que
+    ele marca como anomalia e as normais. model_version amarra o artefato à
+    exportação de onde veio: após um novo modelo compartilhado, o antigo é
+    ignorado e a quantização refeita.
+    """
+
+    def __init__(self, mode: str, layers: List[Dict], threshold: float, agreement: float = None,
+                 positive_agreement: float = None, model_version: Optional[str] = None):
+        if mode not in QUANTIZED_MODES:
+            raise ValueError(f"Modo de quantização inválido: {mode}")
+        self.mode = mode
+        self.layers = layers
+        self.threshold = threshold
+        self.agreement = agreement
+        self.positive_agreement = positive_agreement
+        self.model_version = model_version
+
+    @classmethod
+    def from_shared(cls, model: SharedModel, mode: str, calibration: np.ndarray) -> "QuantizedAutoencoder":
+        layers = []
+        h = np.asarray(calibration, dtype=np.float32)
+        for spec in model.layers:
+            kind = spec["type"]
+            if kind == "Dropout":
+                continue
+            if kind == "BatchNormalization":
+                gamma, beta, mean, var = (np.asarray(a, dtype=np.float32) for a in spec["arrays"])
+                scale = gamma / np.sqrt(var + spec["epsilon"])
+                layer = {"type": "affine", "scale": scale, "shift": beta - mean * scale}
+            else:
+                kernel, bias = np.asarray(spec["arrays"][0]), np.asarray(spec["arrays"][-1], dtype=np.float32)
+                layer = {"type": kind, "activation": spec["activation"],
+                         "recurrent_activation": spec.get("recurrent_activation", "sigmoid"), "bias": bias}
+                if mode == "float16":
+                    layer["kernel"] = kernel.astype(np.float16)
+                else:
+                    layer["kernel"], layer["kernel_scale"] = _quantize_columns(kernel)
+                    input_scale = np.percentile(np.abs(h), 99.99) / INT8_MAX
+                    layer["input_scale"] = np.float32(input_scale if input_scale > 0 else 1.0)
+            layers.append(layer)
+            h = cls._apply(layer, h, mode)
+
+        quantized = cls(mode, layers, model.threshold, model_version=model.version)
+        quantized.calibrate_threshold(model, calibration)
+        return quantized
+
+    @staticmethod
+    def _apply(layer: Dict, h: np.ndarray, mode: str) -> np.ndarray:
+        if layer["type"] == "affine":
+            return h * layer["scale"] + layer["shift"]
+        if mode == "float16":
+            z = h.astype(np.float16).astype(np.float32) @ layer["kernel"].astype(np.float32)
+        else:
+            s_in = layer["input_scale"]
+            h_q = np.clip(np.round(h / s_in), -INT8_MAX, INT8_MAX).astype(np.float32)
+            z = (h_q @ layer["kernel"].astype(np.float32)) * (s_in * layer["kernel_scale"])
+        z += layer["bias"]
+        if layer["type"] == "Dense":
+            return _ACTIVATIONS[layer["activation"]](z)
+        # LSTM de um passo com estado inicial zero (ver SharedModel._lstm_step)
+        units = z.shape[1] // 4
+        gate = _ACTIVATIONS[layer["recurrent_activation"]]
+        act = _ACTIVATIONS[layer["activation"]]
+        c = gate(z[:, :units]) * act(z[:, 2 * units:3 * units])
+        return gate(z[:, 3 * units:]) * act(c)
+
+    def reconstruct(self, X_scaled: np.ndarray) -> np.ndarray:
+        h = np.asarray(X_scaled, dtype=np.float32)
+        for layer in self.layers:
+            h = self._apply(layer, h, self.mode)
+        return h
+
+    def calibrate_threshold(self, model: SharedModel, X_scaled: np.ndarray) -> float:
+        """Escolher o threshold quantizado que mais concorda com as decisões do modelo completo
+
+        Com anomalias na calibração, maximiza a média das concordâncias em
+        positivos e negativos: a concordância global seria dominada pelas
+        leituras normais e poderia sacrificar justamente as anomalias.
+        """
+        full = np.mean((X_scaled - model.reconstruct(X_scaled)) ** 2, axis=1) > model.threshold
+        mse = np.mean((X_scaled - self.reconstruct(X_scaled)) ** 2, axis=1)
+        candidates = np.unique(np.concatenate([[model.threshold], np.quantile(mse, np.linspace(0.5, 0.999, 200))]))
+        flagged = mse[None, :] > candidates[:, None]
+        agreement = (flagged == full).mean(axis=1)
+        if full.any() and not full.all():
+            objective = (flagged[:, full].mean(axis=1) + (~flagged[:, ~full]).mean(axis=1)) / 2
+        else:
+            objective = agreement
+        best = int(objective.argmax())
+        self.threshold = float(candidates[best])
+        self.agreement = float(agreement[best])
+        self.positive_agreement = float(flagged[best, full].mean()) if full.any() else None
+        logger.info(f"Autoencoder {self.mode}: concordância {self.agreement:.4f}, nas anomalias "
+                    f"{self.positive_agreement} ({int(full.sum())} positivos, threshold {self.threshold:.5f})")
+        return self.threshold
+
+    def agreement_rate(self, model: SharedModel, X_scaled: np.ndarray) -> Dict:
+        """Concordância das decisões e erro de reconstrução vs precisão completa em dados separados"""
+        full_mse = np.mean((X_scaled - model.reconstruct(X_scaled)) ** 2, axis=1)
+        mse = np.mean((X_scaled - self.reconstruct(X_scaled)) ** 2, axis=1)
+        full, flagged = full_mse > model.threshold, mse > self.threshold
+        return {
+            "mode": self.mode,
+            "samples": len(X_scaled),
+            "positives": int(full.sum()),
+            "agreement": round(float((flagged == full).mean()), 5),
+            # Concordância separada nas anomalias do modelo completo e nas leituras normais
+            "positive_agreement": round(float(flagged[full].mean()), 5) if full.any() else None,
+            "negative_agreement": round(float((~flagged[~full]).mean()), 5) if (~full).any() else None,
+            "mse_relative_error": round(float(np.median(np.abs(mse - full_mse) / np.maximum(full_mse, 1e-12))), 5),
+            "weight_bytes": self.nbytes,
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for layer in self.layers for a in layer.values() if isinstance(a, np.ndarray))
+
+    # ===== Persistência (mmap) =====
+    def save(self, directory: str):
+        """Salvar em quantized_<modo>/ dentro do diretório compartilhado (publicação atômica)"""
+        target = Path(directory) / f"quantized_{self.mode}"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        path = Path(tempfile.mkdtemp(prefix=".quantized-", dir=directory))
+        specs = []
+        for index, layer in enumerate(self.layers):
+            spec, arrays = {}, {}
+            for key, value in layer.items():
+                if isinstance(value, np.ndarray):
+                    np.save(path / f"layer{index}_{key}.npy", value)
+                    arrays[key] = f"layer{index}_{key}.npy"
+                else:
+                    spec[key] = float(value) if isinstance(value, np.floating) else value
+            specs.append({**spec, "arrays": arrays})
+        with open(path / MANIFEST_FILE, "w") as f:
+            json.dump({"mode": self.mode, "threshold": self.threshold, "agreement": self.agreement,
+                       "positive_agreement": self.positive_agreement, "model_version": self.model_version,
+                       "layers": specs}, f)
+        try:
+            os.rename(path, target)
+        except OSError:
+            shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory: str, mode: str, model_version: Optional[str] = None) -> Optional["QuantizedAutoencoder"]:
+        """Carregar o artefato; None se não existe ou foi gerado de outra versão do modelo"""
+        path = Path(directory) / f"quantized_{mode}"
+        if not (path / MANIFEST_FILE).exists():
+            return None
+        with open(path / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        if model_version is not None and manifest.get("model_version") != model_version:
+            logger.info(f"Autoencoder {mode} em {path} é de outra versão do modelo; descartando")
+            return None
+        layers = []
+        for spec in manifest["layers"]:
+            arrays = {key: np.load(path / name, mmap_mode="r") for key, name in spec.pop("arrays").items()}
+            if "input_scale" in spec:
+                spec["input_scale"] = np.float32(spec["input_scale"])
+            layers.append({**spec, **arrays})
+        return cls(manifest["mode"], layers, manifest["threshold"], manifest["agreement"],
+                   manifest.get("positive_agreement"), manifest.get("model_version"))
@@ -0,0 +1,20 @@
+import asyncio
+import json
+
+from alert_bus import AlertBus
+
+
+def test_remote_alerts_are_not_persisted(tmp_path):
+    path = tmp_path / "alerts.jsonl"
+
+    async def scenario():
+        bus = AlertBus(persist_path=str(path))
+        bus.publish({"event_type": "brute_force", "severity": "high", "details": {"source_ip": "10.0.0.1"}})
+        bus.deliver({"event_type": "port_scan", "severity": "medium", "source": "10.0.0.2"}, persist=False)
+        await bus.flush()
+        return bus
+
+    bus = asyncio.run(scenario())
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [alert["event_type"] for alert in lines] == ["brute_force"]
+    assert len(bus.recent()) == 2
@@ -0,0 +1,91 @@
+import asyncio
+
+from ai_engine import AIEngine
+from analysis_graph import AnalysisGraph
+from cluster import ClusterNode, InMemoryBroker
+
+
+def _rows(n, start=0):
+    return [{"timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}", "temperature": 70.0 + i % 7,
+             "vibration": 0.02, "rpm": 1500, "pressure": 100.0} for i in range(start, start + n)]
+
+
+def _graph(calls, version):
+    graph = AnalysisGraph()
+
+    def node(name):
+        async def func(device_id, rows, deps):
+            calls.append(name)
+            return {"rows": len(rows), **deps}
+        return func
+
+    graph.add("latest", node("latest"), window=1)
+    graph.add("model", node("model"), window=10, version=lambda: version["model"])
+    graph.add("summary", node("summary"), depends=["latest", "model"])
+    return graph
+
+
+def test_memo_hit_then_miss_after_window_change():
+    calls, version = [], {"model": 1}
+    graph = _graph(calls, version)
+    history = _rows(20)
+
+    first = asyncio.run(graph.run("pump-1", history))
+    assert calls == ["latest", "model", "summary"]
+    calls.clear()
+    assert asyncio.run(graph.run("pump-1", list(history))) == first
+    assert calls == [] and graph.stats["hits"] == 3
+
+    # Leitura nova: a janela de 1 e a de 10 mudam; o resumo depende das duas
+    asyncio.run(graph.run("pump-1", history + _rows(1, start=20)))
+    assert calls == ["latest", "model", "summary"]
+
+
+def test_model_version_invalidates_only_dependent_nodes():
+    calls, version = [], {"model": 1}
+    graph = _graph(calls, version)
+    history = _rows(20)
+    asyncio.run(graph.run("pump-1", history))
+    calls.clear()
+
+    version["model"] = 2  # Ex.: modelo RUL retreinado
+    asyncio.run(graph.run("pump-1", history))
+    assert calls == ["model", "summary"]
+
+
+def test_analyses_are_routed_to_the_owner():
+    async def scenario():
+        broker = InMemoryBroker()
+        nodes = [ClusterNode(broker, worker_id=w) for w in ("w1", "w2")]
+        engines = [AIEngine() for _ in nodes]
+        for node in nodes:
+            await node.start()
+        for node in nodes:
+            await node.refresh_membership()
+        for node, engine in zip(nodes, engines):
+            engine.attach_cluster(node)
+            await engine.scheduler.start()
+        await asyncio.sleep(0)
+
+        device_ids = [f"dev-{i}" for i in range(8)]
+        for device_id in device_ids:
+            owner = engines[0] if nodes[0].owns(device_id) else engines[1]
+            for row in _rows(80):
+                await owner.process_reading({**row, "device_id": device_id})
+        foreign = next(d for d in device_ids if not nodes[0].owns(d))
+
+        remote = await engines[0].comprehensive_analysis({"device_id": foreign})
+        fleet = await engines[0].detect_patterns({"fleet": True})
+        for engine in engines:
+            await engine.scheduler.stop()
+            engine.close()
+        for node in nodes:
+            await node.stop()
+        return remote, fleet, foreign, device_ids
+
+    remote, fleet, foreign, device_ids = asyncio.run(scenario())
+    # Só o dono tem as 80 leituras: a análise local veria apenas a requisição
+    assert remote["device_id"] == foreign
+    assert remote["patterns"]["samples"] == 80
+    assert sorted(fleet["devices"]) == sorted(device_ids)
+    assert all(result["samples"] == 80 for result in fleet["devices"].values())
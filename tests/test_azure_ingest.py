@@ -0,0 +1,100 @@
+import asyncio
+
+from azure_ingest import AzureIngestConsumer, LocalAzureProducer
+
+
+class FakeDetector:
+    async def analyze_batch(self, readings):
+        return [{"is_anomaly": r["temperature"] > 85, "score": 0.5} for r in readings]
+
+
+class Sink:
+    def __init__(self, fail_batches: int = 0):
+        self.rows = []
+        self.fail_batches = fail_batches
+
+    async def on_batch(self, readings, kept):
+        if self.fail_batches:
+            self.fail_batches -= 1
+            raise RuntimeError("falha simulada")
+        for reading in readings:
+            reading["health_score"] = 100.0
+
+    async def persist(self, rows):
+        self.rows.extend(rows)
+
+
+async def _drain(consumer):
+    while not consumer.queue.empty():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(consumer.linger * 2)
+
+
+def _run(sink, rounds):
+    async def scenario():
+        consumer = AzureIngestConsumer(FakeDetector(), persist=sink.persist, on_batch=sink.on_batch, linger=0.01)
+        await consumer.start()
+        for payloads in rounds:
+            for payload in payloads:
+                consumer.enqueue(payload)
+            await _drain(consumer)
+        await consumer.stop()
+        return consumer
+
+    return asyncio.run(scenario())
+
+
+def _unique_valid(payloads):
+    messages = {m["messageId"]: m for payload in payloads for m in payload}
+    return {i for i, m in messages.items() if m["body"]["temperature"] is not None}
+
+
+def test_duplicates_are_persisted_once_with_health_score():
+    producer = LocalAzureProducer(duplicate_rate=0.3, invalid_rate=0.05, seed=1)
+    payloads = [producer.payload(200)["data"] for _ in range(5)]
+    sink = Sink()
+    consumer = _run(sink, [payloads, payloads])   # Segunda rodada: retry completo do IoT Hub
+
+    ids = [row["message_id"] for row in sink.rows]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == _unique_valid(payloads)
+    assert all(row["health_score"] == 100.0 for row in sink.rows)
+    assert consumer.stats["processed"] == len(ids)
+
+
+def test_failed_batch_is_released_for_retry_and_not_duplicated():
+    producer = LocalAzureProducer(duplicate_rate=0.0, invalid_rate=0.0, seed=2)
+    payloads = [producer.payload(50)["data"]]
+    sink = Sink(fail_batches=1)
+    consumer = _run(sink, [payloads, payloads, payloads])
+
+    ids = [row["message_id"] for row in sink.rows]
+    assert consumer.stats["failed_batches"] == 1
+    assert sorted(ids) == sorted(_unique_valid(payloads))
+
+
+def test_route_forwards_foreign_devices_before_scoring():
+    producer = LocalAzureProducer(devices=6, duplicate_rate=0.0, invalid_rate=0.0, seed=3)
+    payloads = [producer.payload(100)["data"]]
+    forwarded, sink = [], Sink()
+
+    async def route(readings):
+        forwarded.extend(r for r in readings if r["device_id"][-1] in "13579")
+        return [r for r in readings if r["device_id"][-1] not in "13579"]
+
+    async def scenario():
+        consumer = AzureIngestConsumer(FakeDetector(), persist=sink.persist, on_batch=sink.on_batch,
+                                       route=route, linger=0.01)
+        await consumer.start()
+        for payload in payloads:
+            consumer.enqueue(payload)
+        await _drain(consumer)
+        await consumer.stop()
+        return consumer
+
+    consumer = asyncio.run(scenario())
+    assert forwarded and sink.rows
+    assert not any("anomaly_score" in r for r in forwarded)  # Dono faz score e compressão
+    assert {r["message_id"] for r in forwarded} | {r["message_id"] for r in sink.rows} == _unique_valid(payloads)
+    assert consumer.stats["forwarded"] == len(forwarded)
+    assert consumer.stats["processed"] == len(sink.rows)
@@ -0,0 +1,20 @@
+import pytest
+
+from backtest import compression_bias, resolve_export_path
+
+
+def test_export_path_is_confined_to_export_dir(tmp_path):
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    (exports / "fleet.npz").write_bytes(b"")
+    (tmp_path / "secret.csv").write_text("device_id,timestamp\n")
+
+    assert resolve_export_path("fleet.npz", str(exports)) == str((exports / "fleet.npz").resolve())
+    for name in ("../secret.csv", str(tmp_path / "secret.csv"), "fleet.txt", "missing.npz", "."):
+        with pytest.raises(ValueError):
+            resolve_export_path(name, str(exports))
+
+
+def test_compressed_database_is_flagged_as_biased():
+    assert compression_bias("off") is None
+    assert compression_bias("swinging_door")["compression"] == "swinging_door"
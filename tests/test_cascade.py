@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import cascade
+from cascade import AnomalyCascade, evaluate_cascade
+
+
+class LinearDetector:
+    """Detector sintético: autoencoder linear (projeção em 3 componentes) e score de isolamento por norma"""
+
+    features = ["temperature", "vibration", "rpm", "pressure", "power_consumption"]
+    mean = np.array([70.0, 0.02, 1500.0, 100.0, 2.4])
+    scale = np.array([5.0, 0.005, 50.0, 10.0, 0.3])
+
+    def __init__(self):
+        basis = np.linalg.qr(np.random.default_rng(0).normal(size=(5, 3)))[0]
+        self.projection = basis @ basis.T
+        self.threshold = 2.0
+
+    def _transform(self, X):
+        return (X - self.mean) / self.scale
+
+    def _reconstruct(self, X_scaled):
+        return X_scaled @ self.projection
+
+    def _isolation_scores(self, X_scaled):
+        return -0.35 - 0.04 * np.linalg.norm(X_scaled, axis=1)
+
+    def _full_decisions(self, X_scaled):
+        mse = np.mean((X_scaled - self._reconstruct(X_scaled)) ** 2, axis=1)
+        return (mse > self.threshold) | (self._isolation_scores(X_scaled) < cascade.ISOLATION_THRESHOLD)
+
+
+def _telemetry(n, anomaly_rate, seed):
+    rng = np.random.default_rng(seed)
+    X = LinearDetector.mean + rng.normal(size=(n, 5)) * LinearDetector.scale
+    labels = rng.random(n) < anomaly_rate
+    X[labels] += rng.choice([-1, 1], size=(labels.sum(), 5)) * rng.uniform(3, 6, (labels.sum(), 5)) * LinearDetector.scale
+    records = [dict(zip(LinearDetector.features, row)) for row in X.tolist()]
+    return records, labels
+
+
+def test_calibrated_cascade_matches_full_models_offline():
+    detector = LinearDetector()
+    train, _ = _telemetry(20000, 0.02, seed=1)
+    X_train = detector._transform(np.array([[r[f] for f in detector.features] for r in train]))
+    z_max = AnomalyCascade(detector, cascade.STAGES).calibrate(X_train, max_missed=0.001)
+    assert 1.0 <= z_max <= 4.0
+
+    held_out, labels = _telemetry(20000, 0.02, seed=2)
+    report = evaluate_cascade(detector, held_out, labels, stages=cascade.STAGES, z_max=z_max)
+    assert report["samples"] == 20000
+    assert report["missed_anomalies"] <= 0.01 * report["full_anomalies"]
+    assert report["agreement"] >= 0.999
+    assert report["stages"]["zscore"]["pass_rate"] < 0.5
+    assert report["cascade_recall"] >= report["full_recall"] - 0.01
+    assert report["cascade_precision"] >= report["full_precision"] - 0.01
+
+
+def test_cascade_is_disabled_by_default_but_evaluable(monkeypatch):
+    monkeypatch.setattr(cascade, "CASCADE_STAGES", "")
+    assert AnomalyCascade(LinearDetector()).stages == list(cascade.STAGES)
+    with pytest.raises(ValueError):
+        AnomalyCascade(LinearDetector(), ["zscore"])
+
+
+def test_zscore_cleared_rows_have_no_reconstruction_score():
+    detector = LinearDetector()
+    scored = AnomalyCascade(detector, cascade.STAGES, z_max=3.0).score(np.array([[0.1] * 5, [8.0] * 5]))
+    assert np.isnan(scored["mse"][0]) and scored["decided_by"][0] == 0
+    assert not np.isnan(scored["mse"][1])
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+from compression import TelemetryCompressor, evaluate_compression
+
+TOLERANCES = {"temperature": 0.5, "rpm": 10.0}
+
+
+def _series(devices: int = 3, samples: int = 2000, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    records = []
+    for d in range(devices):
+        temperature = 70 + np.cumsum(rng.normal(0, 0.2, samples))
+        rpm = 1500 + 200 * np.sin(np.arange(samples) / 50) + rng.normal(0, 2, samples)
+        for i in range(samples):
+            records.append({"device_id": f"dev-{d}", "timestamp": 1_700_000_000.0 + i,
+                            "temperature": float(temperature[i]), "rpm": float(rpm[i]),
+                            "anomaly": bool(rng.random() < 0.002)})
+    return records
+
+
+@pytest.mark.parametrize("algorithm", ["deadband", "swinging_door"])
+def test_reconstruction_error_within_tolerance(algorithm):
+    report = evaluate_compression(_series(), algorithm, TOLERANCES, max_gap=60)
+    assert report["within_tolerance"], report["max_error"]
+    assert report["ratio"] > 2
+    assert report["anomalies_kept"] >= report["anomalies"]
+
+
+def test_swinging_door_beats_deadband_on_trends():
+    records = _series(devices=1)
+    deadband = evaluate_compression(records, "deadband", TOLERANCES, max_gap=600)
+    swinging = evaluate_compression(records, "swinging_door", TOLERANCES, max_gap=600)
+    assert swinging["ratio"] > deadband["ratio"]
+
+
+@pytest.mark.parametrize("algorithm", ["deadband", "swinging_door"])
+def test_redelivered_readings_are_not_stored_again(algorithm):
+    records = _series(devices=2, samples=300)
+    compressor = TelemetryCompressor(algorithm, TOLERANCES, max_gap=60)
+    stored = compressor.process_batch([dict(r) for r in records[:200]])
+    # Reentrega do mesmo lote (ex.: falha antes do commit do offset no WAL)
+    assert compressor.process_batch([dict(r) for r in records[:200]]) == []
+    assert compressor.stats["stale"] == 200
+    stored += compressor.process_batch([dict(r) for r in records[200:]]) + compressor.flush()
+    keys = [(r["device_id"], r["timestamp"]) for r in stored]
+    assert len(keys) == len(set(keys))
+
+
+def test_snapshot_restore_keeps_held_point():
+    records = _series(devices=2, samples=500)
+    reference = TelemetryCompressor("swinging_door", TOLERANCES, max_gap=60)
+    expected = reference.process_batch([dict(r) for r in records]) + reference.flush()
+
+    compressor = TelemetryCompressor("swinging_door", TOLERANCES, max_gap=60)
+    stored = compressor.process_batch([dict(r) for r in records[:250]])
+    snapshot = json.loads(json.dumps(compressor.snapshot()))  # Como gravado junto com o offset do WAL
+    restarted = TelemetryCompressor("swinging_door", TOLERANCES, max_gap=60)
+    restarted.restore(snapshot)
+    stored += restarted.process_batch([dict(r) for r in records[250:]]) + restarted.flush()
+    assert stored == expected
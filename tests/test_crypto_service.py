@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from crypto_service import CryptoService, KeyRing
+
+
+@pytest.fixture(autouse=True)
+def no_env_keys(monkeypatch):
+    monkeypatch.delenv("NEXUS_FERNET_KEYS", raising=False)
+
+
+def test_concurrent_first_start_agrees_on_one_key(tmp_path):
+    path = tmp_path / "keys" / "fernet.keys"
+    rings, barrier = [], threading.Barrier(8)
+
+    def start():
+        barrier.wait()
+        rings.append(KeyRing(str(path)))
+
+    threads = [threading.Thread(target=start) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(rings) == 8
+    assert len({tuple(ring.keys) for ring in rings}) == 1
+    assert [k.encode() for k in path.read_text().split()] == rings[0].keys
+    assert not list(path.parent.glob(".*.tmp"))
+
+
+def test_rotation_is_picked_up_by_other_workers(tmp_path):
+    path = str(tmp_path / "fernet.keys")
+    a, b = CryptoService(KeyRing(path), workers=1), CryptoService(KeyRing(path), workers=1)
+    a.rotate_key()
+    token = a.encrypt("segredo")
+    assert b.decrypt(token) == "segredo"   # Releitura do keyring ao falhar com a chave antiga
+    assert b.keyring.keys == a.keyring.keys
+    assert not b.reload_keys()
+
+
+def test_concurrent_rotations_keep_every_new_key(tmp_path):
+    path = str(tmp_path / "fernet.keys")
+    a, b = KeyRing(path), KeyRing(path)
+    first = a.rotate(keep=5)
+    second = b.rotate(keep=5)  # b ainda tinha só a chave inicial em memória
+    assert b.keys[:2] == [second, first]
+    assert KeyRing(path).keys == b.keys
+
+
+def test_rotate_refuses_env_keys(monkeypatch, tmp_path):
+    monkeypatch.setenv("NEXUS_FERNET_KEYS", KeyRing(str(tmp_path / "seed.keys")).keys[0].decode())
+    ring = KeyRing(str(tmp_path / "fernet.keys"))
+    with pytest.raises(RuntimeError):
+        ring.rotate()
+
+
+def test_missing_webhook_secret_fails_closed(tmp_path):
+    crypto = CryptoService(KeyRing(str(tmp_path / "fernet.keys")), hmac_secret=None, workers=1)
+
+    async def chunks():
+        yield b"{}"
+
+    assert asyncio.run(crypto.verify("sha256=" + "0" * 64, b"{}")) is False
+    assert asyncio.run(crypto.read_verified(chunks(), "0" * 64)) is None
@@ -0,0 +1,85 @@
+import asyncio
+import random
+
+from cluster import ClusterNode, InMemoryBroker
+from device_registry import DeviceRegistry, TimingWheel
+
+
+def test_timing_wheel_expires_at_deadline_tick():
+    wheel = TimingWheel(tick=1.0, sizes=(8, 4, 4), start=0)
+    rng = random.Random(3)
+    deadlines = {i: rng.randint(1, 120) for i in range(200)}
+    for item, deadline in deadlines.items():
+        wheel.add(item, deadline)
+    assert wheel.count == 200
+
+    fired = {}
+    for now in range(1, 130):
+        for item in wheel.advance(now):
+            fired[item] = now
+    assert fired == deadlines  # Inclusive os que passaram pela cascata dos níveis superiores
+    assert wheel.count == 0
+
+
+def test_timing_wheel_clamps_past_and_beyond_horizon():
+    wheel = TimingWheel(tick=1.0, sizes=(4, 4), start=100)
+    wheel.add("past", 50)
+    wheel.add("far", 100 + 1000)
+    assert wheel.advance(101) == ["past"]
+    assert wheel.advance(1099) == []
+    assert wheel.advance(1100) == ["far"]
+
+
+def test_registry_offline_and_back_online():
+    changes = []
+    registry = DeviceRegistry(offline_after=10, on_status_change=lambda d, s, _: changes.append((d, s)))
+    registry.wheel = TimingWheel(tick=1.0, start=0)
+    registry.register({"id": "pump-1", "location": "A", "type": "pump", "last_seen": 0})
+    registry.touch("pump-2", now=5)
+
+    assert registry.check_offline(9) == []
+    registry.touch("pump-1", now=8)
+    assert registry.check_offline(15) == ["pump-2"]
+    assert registry.check_offline(18) == ["pump-1"]
+    registry.touch("pump-2", now=20)
+    assert registry.is_online("pump-2")
+    assert changes == [("pump-2", "offline"), ("pump-1", "offline"), ("pump-2", "online")]
+    assert registry.query(location="A", status="offline") == ["pump-1"]
+
+
+def test_cluster_registry_routes_to_owner_and_queries_all_workers():
+    async def scenario():
+        broker = InMemoryBroker()
+        nodes = [ClusterNode(broker, worker_id=w) for w in ("w1", "w2")]
+        registries = [DeviceRegistry(offline_after=60) for _ in nodes]
+        for node, registry in zip(nodes, registries):
+            await node.start()
+        for node in nodes:
+            await node.refresh_membership()
+        for node, registry in zip(nodes, registries):
+            registry.attach_cluster(node)
+        await asyncio.sleep(0)
+
+        device_ids = [f"dev-{i}" for i in range(20)]
+        foreign = next(d for d in device_ids if not nodes[0].owns(d))
+        await registries[0].register_routed({"id": foreign, "location": "B"})
+        await registries[0].touch_routed(device_ids)
+        await asyncio.sleep(0.05)
+        for registry in registries:
+            await registry.sync()
+
+        owned = [[d for d in device_ids if node.owns(d)] for node in nodes]
+        listed = await registries[1].query_routed()
+        by_location = await registries[0].query_routed(location="B")
+        remote = await registries[0].get_routed(foreign)
+        for node in nodes:
+            await node.stop()
+        return registries, owned, listed, by_location, remote, foreign
+
+    registries, owned, listed, by_location, remote, foreign = asyncio.run(scenario())
+    # Cada worker só mantém (e só alerta sobre) os seus dispositivos
+    assert [sorted(r.query()) for r in registries] == [sorted(o) for o in owned]
+    assert foreign not in registries[0]
+    assert len(listed) == 20
+    assert [d["id"] for d in by_location] == [foreign]
+    assert remote["location"] == "B" and remote["status"] == "online"
@@ -0,0 +1,84 @@
+import ipaddress
+import random
+
+import pytest
+
+from firewall import ALLOW, BLOCK, DEFAULT, INVALID, PRIVATE_NETWORKS, CompiledRuleSet, Firewall, parse_ports
+
+
+def reference_rules(rules, trust_private):
+    ordered = [(ALLOW, cidr, None) for cidr in PRIVATE_NETWORKS] if trust_private else []
+    ordered += [(r["rule"], r["ip_range"], r.get("port")) for r in rules]
+    return [(action, ipaddress.ip_network(cidr, strict=False), parse_ports(spec)) for action, cidr, spec in ordered]
+
+
+def reference_classify(ordered, ip, port):
+    """Matcher ingênuo: percorre as regras em ordem e devolve a primeira que casa"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return INVALID
+    for action, network, ports in ordered:
+        if address.version != network.version or address not in network:
+            continue
+        if ports is None or port is None or port in ports[0] or any(lo <= port <= hi for lo, hi in ports[1]):
+            return action
+    return DEFAULT
+
+
+def _random_rules(rng, count):
+    rules = []
+    for _ in range(count):
+        if rng.random() < 0.75:
+            length = rng.choice([8, 12, 16, 20, 24, 28, 30, 32])
+            cidr = f"{ipaddress.IPv4Address(rng.getrandbits(32))}/{length}"
+        else:
+            length = rng.choice([16, 32, 48, 64, 96, 128])
+            cidr = f"{ipaddress.IPv6Address(rng.getrandbits(128))}/{length}"
+        port = rng.choice([None, "*", "443", "80,443", "1000-2000", "22,8000-8100"])
+        rules.append({"rule": rng.choice([ALLOW, BLOCK]), "ip_range": cidr, "port": port})
+    return rules
+
+
+def _random_ips(rng, rules, count):
+    ips = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            # Endereço dentro (ou perto) de uma rede das regras, para exercitar sobreposições
+            network = ipaddress.ip_network(rng.choice(rules)["ip_range"], strict=False)
+            offset = rng.randrange(network.num_addresses)
+            ips.append(str(network.network_address + offset))
+        elif roll < 0.8:
+            ips.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+        elif roll < 0.95:
+            ips.append(str(ipaddress.IPv6Address(rng.getrandbits(128))))
+        else:
+            ips.append(rng.choice(["", "999.1.1.1", "not-an-ip", "10.0.0", "::ffff:10.1.2.3"]))
+    return ips
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("trust_private", [True, False])
+def test_compiled_ruleset_matches_reference(seed, trust_private):
+    rng = random.Random(seed)
+    rules = _random_rules(rng, 300)
+    ordered = reference_rules(rules, trust_private)
+    ruleset = CompiledRuleSet(rules, trust_private=trust_private)
+    ips = _random_ips(rng, rules, 500)
+    for port in (None, 22, 443, 1500, 8050, 9999):
+        expected = [reference_classify(ordered, ip, port) for ip in ips]
+        assert [ruleset.classify(ip, port) for ip in ips] == expected
+        assert ruleset.classify_batch(ips, port) == expected
+    # Porta por IP (ex.: varredura de portas) num único lote
+    ports = [rng.choice([None, 22, 443, 1500, 8050, 9999]) for _ in ips]
+    expected = [reference_classify(ordered, ip, p) for ip, p in zip(ips, ports)]
+    assert ruleset.classify_batch(ips, ports) == expected
+
+
+def test_non_string_addresses_are_invalid():
+    firewall = Firewall([{"rule": BLOCK, "ip_range": "0.0.0.0/0", "port": "22"}])
+    for value in (None, 123, b"10.0.0.1"):
+        assert firewall.ruleset.classify(value, 22) == INVALID
+        assert firewall.is_allowed(value, 22) is False
+    assert firewall.check_batch([None, "8.8.8.8", "8.8.8.8"], [22, 22, 80]) == [False, False, True]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+
+from sklearn.ensemble import IsolationForest
+
+import flat_forest
+from flat_forest import FlatIsolationForest, average_path_length, isolation_scores
+
+
+@pytest.fixture(scope="module")
+def forests():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, 5))
+    forest = IsolationForest(contamination=0.1, random_state=42).fit(X)
+    return forest, FlatIsolationForest.from_sklearn(forest)
+
+
+def test_average_path_length_matches_sklearn():
+    from sklearn.ensemble._iforest import _average_path_length
+    n = np.array([0, 1, 2, 3, 10, 256, 10000])
+    np.testing.assert_allclose(average_path_length(n), _average_path_length(n))
+
+
+@pytest.mark.parametrize("rows", [1, 7, flat_forest.SCORE_CHUNK + 3, 3000])
+def test_scores_match_sklearn(forests, rows):
+    forest, flat = forests
+    rng = np.random.default_rng(rows)
+    X = np.vstack([rng.normal(size=(rows, 5)), rng.normal(0, 6, size=(rows, 5))])
+    np.testing.assert_allclose(flat.score_samples(X), forest.score_samples(X), rtol=1e-12, atol=1e-12)
+
+
+def test_thresholds_match_at_float32_boundaries(forests):
+    forest, flat = forests
+    # Leituras exatamente sobre os thresholds (e o float32 vizinho) exercitam o arredondamento
+    tree = forest.estimators_[0].tree_
+    internal = tree.children_left >= 0
+    X = np.zeros((internal.sum() * 2, 5))
+    for i, (f, t) in enumerate(zip(tree.feature[internal], tree.threshold[internal])):
+        feature = forest.estimators_features_[0][f]
+        X[2 * i, feature] = t
+        X[2 * i + 1, feature] = np.nextafter(np.float32(t), np.float32(np.inf))
+    np.testing.assert_allclose(flat.score_samples(X), forest.score_samples(X), rtol=1e-12, atol=1e-12)
+
+
+def test_save_load_mmap_roundtrip(forests, tmp_path):
+    _, flat = forests
+    flat.save(tmp_path / "flat")
+    loaded = FlatIsolationForest.load(tmp_path / "flat")
+    X = np.random.default_rng(1).normal(size=(100, 5))
+    assert isinstance(loaded.feature, np.memmap)
+    np.testing.assert_array_equal(loaded.score_samples(X), flat.score_samples(X))
+
+
+def test_large_batches_are_routed_to_sklearn(forests, monkeypatch):
+    forest, flat = forests
+    calls = []
+    monkeypatch.setattr(flat, "score_samples", lambda X: calls.append(len(X)) or np.zeros(len(X)))
+    isolation_scores(np.zeros((10, 5)), flat, forest, max_rows=100)
+    isolation_scores(np.zeros((1000, 5)), flat, forest, max_rows=100)
+    isolation_scores(np.zeros((1000, 5)), flat, None, max_rows=100)
+    assert calls == [10, 1000]
@@ -0,0 +1,50 @@
+import asyncio
+
+import numpy as np
+
+from load_generator import FAULT_OVERHEAT, FleetSimulator, LoadGenerator, LocalMQTTBroker, MQTTSink
+
+
+class CollectSink:
+    def __init__(self):
+        self.records = []
+
+    async def send(self, records):
+        self.records.extend(records)
+
+
+def test_achieved_rate_tracks_target():
+    sink = CollectSink()
+    generator = LoadGenerator(FleetSimulator(devices=500, seed=0), sink, rate=4000, tick=0.05)
+    report = asyncio.run(generator.run(duration=1.0))
+    assert report["sent"] == len(sink.records)
+    assert abs(report["achieved_rate"] - 4000) / 4000 < 0.15, report
+    # Round-robin: todos os dispositivos amostrados com frequência parecida
+    counts = np.unique([r["device_id"] for r in sink.records], return_counts=True)[1]
+    assert len(counts) == 500 and counts.max() - counts.min() <= 1
+
+
+def test_count_stops_exactly():
+    sink = CollectSink()
+    report = asyncio.run(LoadGenerator(FleetSimulator(devices=50, seed=1), sink, rate=10000).run(count=1234))
+    assert report["sent"] == len(sink.records) == 1234
+
+
+def test_injected_fault_is_labeled_and_shifts_readings():
+    simulator = FleetSimulator(devices=200, fault_rate=0.0, seed=2)
+    idx = np.arange(200)
+    baseline = simulator.step(idx, 1.0)
+    simulator.fault[:20] = FAULT_OVERHEAT
+    simulator.fault_age[:20] = simulator.fault_duration / 2
+    columns = simulator.step(idx, 1.0)
+    assert columns["label"][:20].all() and not columns["label"][20:].any()
+    assert columns["temperature"][:20].mean() > baseline["temperature"][:20].mean() + 15
+
+
+def test_mqtt_sink_matches_wildcards():
+    broker, received = LocalMQTTBroker(), []
+    broker.subscribe("factory/+/device/+/telemetry", lambda client, userdata, msg: received.append(msg.topic))
+    broker.subscribe("factory/plantB/#", lambda client, userdata, msg: received.append("plantB"))
+    records = FleetSimulator.to_records(FleetSimulator(devices=3, seed=3).step(np.arange(3), 1.0))
+    asyncio.run(MQTTSink(broker).send(records))
+    assert received == [f"factory/plantA/device/device_{i}/telemetry" for i in range(3)]
@@ -0,0 +1,71 @@
+import asyncio
+
+from firewall import BLOCK, Firewall
+from log_pipeline import FailedLoginRule, PortScanRule, SecurityLogPipeline, WindowCounter, iter_splunk_events
+
+
+def _event(ip="203.0.113.7", port=None, failed=False, t=0.0):
+    return {"ip": ip, "port": port, "user": None, "failed": failed, "time": t, "allowed": True}
+
+
+def test_window_counter_slides_out_old_events():
+    counter = WindowCounter(window=60, buckets=6)
+    for t in range(0, 50, 10):
+        counter.add("a", t)
+    assert counter.add("a", 55) == 6
+    # Em t=75 os buckets de [0, 20) já saíram da janela
+    assert counter.add("a", 75) == 5
+    assert counter.add("a", 500) == 1
+    assert counter.add("a", 100) == 1  # Mais antigo que a janela: ignorado
+
+
+def test_failed_login_fires_at_threshold_once_per_window():
+    rule = FailedLoginRule(window=60, threshold=10)
+    findings = [rule.observe(_event(failed=True, t=i)) for i in range(9)]
+    assert findings == [None] * 9
+    assert rule.observe(_event(ip="198.51.100.1", failed=True, t=9)) is None  # Outro IP não soma
+    assert rule.observe(_event(failed=False, t=9)) is None  # Sucessos não contam
+
+    finding = rule.observe(_event(failed=True, t=10))
+    assert finding == {"source_ip": "203.0.113.7", "failed_logins": 10, "window_seconds": 60}
+    assert rule.observe(_event(failed=True, t=11)) is None  # Cooldown dentro da janela
+    # Falhas espalhadas além da janela não atingem o limite
+    spread = FailedLoginRule(window=60, threshold=10)
+    assert all(spread.observe(_event(failed=True, t=i * 15)) is None for i in range(20))
+
+
+def test_port_scan_counts_distinct_ports():
+    rule = PortScanRule(window=60, threshold=20)
+    assert all(rule.observe(_event(port=22, t=i)) is None for i in range(50))  # Mesma porta repetida
+    assert all(rule.observe(_event(port=1000 + p, t=1)) is None for p in range(18))
+    finding = rule.observe(_event(port=2000, t=2))
+    assert finding == {"source_ip": "203.0.113.7", "distinct_ports": 20, "window_seconds": 60}
+    assert rule.observe(_event(port=2001, t=3)) is None
+    assert rule.observe(_event(port=None, t=3)) is None
+
+
+class _Monitor:
+    def __init__(self, firewall):
+        self.firewall = firewall
+        self.events = []
+
+    def check_ip_threats(self, ips, port=None):
+        return self.firewall.check_batch(ips, port)
+
+    async def log_security_event(self, event_type, severity, details):
+        self.events.append((event_type, severity, details))
+
+
+def test_pipeline_enriches_and_reports_findings():
+    firewall = Firewall([{"rule": BLOCK, "ip_range": "45.33.32.0/24", "port": "22"}])
+    monitor = _Monitor(firewall)
+    pipeline = SecurityLogPipeline(monitor)
+    payload = [{"time": 100 + i, "event": {"src_ip": "45.33.32.9", "dest_port": 1000 + i}} for i in range(25)]
+    payload.append({"time": 130, "event": {"src_ip": "45.33.32.9", "dest_port": 22, "action": "failure"}})
+    events = list(iter_splunk_events(payload))
+
+    asyncio.run(pipeline.process_batch(events))
+    assert [e["allowed"] for e in events] == [True] * 25 + [False]
+    names = [name for name, _, _ in monitor.events]
+    assert names == ["port_scan", "blocked_ip_activity"]
+    assert pipeline.stats == {"payloads": 0, "dropped_payloads": 0, "events": 26, "findings": 2}
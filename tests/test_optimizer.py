@@ -0,0 +1,57 @@
+import asyncio
+
+import numpy as np
+
+from optimizer import SETPOINTS, SetpointOptimizer, fit_models
+
+
+def _history(n=200, fixed=None, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        row = {"rpm": rng.uniform(1300, 1700), "pressure": rng.uniform(85, 115), "temperature": rng.uniform(60, 80)}
+        row.update(fixed or {})
+        row["power_consumption"] = 2.4 * (row["rpm"] / 1500) ** 2 * (1 + 0.3 * (row["pressure"] - 100) / 100)
+        row["vibration"] = 0.02 * (row["rpm"] / 1500) ** 2
+        rows.append(row)
+    return rows
+
+
+def test_fit_models_requires_variation_in_every_setpoint():
+    assert fit_models(_history()) is not None
+    assert fit_models(_history(fixed={"pressure": 100.0})) is None
+    assert fit_models(_history(n=10)) is None
+
+
+def test_constant_setpoint_falls_back_and_stays_inside_bounds():
+    optimizer = SetpointOptimizer(workers=1)
+    result = asyncio.run(optimizer.optimize("device_1", "pump", _history(fixed={"pressure": 100.0})))
+    assert result["model"] == "prior"
+    low, high = optimizer.bounds["pressure"]
+    assert low < result["recommended"]["pressure"] < high
+
+
+def test_type_model_is_used_before_prior():
+    optimizer = SetpointOptimizer(workers=1)
+    optimizer.fit_type("pump", [_history(seed=1), _history(seed=2)])
+    result = asyncio.run(optimizer.optimize("device_2", "pump", []))
+    assert result["model"] == "type"
+    assert set(result["recommended"]) == set(SETPOINTS)
+
+
+def test_missing_device_id_does_not_crash():
+    optimizer = SetpointOptimizer(workers=1)
+    result = asyncio.run(optimizer.optimize(None, "default", _history()))
+    assert result["model"] == "device"
+
+
+def test_line_optimization_in_process_pool_matches_inline():
+    devices = {f"device_{i}": ("pump", _history(seed=i)) for i in range(4)}
+    pooled_optimizer = SetpointOptimizer(workers=2)
+    try:
+        pooled = asyncio.run(pooled_optimizer.optimize_line(devices))
+    finally:
+        pooled_optimizer.close()
+    inline = asyncio.run(SetpointOptimizer(workers=1).optimize_line(devices))
+    assert sorted(pooled) == sorted(devices)
+    assert [pooled[d]["recommended"] for d in devices] == [inline[d]["recommended"] for d in devices]
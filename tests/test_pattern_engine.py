@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+
+from pattern_engine import PatternEngine, SignatureLibrary, analyze_columns, matrix_profile, top_k
+
+WINDOW = 32
+
+
+def _planted(seed: int = 0, n: int = 600, at=(100, 420)) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    series = rng.normal(0, 1, n)
+    motif = 4 * np.sin(np.linspace(0, 3 * np.pi, WINDOW)) * np.linspace(1, 0.3, WINDOW)
+    for start in at:
+        series[start:start + WINDOW] = motif + rng.normal(0, 0.05, WINDOW)
+    return series
+
+
+def test_planted_motif_is_top_motif():
+    profile, index = matrix_profile(_planted(), WINDOW)
+    best = top_k(profile, index, 1, WINDOW, largest=False)[0]
+    assert sorted([best["index"], best["neighbor"]]) == [100, 420]
+    assert best["distance"] < 1.0
+
+
+def test_planted_signature_is_matched():
+    rng = np.random.default_rng(1)
+    vibration = 0.02 + rng.normal(0, 0.001, 200)
+    vibration[-WINDOW:] += 0.05 * np.linspace(0, 1, WINDOW) ** 2
+    result = analyze_columns({"vibration": vibration}, SignatureLibrary(WINDOW), WINDOW)
+    assert result["status"] == "ok"
+    assert result["signature_matches"][0]["signature"] == "bearing_wear"
+
+
+def test_fleet_analysis_in_process_pool_matches_inline():
+    histories = {f"dev-{i}": [{"vibration": float(v), "rpm": 1500.0 + 10 * float(v)}
+                              for v in _planted(seed=i, n=200, at=(20, 140))] for i in range(6)}
+    engine = PatternEngine(SignatureLibrary(WINDOW), window=WINDOW, workers=2)
+    try:
+        pooled = asyncio.run(engine.analyze_fleet(histories))
+    finally:
+        engine.close()
+    assert sorted(pooled) == sorted(histories)
+    for device_id, history in histories.items():
+        assert pooled[device_id]["motifs"] == engine.analyze(history)["motifs"]
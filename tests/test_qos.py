@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from qos import AdmissionController, Priority
+
+
+def test_release_wakes_admissible_waiter_behind_blocked_one():
+    """Vaga liberada não pode ficar ociosa se o primeiro da fila não cabe na sua fatia"""
+    async def scenario():
+        qos = AdmissionController(capacity=4, queue_timeout=0.5)
+        qos.register("alerts", Priority.CRITICAL)
+        qos.register("analysis", Priority.ANALYSIS)
+        held = [qos.try_acquire("alerts") for _ in range(4)]
+
+        analysis = asyncio.create_task(qos.acquire("analysis"))   # Fatia 0.5: precisa de inflight < 2
+        await asyncio.sleep(0)
+        alerts = asyncio.create_task(qos.acquire("alerts"))
+        await asyncio.sleep(0)
+
+        qos.release(held.pop())
+        ticket = await asyncio.wait_for(alerts, 0.1)
+        assert ticket is not None and ticket.route.name == "alerts"
+        assert not analysis.done()
+
+        for t in held + [ticket]:
+            qos.release(t)
+        assert (await analysis) is not None
+
+    asyncio.run(scenario())
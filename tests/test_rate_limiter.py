@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+import rate_limiter
+from rate_limiter import InMemoryRateLimitBackend, LoginRateLimiter, RedisRateLimitBackend, SlidingWindow
+
+
+def test_sliding_window_weights_previous_window():
+    counter = SlidingWindow(0.0)
+    counter.current = 10
+    counter.roll(60.0, 60.0)
+    assert (counter.previous, counter.current) == (10, 0)
+    assert counter.estimate(60.0, 60.0) == pytest.approx(10.0)
+    assert counter.estimate(90.0, 60.0) == pytest.approx(5.0)
+    assert counter.estimate(119.9, 60.0) == pytest.approx(10 * (0.1 / 60), abs=1e-9)
+
+
+def test_sliding_window_forgets_after_two_windows():
+    counter = SlidingWindow(0.0)
+    counter.current = 10
+    counter.roll(125.0, 60.0)
+    assert (counter.previous, counter.current, counter.window_start) == (0, 0, 120.0)
+
+
+def test_in_memory_hits_roll_over(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    backend = InMemoryRateLimitBackend()
+
+    async def scenario():
+        for _ in range(4):
+            await backend.hit("k", 10.0)
+        now[0] += 15.0   # Metade da janela seguinte: metade do peso da anterior
+        return await backend.hit("k", 10.0)
+
+    assert asyncio.run(scenario()) == pytest.approx(4 * 0.5 + 1)
+
+
+def test_in_memory_evicts_oldest_keys_when_full():
+    backend = InMemoryRateLimitBackend(max_keys=3)
+
+    async def scenario():
+        for key in "abcd":
+            await backend.hit(key, 60.0)
+
+    asyncio.run(scenario())
+    assert list(backend.counters) == ["b", "c", "d"]
+
+
+def test_user_lockout_and_reset_on_success():
+    limiter = LoginRateLimiter(backend=InMemoryRateLimitBackend(), user_failures=(3, 900))
+
+    async def scenario():
+        for _ in range(2):
+            await limiter.record_failure("10.0.0.1", "alice")
+        await limiter.record_success("10.0.0.1", "alice")
+        await limiter.record_failure("10.0.0.1", "alice")
+        unlocked = await limiter.check("10.0.0.1", "alice")
+        for _ in range(2):
+            await limiter.record_failure("10.0.0.1", "alice")
+        return unlocked, await limiter.check("10.0.0.1", "alice")
+
+    unlocked, locked = asyncio.run(scenario())
+    assert unlocked is None
+    assert locked is not None and locked > 0
+
+
+class _RecordingRedis:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete(self, *keys):
+        self.deleted.extend(keys)
+
+    def scan_iter(self, *args, **kwargs):
+        raise AssertionError("reset não deve varrer o keyspace")
+
+
+def test_redis_reset_deletes_only_known_windows(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "time", lambda: 6000.0)
+    backend = RedisRateLimitBackend.__new__(RedisRateLimitBackend)
+    backend.client = _RecordingRedis()
+    asyncio.run(backend.reset("fail:user:*", 900))
+    prefix = f"{rate_limiter.KEY_PREFIX}:rl:fail:user:*"
+    assert backend.client.deleted == [f"{prefix}:6", f"{prefix}:5"]
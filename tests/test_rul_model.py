@@ -0,0 +1,60 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from ai_engine import AIEngine
+from rul_model import RULModel, degradation_samples, prior_rul
+
+
+def _history(temperature, vibration, n=40):
+    return [{"temperature": temperature, "vibration": vibration, "timestamp": i} for i in range(n)]
+
+
+def test_untrained_model_uses_prior_rule(tmp_path):
+    model = RULModel(path=str(tmp_path / "rul.npz"))
+    assert not model.load()
+    prediction = model.predict("d1", _history(70.0, 0.02))
+    assert prediction["model"] == "prior"
+    assert prediction["hours_to_failure"] == pytest.approx(float(prior_rul(np.array([70.0]), np.array([0.02]))[0]),
+                                                           abs=0.1)
+
+
+def test_cache_is_keyed_on_history_window():
+    model = RULModel()
+    healthy = model.predict(None, _history(70.0, 0.02))
+    degraded = model.predict(None, _history(95.0, 0.09))
+    assert degraded["hours_to_failure"] < healthy["hours_to_failure"]
+    assert model.predict(None, _history(95.0, 0.09)) == degraded
+    assert model.stats == {"hits": 1, "misses": 2}
+
+
+def test_fit_requires_enough_samples_and_save_load_roundtrip(tmp_path):
+    model = RULModel(path=str(tmp_path / "rul.npz"))
+    with pytest.raises(ValueError):
+        model.fit(np.zeros((10, 4)), np.ones(10))
+
+    rng = np.random.default_rng(0)
+    t = np.arange(2000) * 60.0
+    temperature = 70 + np.linspace(0, 40, 2000) % 40 + rng.normal(0, 0.5, 2000)
+    vibration = 0.02 + (np.linspace(0, 40, 2000) % 40) * 0.002
+    X, y = degradation_samples(t, temperature, vibration, np.full(2000, 1500.0), np.zeros(2000, dtype=bool))
+    assert len(y) >= 50
+    model.fit(X, y)
+    model.save()
+
+    loaded = RULModel(path=model.path)
+    assert loaded.load() and loaded.trained
+    history = _history(90.0, 0.06)
+    assert loaded.predict("d1", history) == model.predict("d1", history)
+    assert loaded.predict("d1", history)["model"] == "learned"
+
+
+@pytest.mark.parametrize("method", ["predict_failure", "detect_patterns", "optimize_parameters",
+                                    "comprehensive_analysis"])
+def test_analysis_without_device_id_scores_the_payload(method):
+    engine = AIEngine()
+    payload = {"temperature": 80, "vibration": 0.03, "rpm": 1500}
+    result = asyncio.run(getattr(engine, method)(payload))
+    assert isinstance(result, dict) and "error" not in result
+    assert not any("error" in v for v in result.values() if isinstance(v, dict))
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from scheduler import DeviceScheduler
+
+
+def _record(state, reading):
+    state.history.append(reading["seq"])
+    return threading.current_thread().name
+
+
+def test_readings_processed_in_order_per_device_on_shard_threads():
+    async def scenario():
+        scheduler = DeviceScheduler(_record, num_shards=4, use_threads=True)
+        await scheduler.start()
+        futures = [scheduler.submit(f"dev-{i % 10}", {"seq": i}) for i in range(500)]
+        threads = await asyncio.gather(*futures)
+        histories = {f"dev-{d}": list(scheduler.get_state(f"dev-{d}").history) for d in range(10)}
+        await scheduler.stop()
+        return threads, histories
+
+    threads, histories = asyncio.run(scenario())
+    assert all(name.startswith("shard-") for name in threads)
+    for d in range(10):
+        assert histories[f"dev-{d}"] == list(range(d, 500, 10))
+
+
+def test_idle_devices_migrate_from_hot_shard_keeping_state():
+    async def run():
+        scheduler = DeviceScheduler(_record, num_shards=2)
+        await scheduler.start()
+        hot = [d for d in (f"dev-{i}" for i in range(50)) if scheduler.shard_for(d).index == 0][:6]
+        for i in range(60):
+            await scheduler.submit(hot[i % len(hot)], {"seq": i})
+        moved = scheduler.rebalance()
+        migrated = [d for d in hot if scheduler.shard_for(d).index == 1]
+        histories = {d: list(scheduler.get_state(d).history) for d in migrated}
+        await scheduler.submit(migrated[0], {"seq": 999})
+        after = list(scheduler.get_state(migrated[0]).history)
+        await scheduler.stop()
+        return moved, migrated, histories, after
+
+    moved, migrated, histories, after = asyncio.run(run())
+    assert moved == len(migrated) > 0
+    assert all(len(h) == 10 for h in histories.values())  # Estado acompanha o dispositivo
+    assert after[-1] == 999 and after[:-1] == histories[migrated[0]]
+
+
+def test_idle_states_are_evicted():
+    async def scenario():
+        scheduler = DeviceScheduler(_record, num_shards=2, idle_ttl=60)
+        await scheduler.start()
+        await scheduler.submit("old", {"seq": 1})
+        await scheduler.submit("new", {"seq": 2})
+        scheduler.get_state("old").last_active -= 120
+        evicted = scheduler.evict_idle()
+        states = sorted(s.device_id for s in scheduler.iter_states())
+        await scheduler.stop()
+        return evicted, states, scheduler.stats()["evicted"]
+
+    assert asyncio.run(scenario()) == (1, ["new"], 1)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from shared_model import QuantizedAutoencoder, SharedModel
+
+
+def _model(version="v1", threshold=0.3):
+    rng = np.random.default_rng(0)
+    layers = []
+    for n_in, n_out, activation in ((5, 16, "relu"), (16, 3, "linear"), (3, 5, "linear")):
+        kernel = rng.normal(0, 1 / np.sqrt(n_in), (n_in, n_out)).astype(np.float32)
+        layers.append({"type": "Dense", "activation": activation, "arrays": [kernel, np.zeros(n_out, np.float32)]})
+    manifest = {"features": ["temperature", "vibration", "rpm", "pressure", "power_consumption"],
+                "threshold": threshold, "version": version}
+    return SharedModel(manifest, layers, np.zeros(5), np.ones(5))
+
+
+def _telemetry(n, seed):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 5))
+    X[: n // 10] *= 4   # Leituras anômalas
+    return X
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_quantized_agreement_reported_on_positives(mode):
+    model = _model()
+    quantized = model.quantize(mode, _telemetry(4000, 1))
+    report = quantized.agreement_rate(model, _telemetry(4000, 2))
+    assert report["positives"] > 100
+    assert report["agreement"] >= 0.97
+    assert report["positive_agreement"] >= 0.95
+    assert report["negative_agreement"] >= 0.95
+    assert quantized.model_version == "v1"
+
+
+def test_quantized_artifact_is_tied_to_model_version(tmp_path):
+    model = _model()
+    quantized = model.quantize("int8", _telemetry(2000, 1))
+    quantized.save(tmp_path)
+    loaded = QuantizedAutoencoder.load(tmp_path, "int8", "v1")
+    assert loaded is not None and loaded.positive_agreement == quantized.positive_agreement
+    X = _telemetry(100, 3)
+    np.testing.assert_allclose(loaded.reconstruct(X), quantized.reconstruct(X))
+    assert QuantizedAutoencoder.load(tmp_path, "int8", "v2") is None
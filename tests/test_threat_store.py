@@ -0,0 +1,58 @@
+import random
+from datetime import datetime, timedelta
+
+from threat_store import ThreatStore
+
+
+def _store(events: int = 3000, seed: int = 1) -> ThreatStore:
+    rng = random.Random(seed)
+    store = ThreatStore(retention_hours=48)
+    now = datetime.utcnow()
+    for i in range(events):
+        rare = i % 500 == 0
+        store.add("port_scan" if rare else rng.choice(["failed_login", "suspicious_ip"]),
+                  "critical" if rare else rng.choice(["low", "medium", "high"]), {"i": i},
+                  timestamp=now - timedelta(seconds=rng.uniform(0, 40 * 3600)))
+    for event in list(store.by_id.values())[::3]:
+        store.resolve(event["id"])
+    return store
+
+
+def _brute(store, since, severity=None, event_type=None, resolved=None):
+    events = [e for e in store.by_id.values() if e["timestamp"] >= since
+              and (severity is None or e["severity"] == severity)
+              and (event_type is None or e["event_type"] == event_type)
+              and (resolved is None or e["resolved"] == resolved)]
+    return sorted(events, key=lambda e: e["timestamp"], reverse=True)
+
+
+def test_query_and_count_match_brute_force():
+    store = _store()
+    since = datetime.utcnow() - timedelta(hours=24)
+    for filters in ({}, {"severity": "critical"}, {"event_type": "port_scan", "resolved": False},
+                    {"severity": "high", "resolved": True}, {"event_type": "failed_login", "severity": "low"}):
+        expected = _brute(store, since, **filters)
+        assert store.query(since=since, limit=None, **filters) == expected
+        assert store.query(since=since, limit=5, **filters) == expected[:5]
+        assert store.count(since, **filters) == len(expected)
+
+
+def test_retention_applies_without_new_inserts():
+    store = ThreatStore(retention_hours=1)
+    now = datetime.utcnow()
+    store.add("failed_login", "high", {}, timestamp=now - timedelta(hours=2))
+    store.add("failed_login", "high", {}, timestamp=now - timedelta(minutes=5))
+    assert store.summary()["total"] == 1
+    assert store.unresolved_count == 1
+    assert len(store.query(limit=None)) == 1
+
+
+def test_replicated_event_is_inserted_once_in_time_order():
+    store = ThreatStore()
+    now = datetime.utcnow()
+    late = store.add("failed_login", "low", {}, timestamp=now)
+    early = {"id": "remote-1", "event_type": "port_scan", "severity": "high",
+             "timestamp": now - timedelta(minutes=1), "details": {}, "resolved": False}
+    store.insert(early)
+    store.insert(dict(early))
+    assert [e["id"] for e in store.query()] == [late["id"], "remote-1"]
@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+import pytest
+
+from wal import DEAD_LETTER_FILE, WALConsumer, WriteAheadLog, _HEADER, claim_directory
+
+
+def _reading(i: int, device: str = "pump-1") -> dict:
+    return {"device_id": device, "timestamp": f"2025-01-01T00:00:{i:02d}", "temperature": 70.0 + i}
+
+
+def _open(path, **kwargs) -> WriteAheadLog:
+    return WriteAheadLog(str(path), segment_size=4096, commit_interval=0.001, **kwargs).open()
+
+
+def test_reopen_recovers_records_and_offsets(tmp_path):
+    wal = _open(tmp_path)
+    wal.append_many([_reading(i) for i in range(10)], wait=True)
+    records, next_offset = wal.read(0, max_records=4)
+    wal.commit_offset("scoring", next_offset)
+    wal.close()
+
+    wal = _open(tmp_path)
+    assert wal.stats["recovered"] == 10
+    assert wal.committed("scoring") == next_offset
+    records, _ = wal.read(wal.committed("scoring"))
+    assert [r["temperature"] for r in records] == [74.0 + i for i in range(6)]
+    assert wal.append(_reading(3)) is None  # Duplicada de antes do restart
+    wal.close()
+
+
+def test_torn_tail_is_discarded_and_log_stays_appendable(tmp_path):
+    wal = _open(tmp_path)
+    wal.append_many([_reading(i) for i in range(3)], wait=True)
+    end = wal.write_offset
+    path = wal.segments[-1].path
+    wal.close()
+    # Escrita parcial: cabeçalho de um registro cujo payload não chegou ao disco
+    with open(path, "r+b") as f:
+        f.seek(end)
+        f.write(_HEADER.pack(200, 12345) + b'{"device_')
+
+    wal = _open(tmp_path)
+    assert wal.stats["truncated_tail"] == 1
+    assert wal.write_offset == end
+    wal.append(_reading(10), wait=True)
+    records, _ = wal.read(0)
+    assert [r["timestamp"][-2:] for r in records] == ["00", "01", "02", "10"]
+    wal.close()
+
+
+def test_dedup_survives_removal_of_consumed_segments(tmp_path):
+    wal = _open(tmp_path)
+    readings = [_reading(i % 60, device=f"dev-{i // 60}") for i in range(120)]
+    wal.append_many(readings, wait=True)
+    assert len(wal.segments) > 2
+    wal.commit_offset("scoring", wal.durable_offset)
+    wal.sync()
+    assert wal.stats["segments_removed"] > 0
+    wal.close()
+
+    wal = _open(tmp_path)
+    assert wal.append_many([dict(r) for r in readings[:5]]) == [None] * 5
+    wal.close()
+
+
+def test_directory_is_locked_per_worker(tmp_path):
+    first, fd = claim_directory(str(tmp_path), None)
+    second, fd2 = claim_directory(str(tmp_path), None)
+    assert first.name == "worker-0" and second.name == "worker-1"
+    with pytest.raises(RuntimeError):
+        WriteAheadLog(str(first)).open()
+
+
+def test_poison_record_is_dead_lettered(tmp_path):
+    wal = _open(tmp_path)
+    wal.append_many([_reading(i) for i in range(5)], wait=True)
+    handled = []
+
+    async def handler(records):
+        if any(r["temperature"] == 72.0 for r in records):
+            raise ValueError("timestamp inválido")
+        handled.extend(records)
+
+    async def scenario():
+        consumer = WALConsumer(wal, "scoring", handler, max_attempts=2, retry_backoff=0.001)
+        await consumer.start()
+        for _ in range(200):
+            await asyncio.sleep(0.005)
+            if wal.offsets["scoring"] == wal.durable_offset:
+                break
+        await consumer.stop()
+        return consumer
+
+    consumer = asyncio.run(scenario())
+    assert consumer.stats["dead_lettered"] == 1
+    assert len(handled) == 4
+    with open(tmp_path / DEAD_LETTER_FILE) as f:
+        entry = json.loads(f.readline())
+    assert entry["consumer"] == "scoring" and entry["record"]["temperature"] == 72.0
+    wal.close()
+
+
+class _Counter:
+    def __init__(self):
+        self.total = 0
+
+    def snapshot(self):
+        return {"total": self.total}
+
+    def restore(self, saved):
+        self.total = saved["total"]
+
+
+def test_state_is_checkpointed_with_offset(tmp_path):
+    async def consume(wal, state):
+        async def handler(records):
+            state.total += len(records)
+
+        consumer = WALConsumer(wal, "scoring", handler, batch_size=3, state=state, checkpoint_interval=0)
+        await consumer.start()
+        for _ in range(200):
+            await asyncio.sleep(0.005)
+            if consumer.offset == wal.durable_offset:
+                break
+        await consumer.stop()
+
+    wal = _open(tmp_path)
+    wal.append_many([_reading(i) for i in range(7)], wait=True)
+    first = _Counter()
+    asyncio.run(consume(wal, first))
+    wal.append_many([_reading(i) for i in range(7, 10)], wait=True)
+    wal.close()
+
+    wal = _open(tmp_path)
+    second = _Counter()
+    asyncio.run(consume(wal, second))
+    assert first.total == 7 and second.total == 10  # Estado restaurado + só as leituras novas
+    wal.close()
+
+
+def test_handler_outage_is_retried_not_dead_lettered(tmp_path):
+    wal = _open(tmp_path)
+    wal.append_many([_reading(i) for i in range(5)], wait=True)
+    outage = {"down": True}
+    handled = []
+
+    async def handler(records):
+        if outage["down"]:
+            raise ConnectionError("banco fora do ar")
+        handled.extend(records)
+
+    async def scenario():
+        consumer = WALConsumer(wal, "scoring", handler, max_attempts=2, retry_backoff=0.001, max_backoff=0.01)
+        await consumer.start()
+        await asyncio.sleep(0.1)
+        assert consumer.offset == 0  # Nada confirmado durante a queda
+        outage["down"] = False
+        for _ in range(200):
+            await asyncio.sleep(0.005)
+            if wal.offsets["scoring"] == wal.durable_offset:
+                break
+        await consumer.stop()
+        return consumer
+
+    consumer = asyncio.run(scenario())
+    assert consumer.stats["dead_lettered"] == 0
+    assert len(handled) == 5
+    assert not (tmp_path / DEAD_LETTER_FILE).exists()
+    wal.close()
@@ -0,0 +1,189 @@
+import bisect
+import os
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+THREAT_RETENTION_HOURS = float(os.getenv("NEXUS_THREAT_RETENTION_HOURS", "720"))
+THREAT_MAX_EVENTS = int(os.getenv("NEXUS_THREAT_MAX_EVENTS", "1000000"))
+
+
+def _epoch(ts: datetime) -> float:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class ThreatStore:
+    """Armazenamento indexado de eventos de segurança
+
+    Eventos ficam ordenados por tempo (consultas por intervalo com bisect),
+    com índices secundários por id, severidade, tipo e status de resolução
+    e contadores mantidos incrementalmente - o endpoint de status nunca
+    varre a lista. Eventos expirados pela retenção são removidos da cabeça
+    (nas inserções e antes de cada consulta) e a lista é compactada quando
+    metade dela já foi descartada.
+    """
+
+    def __init__(self, retention_hours: float = THREAT_RETENTION_HOURS, max_events: int = THREAT_MAX_EVENTS):
+        self.retention = timedelta(hours=retention_hours)
+        self.max_events = max_events
+        self._times: List[float] = []
+        self._events: List[Dict] = []
+        self._head = 0
+        self.by_id: Dict[str, Dict] = {}
+        self.by_severity: Dict[str, set] = defaultdict(set)
+        self.by_type: Dict[str, set] = defaultdict(set)
+        self.unresolved: set = set()
+        self.severity_counts = Counter()
+        self.type_counts = Counter()
+
+    def __len__(self) -> int:
+        return len(self._events) - self._head
+
+    @property
+    def unresolved_count(self) -> int:
+        self.compact()
+        return len(self.unresolved)
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def add(self, event_type: str, severity: str, details: Dict, timestamp: Optional[datetime] = None) -> Dict:
+        event = {
+            "id": self.new_id(),
+            "event_type": event_type,
+            "severity": severity,
+            "timestamp": timestamp or datetime.utcnow(),
+            "details": details,
+            "resolved": False,
+        }
+        self.insert(event)
+        return event
+
+    def insert(self, event: Dict):
+        """Inserir evento existente (ex.: replicado de outro worker)"""
+        if event["id"] in self.by_id:
+            return
+        t = _epoch(event["timestamp"])
+        if not self._times or t >= self._times[-1]:
+            self._times.append(t)
+            self._events.append(event)
+        else:
+            # Evento fora de ordem: inserção ordenada
+            idx = bisect.bisect_right(self._times, t, lo=self._head)
+            self._times.insert(idx, t)
+            self._events.insert(idx, event)
+        self._index(event)
+        if len(self) > self.max_events or (len(self._events) & 1023) == 0:
+            self.compact()
+
+    def _index(self, event: Dict):
+        self.by_id[event["id"]] = event
+        self.by_severity[event["severity"]].add(event["id"])
+        self.by_type[event["event_type"]].add(event["id"])
+        self.severity_counts[event["severity"]] += 1
+        self.type_counts[event["event_type"]] += 1
+        if not event["resolved"]:
+            self.unresolved.add(event["id"])
+
+    def _unindex(self, event: Dict):
+        event_id = event["id"]
+        self.by_id.pop(event_id, None)
+        self.by_severity[event["severity"]].discard(event_id)
+        self.by_type[event["event_type"]].discard(event_id)
+        self.severity_counts[event["severity"]] -= 1
+        self.type_counts[event["event_type"]] -= 1
+        self.unresolved.discard(event_id)
+
+    def resolve(self, event_id: str) -> bool:
+        event = self.by_id.get(event_id)
+        if event is None or event["resolved"]:
+            return False
+        event["resolved"] = True
+        self.unresolved.discard(event_id)
+        return True
+
+    def compact(self, now: Optional[datetime] = None):
+        """Aplicar retenção e limite de tamanho, descartando os eventos mais antigos"""
+        cutoff = _epoch((now or datetime.utcnow()) - self.retention)
+        expired_until = bisect.bisect_left(self._times, cutoff, lo=self._head)
+        overflow_until = len(self._events) - self.max_events
+        drop_until = max(expired_until, overflow_until, self._head)
+        for event in self._events[self._head:drop_until]:
+            self._unindex(event)
+        self._head = drop_until
+        if self._head and self._head * 2 >= len(self._events):
+            del self._times[:self._head]
+            del self._events[:self._head]
+            self._head = 0
+
+    def query(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        severity: Optional[str] = None,
+        event_type: Optional[str] = None,
+        resolved: Optional[bool] = None,
+        limit: Optional[int] = 100,
+    ) -> List[Dict]:
+        """Eventos no intervalo, do mais recente para o mais antigo (limit=None = todos)"""
+        self.compact()
+        lo = bisect.bisect_left(self._times, _epoch(since), lo=self._head) if since else self._head
+        hi = bisect.bisect_right(self._times, _epoch(until), lo=self._head) if until else len(self._times)
+        filters = []
+        if severity is not None:
+            filters.append(self.by_severity.get(severity, ()))
+        if event_type is not None:
+            filters.append(self.by_type.get(event_type, ()))
+        if resolved is False:
+            filters.append(self.unresolved)
+
+        smallest = min(filters, key=len) if filters else None
+        if smallest is not None and len(smallest) < hi - lo:
+            # Índice secundário seletivo: mais barato que varrer o intervalo
+            t_lo = self._times[lo] if lo < len(self._times) else float("inf")
+            t_hi = self._times[hi - 1] if hi > lo else float("-inf")
+            candidates = [
+                self.by_id[i] for i in smallest
+                if t_lo <= _epoch(self.by_id[i]["timestamp"]) <= t_hi
+                and all(i in ids for ids in filters)
+                and (resolved is not True or self.by_id[i]["resolved"])
+            ]
+            candidates.sort(key=lambda e: _epoch(e["timestamp"]), reverse=True)
+            return candidates[:limit]
+
+        result = []
+        for idx in range(hi - 1, lo - 1, -1):
+            if limit is not None and len(result) >= limit:
+                break
+            event = self._events[idx]
+            if resolved is True and not event["resolved"]:
+                continue
+            if all(event["id"] in ids for ids in filters):
+                result.append(event)
+        return result
+
+    def count_between(self, since: datetime, until: Optional[datetime] = None) -> int:
+        self.compact()
+        lo = bisect.bisect_left(self._times, _epoch(since), lo=self._head)
+        hi = bisect.bisect_right(self._times, _epoch(until), lo=self._head) if until else len(self._times)
+        return max(0, hi - lo)
+
+    def count(self, since: datetime, severity: Optional[str] = None, event_type: Optional[str] = None,
+              resolved: Optional[bool] = None) -> int:
+        """Total com os mesmos filtros de query (sem limite)"""
+        if severity is None and event_type is None and resolved is None:
+            return self.count_between(since)
+        return len(self.query(since=since, severity=severity, event_type=event_type, resolved=resolved, limit=None))
+
+    def summary(self) -> Dict:
+        self.compact()
+        return {
+            "total": len(self),
+            "unresolved": self.unresolved_count,
+            "by_severity": {k: v for k, v in self.severity_counts.items() if v},
+            "by_type": {k: v for k, v in self.type_counts.items() if v},
+        }
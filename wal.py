@@ -0,0 +1,545 @@
+import asyncio
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from azure_ingest import LRUSet
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: lock via msvcrt
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+WAL_DIR = os.getenv("NEXUS_WAL_DIR", "data/wal")
+WAL_SEGMENT_SIZE = int(os.getenv("NEXUS_WAL_SEGMENT_SIZE", str(64 * 1024 * 1024)))
+WAL_COMMIT_INTERVAL = float(os.getenv("NEXUS_WAL_COMMIT_INTERVAL", "0.005"))
+WAL_DEDUP_SIZE = int(os.getenv("NEXUS_WAL_DEDUP_SIZE", "200000"))
+WAL_WORKER_ID = os.getenv("NEXUS_WORKER_ID")
+WAL_MAX_ATTEMPTS = int(os.getenv("NEXUS_WAL_MAX_ATTEMPTS", "5"))
+WAL_CHECKPOINT_INTERVAL = float(os.getenv("NEXUS_WAL_CHECKPOINT_INTERVAL", "1"))
+
+_HEADER = struct.Struct("<II")  # tamanho do payload, crc32
+_PAGE = mmap.ALLOCATIONGRANULARITY
+OFFSETS_FILE = "offsets.json"
+DEDUP_FILE = "dedup.json"
+STATE_FILE = "state-{}.json"
+DEAD_LETTER_FILE = "dead_letter.jsonl"
+LOCK_FILE = ".lock"
+
+
+def reading_key(reading: Dict) -> str:
+    """Chave de deduplicação: message_id explícito ou (dispositivo, timestamp)"""
+    explicit = reading.get("message_id")
+    if explicit:
+        return str(explicit)
+    return f"{reading.get('device_id')}|{reading.get('timestamp')}"
+
+
+def _lock(path: Path) -> Optional[int]:
+    """Lock exclusivo não bloqueante; retorna o fd (mantido aberto) ou None se outro processo o detém"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def claim_directory(root: str = WAL_DIR, worker_id: Optional[str] = WAL_WORKER_ID) -> Tuple[Path, int]:
+    """Diretório do WAL deste worker: root/<worker_id>, ou o primeiro root/worker-N livre
+
+    Cada diretório fica sob lock de arquivo enquanto o processo vive, então
+    dois workers nunca escrevem no mesmo log. Sem NEXUS_WORKER_ID os
+    workers pegam os slots livres em ordem: um worker reiniciado reassume
+    o log e os offsets do slot que ficou livre em vez de abandoná-los.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    guard = _lock(root / LOCK_FILE)
+    while guard is None:
+        time.sleep(0.01)
+        guard = _lock(root / LOCK_FILE)
+    try:
+        names = [worker_id.replace(":", "_").replace("/", "_")] if worker_id else \
+            (f"worker-{i}" for i in itertools.count())
+        for name in names:
+            directory = root / name
+            directory.mkdir(exist_ok=True)
+            fd = _lock(directory / LOCK_FILE)
+            if fd is not None:
+                _adopt_legacy(root, directory)
+                return directory, fd
+        raise RuntimeError(f"WAL {root / worker_id} em uso por outro processo")
+    finally:
+        os.close(guard)
+
+
+def _adopt_legacy(root: Path, directory: Path):
+    """Mover para o slot um WAL antigo gravado direto na raiz (antes dos diretórios por worker)"""
+    legacy = list(root.glob("*.wal"))
+    if not legacy or any(directory.glob("*.wal")):
+        return
+    for path in legacy + [root / OFFSETS_FILE]:
+        if path.exists():
+            os.replace(path, directory / path.name)
+    logger.info(f"WAL legado em {root} movido para {directory}")
+
+
+class _Segment:
+    """Arquivo pré-alocado de tamanho fixo, mapeado em memória"""
+
+    def __init__(self, path: Path, base: int, size: int):
+        self.path = path
+        self.base = base
+        self.size = size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self.mm = mmap.mmap(self._fd, size)
+
+    def flush(self, start: int, end: int):
+        start -= start % _PAGE
+        if end > start:
+            self.mm.flush(start, end - start)
+
+    def close(self):
+        self.mm.close()
+        os.close(self._fd)
+
+
+class WriteAheadLog:
+    """Log de escrita antecipada para a ingestão: append-only, segmentado e mapeado em memória
+
+    Cada registro é [tamanho][crc32][json]. Os segmentos têm tamanho fixo
+    e são nomeados pelo offset base, então offset global = base + posição.
+    O append copia para o mmap (já sobrevive a um crash do processo) e o
+    commit em grupo faz um único msync por intervalo para todos os
+    registros pendentes (durável contra queda do sistema). Consumidores
+    leem até o último offset durável e gravam o offset processado; na
+    reinicialização, cada um retoma de onde parou (entrega at-least-once).
+    Leituras repetidas (replays de gateways) são descartadas no append; as
+    chaves de deduplicação dos segmentos apagados ficam em dedup.json.
+
+    Sem directory, cada worker usa o seu diretório em WAL_DIR (claim_directory).
+    """
+
+    def __init__(self, directory: Optional[str] = None, segment_size: int = WAL_SEGMENT_SIZE,
+                 commit_interval: float = WAL_COMMIT_INTERVAL, dedup_size: int = WAL_DEDUP_SIZE):
+        self.directory = Path(directory) if directory else None
+        self._lock_fd: Optional[int] = None
+        self.segment_size = segment_size
+        self.commit_interval = commit_interval
+        self.seen = LRUSet(dedup_size)
+        self.segments: List[_Segment] = []
+        self.write_offset = 0     # Fim do último registro escrito
+        self.durable_offset = 0   # Fim do último registro com msync
+        self.offsets: Dict[str, int] = {}
+        self._offsets_saved: Dict[str, int] = {}
+        self._states: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._commit = threading.Condition(self._lock)
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = True
+        self.stats = {"appended": 0, "duplicates": 0, "commits": 0, "bytes": 0,
+                      "recovered": 0, "truncated_tail": 0, "segments_removed": 0}
+
+    # ===== Abertura e recuperação =====
+    def open(self) -> "WriteAheadLog":
+        """Abrir segmentos existentes, validar a cauda e reconstruir offsets e deduplicação"""
+        if self.directory is None:
+            self.directory, self._lock_fd = claim_directory()
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._lock_fd = _lock(self.directory / LOCK_FILE)
+            if self._lock_fd is None:
+                raise RuntimeError(f"WAL {self.directory} em uso por outro processo")
+        offsets_path = self.directory / OFFSETS_FILE
+        if offsets_path.exists():
+            with open(offsets_path) as f:
+                self.offsets = {name: int(offset) for name, offset in json.load(f).items()}
+            self._offsets_saved = dict(self.offsets)
+        # Consumidores com estado: o offset válido é o salvo junto com o estado
+        for path in self.directory.glob(STATE_FILE.format("*")):
+            with open(path) as f:
+                saved = json.load(f)
+            name = path.stem[len("state-"):]
+            self.offsets[name] = int(saved["offset"])
+            self._states[name] = saved["state"]
+
+        bases = sorted(int(p.stem) for p in self.directory.glob("*.wal"))
+        for base in bases:
+            self.segments.append(_Segment(self._segment_path(base), base, self.segment_size))
+        if not self.segments:
+            self.segments.append(_Segment(self._segment_path(0), 0, self.segment_size))
+
+        # Reconstruir o conjunto de deduplicação (segmentos apagados + existentes) e achar o fim do log
+        dedup_path = self.directory / DEDUP_FILE
+        if dedup_path.exists():
+            with open(dedup_path) as f:
+                for key in json.load(f):
+                    self.seen.add(key)
+        offset = self.segments[0].base
+        for offset, record in self._scan(offset):
+            self.seen.add(reading_key(record))
+            self.stats["recovered"] += 1
+        self.write_offset = self.durable_offset = self._end_of_log()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._flusher.start()
+        logger.info(f"WAL aberto em {self.directory}: {self.stats['recovered']} registros, "
+                    f"offset {self.write_offset}")
+        return self
+
+    def _segment_path(self, base: int) -> Path:
+        return self.directory / f"{base:020d}.wal"
+
+    def _end_of_log(self) -> int:
+        """Posição após o último registro válido; uma cauda corrompida (escrita parcial) é zerada"""
+        segment = self.segments[-1]
+        position = 0
+        while position + _HEADER.size <= segment.size:
+            length, crc = _HEADER.unpack_from(segment.mm, position)
+            end = position + _HEADER.size + length
+            if length == 0 or end > segment.size or zlib.crc32(segment.mm[position + _HEADER.size:end]) != crc:
+                break
+            position = end
+        tail = segment.mm[position:position + _HEADER.size]
+        if tail.strip(b"\0"):
+            self.stats["truncated_tail"] += 1
+            logger.warning(f"WAL: cauda inválida descartada em {segment.base + position}")
+            segment.mm[position:segment.size] = bytes(segment.size - position)
+            segment.flush(position, segment.size)
+        return segment.base + position
+
+    # ===== Escrita =====
+    def append(self, reading: Dict, wait: bool = False) -> Optional[int]:
+        """Anexar uma leitura; retorna o offset ou None se for duplicada"""
+        offsets = self.append_many([reading], wait=wait)
+        return offsets[0]
+
+    def append_many(self, readings: List[Dict], wait: bool = False) -> List[Optional[int]]:
+        """Anexar um lote sob um único lock; wait=True bloqueia até o commit em grupo"""
+        encoded = []
+        for reading in readings:
+            reading.setdefault("timestamp", datetime.utcnow().isoformat())
+            payload = json.dumps(reading, default=str).encode()
+            if _HEADER.size + len(payload) > self.segment_size:
+                raise ValueError("Registro maior que o segmento do WAL")
+            encoded.append((reading_key(reading), payload))
+
+        result: List[Optional[int]] = []
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WAL fechado")
+            for key, payload in encoded:
+                if key in self.seen:
+                    self.stats["duplicates"] += 1
+                    result.append(None)
+                    continue
+                self.seen.add(key)
+                result.append(self._write(payload))
+            self.stats["appended"] += sum(1 for offset in result if offset is not None)
+            if wait and self.write_offset > self.durable_offset:
+                target = self.write_offset
+                self._commit.notify_all()
+                while self.durable_offset < target and not self._closed:
+                    self._commit.wait()
+        return result
+
+    def _write(self, payload: bytes) -> int:
+        segment = self.segments[-1]
+        position = self.write_offset - segment.base
+        size = _HEADER.size + len(payload)
+        if position + size > segment.size:
+            segment = self._roll()
+            position = 0
+        offset = segment.base + position
+        segment.mm[position + _HEADER.size:position + size] = payload
+        _HEADER.pack_into(segment.mm, position, len(payload), zlib.crc32(payload))
+        self.write_offset = offset + size
+        self.stats["bytes"] += size
+        return offset
+
+    def _roll(self) -> _Segment:
+        """Fechar o segmento atual (msync do restante) e iniciar o próximo"""
+        current = self.segments[-1]
+        current.flush(self.durable_offset - current.base, self.write_offset - current.base)
+        segment = _Segment(self._segment_path(current.base + self.segment_size),
+                           current.base + self.segment_size, self.segment_size)
+        self.segments.append(segment)
+        self.write_offset = self.durable_offset = segment.base
+        return segment
+
+    # ===== Commit em grupo =====
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                self._commit.wait(self.commit_interval)
+                if self._closed:
+                    return
+            self.sync()
+
+    def sync(self):
+        """msync de todos os registros pendentes e persistência dos offsets dos consumidores"""
+        with self._lock:
+            segment = self.segments[-1]
+            start, end = self.durable_offset, self.write_offset
+            offsets = dict(self.offsets) if self.offsets != self._offsets_saved else None
+        if end > start:
+            # msync fora do lock: os appends continuam durante o commit
+            segment.flush(start - segment.base, end - segment.base)
+            with self._lock:
+                self.durable_offset = max(self.durable_offset, end)
+                self.stats["commits"] += 1
+                self._commit.notify_all()
+        if offsets is not None:
+            self._save_offsets(offsets)
+            self._remove_consumed(min(offsets.values()))
+
+    def _save_json(self, name: str, data):
+        """Gravação atômica (arquivo temporário, fsync e rename)"""
+        path = self.directory / name
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _save_offsets(self, offsets: Dict[str, int]):
+        self._save_json(OFFSETS_FILE, offsets)
+        self._offsets_saved = offsets
+
+    def _remove_consumed(self, offset: int):
+        """Apagar segmentos que todos os consumidores já processaram
+
+        Antes, as chaves de deduplicação vão para dedup.json: um replay de
+        leituras já consumidas continua sendo descartado após reiniciar.
+        """
+        with self._lock:
+            removable = [s for s in self.segments[:-1] if s.base + s.size <= offset]
+            if not removable:
+                return
+            self.segments = self.segments[len(removable):]
+            keys = list(self.seen)
+        self._save_json(DEDUP_FILE, keys)
+        for segment in removable:
+            segment.close()
+            segment.path.unlink(missing_ok=True)
+            self.stats["segments_removed"] += 1
+
+    def close(self):
+        if self._closed:
+            return
+        self.sync()
+        with self._lock:
+            self._closed = True
+            self._commit.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # ===== Leitura =====
+    def _scan(self, offset: int, limit: Optional[int] = None, end: Optional[int] = None):
+        """Iterar (próximo offset, registro) a partir de offset até end"""
+        segments = list(self.segments)
+        count = 0
+        for segment in segments:
+            if segment.base + segment.size <= offset:
+                continue
+            position = max(offset - segment.base, 0)
+            while position + _HEADER.size <= segment.size:
+                if end is not None and segment.base + position >= end:
+                    return
+                length, crc = _HEADER.unpack_from(segment.mm, position)
+                stop = position + _HEADER.size + length
+                if length == 0 or stop > segment.size:
+                    break
+                payload = segment.mm[position + _HEADER.size:stop]
+                if end is None and zlib.crc32(payload) != crc:
+                    return  # Cauda parcial (só verificada na recuperação)
+                position = stop
+                yield segment.base + position, json.loads(payload)
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def read(self, offset: int, max_records: int = 1000) -> Tuple[List[Dict], int]:
+        """Ler registros duráveis a partir de offset; retorna (registros, próximo offset)"""
+        records = []
+        next_offset = offset
+        for next_offset, record in self._scan(offset, max_records, self.durable_offset):
+            records.append(record)
+        return records, next_offset
+
+    def committed(self, consumer: str) -> int:
+        return self.offsets.get(consumer, self.segments[0].base if self.segments else 0)
+
+    def commit_offset(self, consumer: str, offset: int, state: Optional[Dict] = None):
+        """Registrar o offset processado (persistido no próximo commit em grupo)
+
+        Com state, o estado do consumidor é gravado na hora junto com o
+        offset, num único arquivo: após um crash, os dois voltam juntos.
+        """
+        if state is not None:
+            self._save_json(STATE_FILE.format(consumer), {"offset": offset, "state": state})
+        with self._lock:
+            self.offsets[consumer] = offset
+
+    def load_state(self, consumer: str) -> Optional[Dict]:
+        """Estado salvo com o último offset confirmado do consumidor (lido na abertura)"""
+        return self._states.pop(consumer, None)
+
+    def lag(self) -> Dict[str, int]:
+        return {name: self.durable_offset - offset for name, offset in self.offsets.items()}
+
+    def dead_letter(self, consumer: str, record: Dict, error: Exception):
+        """Registrar (com fsync) um registro que o consumidor não conseguiu processar"""
+        entry = {"consumer": consumer, "error": repr(error), "at": datetime.utcnow().isoformat(), "record": record}
+        with open(self.directory / DEAD_LETTER_FILE, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class WALConsumer:
+    """Consumidor do WAL com offset próprio: processa lotes e confirma após o handler
+
+    Um lote que falha é reentregue com backoff exponencial. Depois de
+    max_attempts falhas seguidas, os registros são reprocessados um a um e,
+    se alguns passam, os que ainda falham vão para dead_letter.jsonl no
+    diretório do WAL: um registro envenenado não trava o consumidor (nem a
+    remoção de segmentos) e continua disponível para reprocessamento manual.
+    Se todos falham a falha não é dos registros (ex.: banco fora do ar):
+    nada é desviado nem confirmado, e o lote é retentado a cada max_backoff.
+    Um registro envenenado sozinho no fim do log só é isolado quando chegam
+    registros novos no mesmo lote.
+
+    Com state (objeto com snapshot()/restore()), o offset só é confirmado
+    a cada checkpoint_interval, junto com o snapshot do estado do handler;
+    na reinicialização o estado é restaurado e o consumidor retoma do
+    offset correspondente.
+    """
+
+    def __init__(self, wal: WriteAheadLog, name: str, handler: Callable[[List[Dict]], Awaitable[None]],
+                 batch_size: int = 1000, poll_interval: float = 0.01, max_attempts: int = WAL_MAX_ATTEMPTS,
+                 retry_backoff: float = 1.0, max_backoff: float = 30.0, state=None,
+                 checkpoint_interval: float = WAL_CHECKPOINT_INTERVAL):
+        self.wal = wal
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.state = state
+        self.checkpoint_interval = checkpoint_interval
+        self.offset: Optional[int] = None
+        self._committed: Optional[int] = None
+        self._checkpointed_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"processed": 0, "batches": 0, "failed_batches": 0, "dead_lettered": 0}
+
+    async def start(self):
+        if self._task is None:
+            if self.state is not None:
+                saved = self.wal.load_state(self.name)
+                if saved is not None:
+                    self.state.restore(saved)
+            self.offset = self._committed = self.wal.committed(self.name)
+            self.wal.offsets.setdefault(self.name, self.offset)
+            self._checkpointed_at = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def checkpoint(self):
+        """Confirmar o offset processado (com o snapshot do estado, se houver)"""
+        if self.offset is None or self.offset == self._committed:
+            return
+        offset = self.offset
+        if self.state is None:
+            self.wal.commit_offset(self.name, offset)
+        else:
+            await asyncio.to_thread(self.wal.commit_offset, self.name, offset, self.state.snapshot())
+        self._committed = offset
+        self._checkpointed_at = time.monotonic()
+
+    async def _maybe_checkpoint(self):
+        if self.state is None or time.monotonic() - self._checkpointed_at >= self.checkpoint_interval:
+            await self.checkpoint()
+
+    async def _run(self):
+        attempts = 0
+        while True:
+            records, next_offset = self.wal.read(self.offset, self.batch_size)
+            if not records:
+                await self._maybe_checkpoint()
+                await asyncio.sleep(self.poll_interval)
+                continue
+            try:
+                await self.handler(records)
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                attempts += 1
+                logger.error(f"Erro no consumidor {self.name} do WAL (tentativa {attempts}): {e}")
+                if attempts < self.max_attempts:
+                    # Sem confirmar: o lote é reentregue na próxima tentativa
+                    await asyncio.sleep(min(self.retry_backoff * 2 ** (attempts - 1), self.max_backoff))
+                    continue
+                if not await self._isolate(records):
+                    await asyncio.sleep(self.max_backoff)
+                    continue
+            attempts = 0
+            self.offset = next_offset
+            await self._maybe_checkpoint()
+            self.stats["batches"] += 1
+            self.stats["processed"] += len(records)
+
+    async def _isolate(self, records: List[Dict]) -> bool:
+        """Reprocessar registro a registro, desviando para o dead-letter os que falham
+
+        Retorna False, sem desviar nada, se todos falham: a falha não é
+        específica de um registro e o lote deve ser retentado.
+        """
+        failed = []
+        for record in records:
+            try:
+                await self.handler([record])
+            except Exception as e:
+                failed.append((record, e))
+        if len(failed) == len(records):
+            logger.error(f"WAL: todos os registros do lote falharam no consumidor {self.name}; "
+                         f"retentando em {self.max_backoff}s sem confirmar")
+            return False
+        for record, e in failed:
+            self.wal.dead_letter(self.name, record, e)
+            self.stats["dead_lettered"] += 1
+            logger.error(f"WAL: registro desviado para {DEAD_LETTER_FILE} pelo consumidor {self.name}: {e}")
+        return True